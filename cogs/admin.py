@@ -0,0 +1,40 @@
+# cogs/admin.py
+
+import asyncio
+from discord.ext import commands
+from utils.metrics import Metrics
+
+class Admin(commands.Cog):
+	def __init__(self, bot: commands.Bot):
+		self.bot = bot
+
+	@commands.command(name="reindex")
+	@commands.is_owner()
+	async def reindex(self, ctx: commands.Context):
+		"""Re-embed RAG documents whose text or embedding model changed."""
+		await ctx.send("Reindexing RAG documents...")
+		stats = await asyncio.to_thread(self.bot.core.rag.reindex_documents)
+		await ctx.send(f"Reindex complete: scanned {stats['scanned']}, re-embedded {stats['reembedded']}.")
+
+	@commands.command(name="metrics")
+	@commands.is_owner()
+	async def metrics(self, ctx: commands.Context):
+		"""Dump call counts, latency percentiles and token usage per backend and model."""
+		rows = Metrics().summary()
+		if not rows:
+			await ctx.send("No metrics recorded yet.")
+			return
+		lines = [f"{'backend/model':<32} {'calls':>6} {'err':>4} {'p50ms':>8} {'p99ms':>8} {'tok_in':>8} {'tok_out':>8}"]
+		for row in rows:
+			name = f"{row['backend']}/{row['model']}" if row['model'] else row['backend']
+			lines.append(
+				f"{name[:32]:<32} {row['calls']:>6} {row['errors']:>4} {row['p50_ms']:>8.1f} {row['p99_ms']:>8.1f} "
+				f"{row['tokens_in']:>8} {row['tokens_out']:>8}"
+			)
+		# Stay under Discord's 2000 character message limit
+		text = "\n".join(lines)[:1990]
+		await ctx.send(f"```\n{text}\n```")
+
+async def setup(bot: commands.Bot):
+	cog = Admin(bot)
+	await bot.add_cog(cog)
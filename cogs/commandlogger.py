@@ -8,16 +8,25 @@ class CommandLogger(commands.Cog):
         self.bot = bot
         self.logger = Logger()
 
+    @staticmethod
+    def _fields(ctx) -> dict:
+        """Structured guild, channel and cog fields for JSON log output."""
+        return {
+            "guild": getattr(ctx.guild, 'id', None),
+            "channel": getattr(ctx.channel, 'id', None),
+            "cog": getattr(ctx.cog, 'qualified_name', None)
+        }
+
     @commands.Cog.listener()
     async def on_command_error(self, ctx, error):
         if isinstance(error, commands.CommandNotFound):
-            self.logger.info(f'Command not found: {ctx.message.content}')
+            self.logger.info('Command not found: %s', ctx.message.content, **self._fields(ctx))
         elif isinstance(error, commands.MissingRequiredArgument):
             await ctx.send('Missing required argument.')
-            self.logger.info(f'Missing required argument in command: {ctx.message.content}')
+            self.logger.info('Missing required argument in command: %s', ctx.message.content, **self._fields(ctx))
         else:
             await ctx.send(f'{str(error)}')
-            self.logger.error(f'An error occurred: {str(error)}')
+            self.logger.error('An error occurred: %s', error, **self._fields(ctx))
             raise error
 
     @commands.Cog.listener()
@@ -27,7 +36,7 @@ class CommandLogger(commands.Cog):
         command_content = ctx.message.content.encode('unicode_escape').decode('utf-8')
         channel_id = ctx.channel.id
         user_info = f"{ctx.author.name} (ID: {ctx.author.id})" if ctx.guild else f"{ctx.author.name} (ID: {ctx.author.id})"
-        self.logger.info(f"Command '{command_content}' entered by {user_info} in {server_name} ({channel_name}) [channel id: {channel_id}]")
+        self.logger.info("Command '%s' entered by %s in %s (%s) [channel id: %s]", command_content, user_info, server_name, channel_name, channel_id, **self._fields(ctx))
 
 async def setup(bot):
     await bot.add_cog(CommandLogger(bot))
\ No newline at end of file
@@ -5,16 +5,21 @@ Core module for initializing and running the Discord bot and its utilities.
 import discord
 from discord.ext import commands
 import asyncio
+import time
 import weakref
 from utils.logger import Logger
 from utils.config import Config
 from utils.common import Common
 from utils.database import Database
+from utils.conversation import ConversationStore
+from utils.http_pool import HttpPool
+from utils.metrics import MetricsServer
 from utils.cog import CogLoader
 from utils.personality import PersonalityManager
 from utils.ai import AI
 from utils.giphy import Giphy
 from utils.rag import Rag
+from utils.scheduler import set_request
 
 class Core:
 
@@ -24,6 +29,8 @@ class Core:
 		self.config_path = config_path
 		self.logger = Logger()
 		self.db = None
+		self.conversations = None
+		self.http = None
 		self.common = None
 		self.cog_loader = None
 		self.personalities = None
@@ -31,17 +38,47 @@ class Core:
 		self.ai = None
 		self.giphy = None
 		self.rag = None
+		self.rag_init_task = None
+		self.metrics_server = None
+		self.timings = {}
+
+	def _timed(self, phase: str, func):
+		started = time.perf_counter()
+		result = func()
+		self.timings[phase] = time.perf_counter() - started
+		return result
+
+	def log_timings(self, title: str):
+		breakdown = ", ".join(f"{phase}={elapsed:.2f}s" for phase, elapsed in self.timings.items())
+		self.logger.info(f"{title}: {breakdown}")
 
 	def load_utils(self) -> bool:
 		try:
-			self.config = Config(self.config_path)
-			self.db = Database(self.config)
+			self.config = self._timed("config", lambda: Config(self.config_path))
+			self.logger.configure(
+				level=self.config.get_variable("LOG_LEVEL"),
+				output=self.config.get_variable("LOG_OUTPUT"),
+				queue_size=self.config.get_variable("LOG_QUEUE_SIZE"),
+				queue_policy=self.config.get_variable("LOG_QUEUE_POLICY"),
+				batch_size=self.config.get_variable("LOG_BATCH_SIZE"),
+				file_mode=self.config.get_variable("LOG_FILE_MODE"),
+				max_bytes=self.config.get_variable("LOG_MAX_BYTES"),
+				rotate_daily=self.config.get_variable("LOG_ROTATE_DAILY"),
+				backup_count=self.config.get_variable("LOG_BACKUP_COUNT"),
+				compress=self.config.get_variable("LOG_COMPRESS")
+			)
+			self.db = self._timed("database", lambda: Database(self.config))
+			self.conversations = ConversationStore(self.db)
+			self.http = self._timed("http", HttpPool)
+			self.http.open()
 			self.common = Common()
-			self.personalities = PersonalityManager(self.personalities_path)  # load personalities
-			self.giphy = Giphy()
-			self.ai = AI()
-			self.rag = Rag()
-			self.cog_loader = CogLoader()
+			self.personalities = self._timed("personalities", lambda: PersonalityManager(self.personalities_path))  # load personalities
+			self.giphy = self._timed("giphy", Giphy)
+			self.ai = self._timed("ai", AI)
+			self.ai.response_cache.attach_database(self.db)
+			# Model and vector store load in the background once the bot is starting
+			self.rag = self._timed("rag", Rag)
+			self.cog_loader = self._timed("cogs_config", CogLoader)
 			return True
 		except Exception as e:
 			self.logger.error(f"Utility initialization failed: {e}")
@@ -56,6 +93,7 @@ class Core:
 			)
 			self.bot.remove_command("help")
 			self.bot.core = weakref.proxy(self)
+			self.bot.before_invoke(self.attribute_request)
 
 			return True
 		
@@ -63,6 +101,11 @@ class Core:
 			self.logger.error(f"Bot setup failed: {e}")
 			return False
 
+	async def attribute_request(self, ctx: commands.Context):
+		"""Attribute AI calls made by a command to its guild and author; slash and admin commands get priority."""
+		priority = ctx.interaction is not None or ctx.cog is not None and ctx.cog.qualified_name == "Admin"
+		set_request(getattr(ctx.guild, "id", None), ctx.author.id, priority)
+
 	async def load_cogs(self):
 		cog_names = await self.cog_loader.get_enabled_cogs()
 		await asyncio.gather(
@@ -81,7 +124,7 @@ class Core:
 
 		try:
 			self.logger.info("Setting up bot...")
-			if not self.setup_bot():
+			if not self._timed("setup_bot", self.setup_bot):
 				self.logger.error("Exiting due to bot setup failure.")
 				return False
 		except Exception as e:
@@ -90,7 +133,10 @@ class Core:
 
 		try:
 			self.logger.info("Loading cogs...")
+			started = time.perf_counter()
 			await self.load_cogs()
+			self.timings["load_cogs"] = time.perf_counter() - started
+			self.log_timings("Startup timing")
 		except Exception as e:
 			self.logger.error(f"Exception during cog loading: {e}")
 			return False
@@ -103,6 +149,9 @@ class Core:
 				if self.bot is not None:
 					await self.bot.close()
 				return False
+			self.rag_init_task = asyncio.create_task(self.rag.initialize_async())
+			await self.conversations.start()
+			self.start_metrics_server()
 			await self.bot.start(token)
 		except Exception as e:
 			self.logger.error(f"Failed to start bot: {e}")
@@ -111,4 +160,54 @@ class Core:
 					await self.bot.close()
 			except Exception as close_err:
 				self.logger.error(f"Failed to close bot gracefully: {close_err}")
-			return False
\ No newline at end of file
+			return False
+		finally:
+			await self.shutdown()
+
+	def start_metrics_server(self):
+		"""Serve Prometheus metrics in the background if enabled in config."""
+		if not self.config.get_variable("METRICS_ENABLED", False):
+			return
+		try:
+			self.metrics_server = MetricsServer(
+				host=self.config.get_variable("METRICS_HOST", "127.0.0.1"),
+				port=self.config.get_variable("METRICS_PORT", 9100)
+			)
+			self.metrics_server.start()
+		except Exception as e:
+			self.metrics_server = None
+			self.logger.error(f"Failed to start metrics endpoint: {e}")
+
+	async def shutdown(self):
+		"""Release resources held by the utilities."""
+		try:
+			if self.metrics_server is not None:
+				await self.metrics_server.stop()
+		except Exception as e:
+			self.logger.error(f"Failed to stop metrics endpoint: {e}")
+		try:
+			if self.ai is not None:
+				await self.ai.response_cache.close()
+				await self.ai.close()
+		except Exception as e:
+			self.logger.error(f"Failed to close AI clients: {e}")
+		try:
+			if self.http is not None:
+				await self.http.close()
+		except Exception as e:
+			self.logger.error(f"Failed to close HTTP pool: {e}")
+		try:
+			if self.rag is not None:
+				self.rag.close()
+		except Exception as e:
+			self.logger.error(f"Failed to stop RAG workers: {e}")
+		try:
+			if self.conversations is not None:
+				await self.conversations.close()
+		except Exception as e:
+			self.logger.error(f"Failed to flush conversation store: {e}")
+		try:
+			if self.db is not None:
+				self.db.close()
+		except Exception as e:
+			self.logger.error(f"Failed to close database pool: {e}")
\ No newline at end of file
@@ -13,3 +13,25 @@ INSERT INTO test_entities (name, description) VALUES
     ('Entity Alpha', 'Description for test entity Alpha.'),
     ('Entity Beta', 'Description for test entity Beta.'),
     ('Entity Gamma', 'Description for test entity Gamma.');
+
+-- Conversation history, append-only. seq numbers turns within a channel; the
+-- (channel_id, seq) key doubles as the index for reading the last N turns.
+CREATE TABLE IF NOT EXISTS conversation_turns (
+    channel_id BIGINT NOT NULL,
+    seq BIGINT NOT NULL,
+    role VARCHAR(16) NOT NULL,
+    content TEXT NOT NULL,
+    author_id BIGINT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (channel_id, seq)
+);
+
+-- Cached AI completions, keyed by a hash of (model, messages, params)
+CREATE TABLE IF NOT EXISTS response_cache (
+    key CHAR(64) PRIMARY KEY,
+    model VARCHAR(100) NOT NULL,
+    response TEXT NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    expires_at TIMESTAMP NOT NULL
+);
+CREATE INDEX IF NOT EXISTS response_cache_expires_at ON response_cache (expires_at);
@@ -0,0 +1,369 @@
+import asyncio
+import unittest
+from unittest.mock import patch, MagicMock, AsyncMock, call
+from utils.ai import AI
+from utils.context import ContextWindow
+from utils.response_cache import ResponseCache
+from utils.router import BackendRouter
+from utils.scheduler import request_context
+
+class TestAI(unittest.IsolatedAsyncioTestCase):
+	def setUp(self):
+		self.patcher_openai = patch("utils.ai.OpenAI")
+		self.patcher_async_openai = patch("utils.ai.AsyncOpenAI")
+		self.patcher_rag = patch("utils.ai.Rag")
+		self.patcher_config = patch("utils.ai.Config")
+		self.patcher_http = patch("utils.ai.HttpPool")
+		self.patcher_tokens = patch("utils.ai.TokenCounter")
+		self.patcher_context = patch("utils.ai.ContextWindow")
+		self.patcher_response_cache = patch("utils.ai.ResponseCache")
+		self.patcher_router = patch("utils.ai.BackendRouter")
+		self.patcher_scheduler_config = patch("utils.scheduler.Config")
+		self.patcher_openai.start()
+		self.mock_async_openai_cls = self.patcher_async_openai.start()
+		self.patcher_rag.start()
+		self.mock_config_cls = self.patcher_config.start()
+		self.patcher_http.start()
+		self.patcher_tokens.start()
+		self.patcher_context.start()
+		self.patcher_response_cache.start()
+		self.mock_router_cls = self.patcher_router.start()
+		self.patcher_scheduler_config.start().return_value.get_variable.side_effect = lambda key, default=None: default
+		self.addCleanup(self.patcher_openai.stop)
+		self.addCleanup(self.patcher_async_openai.stop)
+		self.addCleanup(self.patcher_rag.stop)
+		self.addCleanup(self.patcher_config.stop)
+		self.addCleanup(self.patcher_http.stop)
+		self.addCleanup(self.patcher_tokens.stop)
+		self.addCleanup(self.patcher_context.stop)
+		self.addCleanup(self.patcher_response_cache.stop)
+		self.addCleanup(self.patcher_router.stop)
+		self.addCleanup(self.patcher_scheduler_config.stop)
+
+		self.mock_config_cls.return_value.get_variable.side_effect = lambda key, default=None: default
+
+		self.mock_async_client = MagicMock()
+		self.mock_async_openai_cls.return_value = self.mock_async_client
+
+		# Reset singleton between tests
+		AI._instance = None
+		self.ai = AI()
+
+	def _completion(self, content):
+		completion = MagicMock()
+		completion.choices[0].message.content = content
+		return completion
+
+	async def test_openai_chat_completion_async_success(self):
+		self.mock_async_client.chat.completions.create = AsyncMock(return_value=self._completion("  hello  "))
+
+		result = await self.ai.openai_chat_completion_async("gpt-4.1-mini", "system", "user")
+
+		self.assertEqual(result, "hello")
+		_, kwargs = self.mock_async_client.chat.completions.create.call_args
+		self.assertEqual(kwargs["model"], "gpt-4.1-mini")
+		self.assertEqual(kwargs["messages"][1], {"role": "user", "content": "user"})
+
+	async def test_openai_chat_completion_async_error(self):
+		self.mock_async_client.chat.completions.create = AsyncMock(side_effect=Exception("boom"))
+
+		result = await self.ai.openai_chat_completion_async("gpt-4.1-mini", "system", "user")
+
+		self.assertEqual(result, "Error: boom")
+
+	async def test_close_closes_both_clients(self):
+		self.ai.async_client, self.ai.routed_client = MagicMock(close=AsyncMock()), MagicMock(close=AsyncMock())
+
+		await self.ai.close()
+
+		self.ai.async_client.close.assert_awaited_once()
+		self.ai.routed_client.close.assert_awaited_once()
+
+	async def test_openai_concurrency_is_bounded(self):
+		self.ai._openai_semaphore = asyncio.Semaphore(2)
+		in_flight = 0
+		peak = 0
+
+		async def create(**kwargs):
+			nonlocal in_flight, peak
+			in_flight += 1
+			peak = max(peak, in_flight)
+			await asyncio.sleep(0.01)
+			in_flight -= 1
+			return self._completion("ok")
+
+		self.mock_async_client.chat.completions.create = create
+
+		# Distinct prompts; identical ones would be coalesced into one call
+		results = await asyncio.gather(*(
+			self.ai.openai_chat_completion_with_context_async("gpt-4.1-mini", [{"role": "user", "content": f"hi {i}"}])
+			for i in range(6)
+		))
+
+		self.assertEqual(results, ["ok"] * 6)
+		self.assertEqual(peak, 2)
+
+	async def test_ollama_chat_completion_with_context_async_success(self):
+		mock_resp = MagicMock()
+		mock_resp.raise_for_status = MagicMock()
+		mock_resp.json = AsyncMock(return_value={"message": {"content": " local reply "}})
+		mock_post = MagicMock()
+		mock_post.__aenter__ = AsyncMock(return_value=mock_resp)
+		mock_post.__aexit__ = AsyncMock(return_value=False)
+		mock_session = MagicMock()
+		mock_session.post.return_value = mock_post
+		self.ai.http = MagicMock()
+		self.ai.http.get_session.return_value = mock_session
+
+		context = [{"role": "user", "content": "hi"}]
+		result = await self.ai.ollama_chat_completion_with_context_async("llama3", context)
+
+		self.assertEqual(result, "local reply")
+		_, kwargs = mock_session.post.call_args
+		self.assertEqual(kwargs["json"]["messages"], context)
+		self.assertFalse(kwargs["json"]["stream"])
+
+	async def test_ollama_chat_completion_stream_yields_deltas(self):
+		async def lines():
+			for line in [b'{"message": {"content": "Hel"}, "done": false}\n', b'\n', b'{"message": {"content": "lo"}, "done": true}\n']:
+				yield line
+
+		mock_resp = MagicMock()
+		mock_resp.raise_for_status = MagicMock()
+		mock_resp.content = lines()
+		mock_post = MagicMock()
+		mock_post.__aenter__ = AsyncMock(return_value=mock_resp)
+		mock_post.__aexit__ = AsyncMock(return_value=False)
+		mock_session = MagicMock()
+		mock_session.post.return_value = mock_post
+		self.ai.http = MagicMock()
+		self.ai.http.get_session.return_value = mock_session
+
+		deltas = [delta async for delta in self.ai.ollama_chat_completion_stream("llama3", [{"role": "user", "content": "hi"}])]
+
+		self.assertEqual(deltas, ["Hel", "lo"])
+		_, kwargs = mock_session.post.call_args
+		self.assertTrue(kwargs["json"]["stream"])
+
+	def test_count_tokens_delegates_to_token_counter(self):
+		self.ai.tokens.count.return_value = 5
+		self.ai.tokens.count_messages.return_value = 12
+		context = [{"role": "user", "content": "hi"}]
+
+		self.assertEqual(self.ai.count_tokens("gpt-4o", "hello"), 5)
+		self.assertEqual(self.ai.count_tokens("gpt-4o", context), 12)
+		self.ai.tokens.count_messages.assert_called_once_with("gpt-4o", context)
+
+	def test_tokens_to_usd_passes_explicit_prices(self):
+		self.ai.tokens.estimate_cost.return_value = 0.25
+
+		self.assertEqual(self.ai.tokens_to_usd("gpt-4o", "prompt", "result", 1.0, 2.0), 0.25)
+		self.ai.tokens.estimate_cost.assert_called_once_with("gpt-4o", "prompt", "result", 1.0, 2.0)
+
+	def _budgeted_window(self):
+		# Real ContextWindow over whitespace token counts: 100-token limit, 20 reserved for the reply
+		tokens = MagicMock()
+		tokens.count.side_effect = lambda model, text: len(text.split()) if text else 0
+		tokens.count_message.side_effect = lambda model, message: 3 + len(message["content"].split())
+		tokens.truncate.side_effect = lambda model, text, n: " ".join(text.split()[:n])
+		settings = {"CONTEXT_TOKEN_LIMITS": {"small": 100}, "CONTEXT_REPLY_RESERVE": 20, "CONTEXT_RAG_MAX_TOKENS": 10, "CONTEXT_SUMMARY_MAX_TOKENS": 5, "CONTEXT_TRIM_TARGET": 0.5}
+		with patch("utils.context.Config") as mock_config_cls:
+			mock_config_cls.return_value.get_variable.side_effect = lambda key, default=None: settings.get(key, default)
+			self.ai.context_window = ContextWindow(tokens)
+		personality = MagicMock()
+		personality.get_system_prompt.return_value = "be brief"
+		return personality
+
+	def test_build_context_with_model_trims_history(self):
+		personality = self._budgeted_window()
+		history = [{"role": "user", "content": f"message {i} " + "w " * 8} for i in range(8)]
+
+		context = self.ai.build_context(personality, "rag one\n\n" + "x " * 20, history, model="small")
+
+		self.assertEqual(context[0], {"role": "system", "content": "be brief\n\nrag one"})
+		self.assertEqual(context[1:], history[-2:])
+		self.assertEqual(len(history), 8)
+
+	async def test_build_context_async_summarizes_dropped_turns(self):
+		personality = self._budgeted_window()
+		self.ai.openai_summarize_conversation_async = AsyncMock(return_value="they said hello")
+		history = [{"role": "user", "content": f"message {i} " + "w " * 8} for i in range(8)]
+
+		context = await self.ai.build_context_async(personality, "small", previous_context=history, summary_model="gpt-4o-mini")
+		again = await self.ai.build_context_async(personality, "small", previous_context=history, summary_model="gpt-4o-mini")
+
+		self.assertEqual(context[1], {"role": "system", "content": "Summary of the earlier conversation:\nthey said hello"})
+		self.assertEqual(context[2:], history[-2:])
+		self.assertEqual(again, context)
+		self.ai.openai_summarize_conversation_async.assert_awaited_once_with("gpt-4o-mini", history[:6])
+
+	async def test_build_context_async_summarizes_only_when_the_cut_moves(self):
+		personality = self._budgeted_window()
+		self.ai.openai_summarize_conversation_async = AsyncMock(return_value="they said hello")
+		history, cuts = [], set()
+
+		for i in range(40):
+			history.append({"role": "user", "content": f"message {i} " + "w " * 8})
+			context = await self.ai.build_context_async(personality, "small", previous_context=history, summary_model="gpt-4o-mini")
+			kept = [message for message in context if message["role"] == "user"]
+			if len(kept) < len(history):
+				cuts.add(len(history) - len(kept))
+
+		# One summary per cut, not one per message after the first overflow
+		self.assertEqual(self.ai.openai_summarize_conversation_async.await_count, len(cuts))
+		self.assertLess(len(cuts), 15)
+
+	async def test_build_context_async_drops_turns_when_summary_fails(self):
+		personality = self._budgeted_window()
+		self.ai.openai_summarize_conversation_async = AsyncMock(return_value="Error: down")
+		history = [{"role": "user", "content": "w " * 10} for _ in range(8)]
+
+		context = await self.ai.build_context_async(personality, "small", previous_context=history, summary_model="gpt-4o-mini")
+
+		self.assertEqual(context[0]["content"], "be brief")
+		self.assertEqual(context[1:], history[-2:])
+
+	async def test_identical_concurrent_requests_are_coalesced(self):
+		calls = 0
+
+		async def create(**kwargs):
+			nonlocal calls
+			calls += 1
+			await asyncio.sleep(0.01)
+			return self._completion(kwargs["messages"][-1]["content"])
+
+		self.mock_async_client.chat.completions.create = create
+
+		results = await asyncio.gather(
+			*(self.ai.openai_chat_completion_async("gpt-4.1-mini", "system", "same") for _ in range(5)),
+			self.ai.openai_chat_completion_async("gpt-4.1-mini", "system", "different")
+		)
+
+		self.assertEqual(results, ["same"] * 5 + ["different"])
+		self.assertEqual(calls, 2)
+		await self.ai.openai_chat_completion_async("gpt-4.1-mini", "system", "same")
+		self.assertEqual(calls, 3)
+
+	async def test_coalesced_requests_share_errors(self):
+		self.mock_async_client.chat.completions.create = AsyncMock(side_effect=Exception("boom"))
+
+		results = await asyncio.gather(*(
+			self.ai.openai_chat_completion_async("gpt-4.1-mini", "system", "same") for _ in range(3)
+		))
+
+		self.assertEqual(results, ["Error: boom"] * 3)
+		self.mock_async_client.chat.completions.create.assert_awaited_once()
+
+	async def test_routed_completion_falls_back_to_ollama(self):
+		self.mock_async_client.chat.completions.create = AsyncMock(side_effect=Exception("openai down"))
+		mock_resp = MagicMock()
+		mock_resp.raise_for_status = MagicMock()
+		mock_resp.json = AsyncMock(return_value={"message": {"content": " local "}})
+		mock_post = MagicMock()
+		mock_post.__aenter__ = AsyncMock(return_value=mock_resp)
+		mock_post.__aexit__ = AsyncMock(return_value=False)
+		self.ai.http.get_session.return_value.post.return_value = mock_post
+		calls = self.mock_router_cls.call_args.args[0]
+		settings = {"ROUTER_MAX_ATTEMPTS": 1, "ROUTER_BACKENDS": [{"backend": "openai", "model": "gpt-4.1-mini"}, {"backend": "ollama", "model": "llama3"}]}
+		with patch("utils.router.Config") as mock_config_cls:
+			mock_config_cls.return_value.get_variable.side_effect = lambda key, default=None: settings.get(key, default)
+			self.ai.router = BackendRouter(calls)
+
+		result = await self.ai.chat_completion_async("system", "user")
+
+		self.assertEqual(result, "local")
+		self.assertEqual(self.ai.http.get_session.return_value.post.call_args.kwargs["json"]["model"], "llama3")
+
+	async def test_routed_attempt_timeout_cancels_backend_call(self):
+		started, cancelled = [], []
+
+		async def create(**kwargs):
+			started.append(kwargs["model"])
+			if len(started) == 1:
+				try:
+					await asyncio.sleep(10)
+				except asyncio.CancelledError:
+					cancelled.append(True)
+					raise
+			return self._completion("second try")
+
+		self.mock_async_client.chat.completions.create = create
+		calls = self.mock_router_cls.call_args.args[0]
+		settings = {"ROUTER_MAX_ATTEMPTS": 2, "ROUTER_ATTEMPT_TIMEOUT": 0.05, "ROUTER_BACKOFF_BASE": 0, "ROUTER_BACKENDS": [{"backend": "openai", "model": "gpt-4.1-mini"}]}
+		with patch("utils.router.Config") as mock_config_cls:
+			mock_config_cls.return_value.get_variable.side_effect = lambda key, default=None: settings.get(key, default)
+			self.ai.router = BackendRouter(calls)
+
+		result = await self.ai.chat_completion_async("system", "user")
+
+		self.assertEqual(result, "second try")
+		self.assertEqual((len(started), cancelled), (2, [True]))
+		self.assertEqual(self.ai._inflight.in_flight(), 0)
+		self.assertIn(call(max_retries=0), self.mock_async_openai_cls.call_args_list)
+
+	async def test_calls_holding_a_slot_are_not_coalesced(self):
+		self.mock_async_client.chat.completions.create = AsyncMock(return_value=self._completion("ok"))
+		self.ai.admission.scheduler.max_concurrency = 1
+
+		async def held():
+			async with self.ai.admission.slot():
+				# Let the other call start a leader that queues behind this slot
+				await asyncio.sleep(0.01)
+				return await self.ai.openai_chat_completion_async("gpt-4.1-mini", "system", "same")
+
+		results = await asyncio.wait_for(asyncio.gather(held(), self.ai.openai_chat_completion_async("gpt-4.1-mini", "system", "same")), 1)
+
+		self.assertEqual(results, ["ok", "ok"])
+
+	async def test_routed_completion_reports_total_failure(self):
+		self.ai.router.complete = AsyncMock(side_effect=RuntimeError("No backend available"))
+
+		result = await self.ai.chat_completion_with_context_async([{"role": "user", "content": "hi"}])
+
+		self.assertEqual(result, "Error: No backend available")
+
+	async def test_rate_limited_request_returns_error(self):
+		self.mock_async_client.chat.completions.create = AsyncMock(return_value=self._completion("ok"))
+		self.ai.admission.limiter.user_burst = 1
+		self.ai.admission.limiter.user_rate = 0.001
+
+		with request_context(guild_id=1, user_id=10):
+			first = await self.ai.openai_chat_completion_async("gpt-4.1-mini", "system", "one")
+		with request_context(guild_id=1, user_id=10):
+			second = await self.ai.openai_chat_completion_async("gpt-4.1-mini", "system", "two")
+
+		self.assertEqual(first, "ok")
+		self.assertTrue(second.startswith("Error: Rate limited (user)"))
+		self.mock_async_client.chat.completions.create.assert_awaited_once()
+
+	def _real_response_cache(self):
+		with patch("utils.response_cache.Config") as mock_config_cls:
+			mock_config_cls.return_value.get_variable.side_effect = lambda key, default=None: default
+			ResponseCache._instance = None
+			self.ai.response_cache = ResponseCache()
+		self.addCleanup(setattr, ResponseCache, "_instance", None)
+
+	async def test_cache_site_serves_repeated_prompts_from_cache(self):
+		self._real_response_cache()
+		self.mock_async_client.chat.completions.create = AsyncMock(return_value=self._completion("laughing"))
+
+		first = await self.ai.openai_chat_completion_async("gpt-4.1-mini", "system", "lol", cache_site="giphy")
+		second = await self.ai.openai_chat_completion_async("gpt-4.1-mini", "system", "lol", cache_site="giphy")
+		await self.ai.openai_chat_completion_async("gpt-4.1-mini", "system", "lol")
+
+		self.assertEqual((first, second), ("laughing", "laughing"))
+		self.assertEqual(self.mock_async_client.chat.completions.create.await_count, 2)
+		stats = self.ai.response_cache.stats()["sites"]["giphy"]
+		self.assertEqual((stats["memory_hits"], stats["misses"]), (1, 1))
+
+	async def test_cache_site_does_not_cache_errors(self):
+		self._real_response_cache()
+		self.mock_async_client.chat.completions.create = AsyncMock(side_effect=[Exception("boom"), self._completion("ok")])
+
+		first = await self.ai.openai_chat_completion_async("gpt-4.1-mini", "system", "lol", cache_site="giphy")
+		second = await self.ai.openai_chat_completion_async("gpt-4.1-mini", "system", "lol", cache_site="giphy")
+
+		self.assertEqual((first, second), ("Error: boom", "ok"))
+
+if __name__ == "__main__":
+	unittest.main()
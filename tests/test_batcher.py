@@ -0,0 +1,41 @@
+import asyncio
+import unittest
+from unittest.mock import MagicMock
+from utils.batcher import MicroBatcher
+
+class TestMicroBatcher(unittest.IsolatedAsyncioTestCase):
+	async def test_concurrent_submits_share_one_call(self):
+		fn = MagicMock(side_effect=lambda items: [item * 2 for item in items])
+		batcher = MicroBatcher(fn, window_ms=5)
+
+		results = await asyncio.gather(*(batcher.submit(i) for i in range(5)))
+
+		self.assertEqual(results, [0, 2, 4, 6, 8])
+		fn.assert_called_once_with([0, 1, 2, 3, 4])
+		self.assertEqual(batcher.batches, 1)
+
+	async def test_max_batch_dispatches_early(self):
+		fn = MagicMock(side_effect=lambda items: items)
+		batcher = MicroBatcher(fn, window_ms=10_000, max_batch=2)
+
+		results = await asyncio.wait_for(asyncio.gather(batcher.submit("a"), batcher.submit("b")), timeout=1)
+
+		self.assertEqual(results, ["a", "b"])
+		fn.assert_called_once_with(["a", "b"])
+
+	async def test_errors_propagate_to_every_caller(self):
+		fn = MagicMock(side_effect=Exception("encode failed"))
+		batcher = MicroBatcher(fn, window_ms=1)
+
+		results = await asyncio.gather(batcher.submit(1), batcher.submit(2), return_exceptions=True)
+
+		self.assertTrue(all(isinstance(result, Exception) for result in results))
+
+	async def test_result_count_mismatch_is_an_error(self):
+		batcher = MicroBatcher(lambda items: items[:1], window_ms=1)
+
+		with self.assertRaises(ValueError):
+			await asyncio.gather(batcher.submit(1), batcher.submit(2))
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,53 @@
+import unittest
+from unittest.mock import patch
+from utils.cache import LRUCache
+
+class TestLRUCache(unittest.TestCase):
+	def test_get_and_set(self):
+		cache = LRUCache(max_entries=2)
+		cache.set("a", 1)
+		self.assertEqual(cache.get("a"), 1)
+		self.assertIsNone(cache.get("missing"))
+		self.assertEqual(cache.get("missing", "default"), "default")
+
+	def test_least_recently_used_is_evicted(self):
+		cache = LRUCache(max_entries=2)
+		cache.set("a", 1)
+		cache.set("b", 2)
+		cache.get("a")
+		cache.set("c", 3)
+
+		self.assertEqual(cache.get("a"), 1)
+		self.assertIsNone(cache.get("b"))
+		self.assertEqual(cache.get("c"), 3)
+		self.assertEqual(cache.evictions, 1)
+
+	@patch("utils.cache.time.monotonic")
+	def test_expired_entries_are_misses(self, mock_monotonic):
+		mock_monotonic.return_value = 100.0
+		cache = LRUCache(max_entries=10, ttl=5)
+		cache.set("a", 1)
+		cache.set("b", 2, ttl=60)
+
+		mock_monotonic.return_value = 106.0
+
+		self.assertIsNone(cache.get("a"))
+		self.assertEqual(cache.get("b"), 2)
+		self.assertEqual(len(cache), 1)
+
+	def test_stats(self):
+		cache = LRUCache(max_entries=10)
+		cache.set("a", 1)
+		cache.get("a")
+		cache.get("a")
+		cache.get("b")
+
+		stats = cache.stats()
+
+		self.assertEqual(stats["hits"], 2)
+		self.assertEqual(stats["misses"], 1)
+		self.assertEqual(stats["size"], 1)
+		self.assertAlmostEqual(stats["hit_rate"], 0.6667)
+
+if __name__ == "__main__":
+	unittest.main()
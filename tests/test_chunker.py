@@ -0,0 +1,46 @@
+import unittest
+from utils.chunker import Chunker
+
+TEXT = "Alpha beta gamma. Delta epsilon zeta! Eta theta iota kappa. Lambda mu.\nNu xi omicron pi rho sigma"
+
+class TestChunker(unittest.TestCase):
+	def test_short_text_is_one_chunk(self):
+		chunks = Chunker(max_tokens=50, overlap=5).split(TEXT)
+
+		self.assertEqual(len(chunks), 1)
+		self.assertEqual(chunks[0].text, TEXT)
+		self.assertEqual(chunks[0].tokens, 18)
+
+	def test_windows_follow_sentences_and_overlap(self):
+		chunks = Chunker(max_tokens=8, overlap=3).split(TEXT)
+
+		self.assertEqual([chunk.text for chunk in chunks], [
+			"Alpha beta gamma. Delta epsilon zeta!",
+			"Delta epsilon zeta! Eta theta iota kappa.",
+			"Lambda mu.\nNu xi omicron pi rho sigma",
+		])
+		for chunk in chunks:
+			self.assertLessEqual(chunk.tokens, 8)
+			self.assertEqual(TEXT[chunk.start:chunk.end], chunk.text)
+
+	def test_long_sentence_is_split_between_words(self):
+		text = " ".join(f"w{i}" for i in range(10)) + "."
+
+		chunks = Chunker(max_tokens=4, overlap=1).split(text)
+
+		self.assertEqual([chunk.text for chunk in chunks], ["w0 w1 w2 w3", "w4 w5 w6 w7", "w8 w9."])
+
+	def test_merge_drops_overlap(self):
+		chunks = Chunker(max_tokens=8, overlap=3).split(TEXT)
+
+		merged = Chunker.merge([(chunk.start, chunk.end, chunk.text) for chunk in reversed(chunks)])
+
+		self.assertEqual(merged, TEXT)
+		self.assertEqual(Chunker.merge([(0, 5, "Alpha"), (18, 23, "Delta")]), "Alpha Delta")
+
+	def test_overlap_must_fit_in_window(self):
+		with self.assertRaises(ValueError):
+			Chunker(max_tokens=4, overlap=4)
+
+if __name__ == "__main__":
+	unittest.main()
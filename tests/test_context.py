@@ -0,0 +1,102 @@
+import unittest
+from unittest.mock import patch
+from utils.context import ContextWindow, SUMMARY_PREFIX
+
+class WordTokens:
+	"""One token per word; each message costs three tokens of overhead."""
+
+	def count(self, model, text):
+		return len(text.split()) if text else 0
+
+	def count_message(self, model, message):
+		return 3 + self.count(model, message.get("content"))
+
+	def truncate(self, model, text, max_tokens):
+		return " ".join(text.split()[:max_tokens])
+
+def make_window(**settings):
+	defaults = {
+		"CONTEXT_TOKEN_LIMITS": {"small": 100, "small-long": 200},
+		"CONTEXT_DEFAULT_TOKEN_LIMIT": 1000,
+		"CONTEXT_REPLY_RESERVE": 20,
+		"CONTEXT_RAG_MAX_TOKENS": 10,
+		"CONTEXT_SUMMARY_MAX_TOKENS": 5,
+		"CONTEXT_TRIM_TARGET": 0.5
+	}
+	defaults.update(settings)
+	with patch("utils.context.Config") as mock_config_cls:
+		mock_config_cls.return_value.get_variable.side_effect = lambda key, default=None: defaults.get(key, default)
+		return ContextWindow(WordTokens())
+
+def turn(words, role="user"):
+	return {"role": role, "content": " ".join(["w"] * words)}
+
+class TestContextWindow(unittest.TestCase):
+	def setUp(self):
+		self.window = make_window()
+		self.system = {"role": "system", "content": "be brief"}
+
+	def test_budget_uses_longest_prefix_and_reserve(self):
+		self.assertEqual(self.window.budget("small"), 80)
+		self.assertEqual(self.window.budget("small-long-2024"), 180)
+		self.assertEqual(self.window.budget("other"), 980)
+
+	def test_history_that_fits_is_untouched(self):
+		history = [turn(10), turn(10, "assistant")]
+
+		kept, dropped = self.window.split("small", self.system, history)
+
+		self.assertIs(kept, history)
+		self.assertEqual(dropped, [])
+
+	def test_overflow_trims_oldest_to_target(self):
+		# available = 80 - (3 + 2) - 3 = 72, target = 36; each turn costs 13
+		history = [turn(10) for _ in range(8)]
+
+		kept, dropped = self.window.split("small", self.system, history)
+
+		self.assertEqual(len(kept), 2)
+		self.assertEqual(dropped, history[:6])
+
+	def test_cut_only_moves_when_kept_turns_overflow(self):
+		# available = 72, target = 36; each turn costs 13, so a cut keeps 2 turns and refills to 5
+		history, cuts = [], []
+		for _ in range(20):
+			history.append(turn(10))
+			kept, dropped = self.window.split("small", self.system, history)
+			self.assertEqual(dropped + kept, history)
+			cuts.append(len(dropped))
+
+		self.assertEqual(cuts, [0] * 5 + [4] * 4 + [8] * 4 + [12] * 4 + [16] * 3)
+
+	def test_newest_message_is_always_kept(self):
+		history = [turn(5), turn(200)]
+
+		with patch.object(self.window.logger, "warning") as warning:
+			kept, dropped = self.window.split("small", self.system, history)
+
+		self.assertEqual(kept, [history[1]])
+		self.assertEqual(dropped, [history[0]])
+		warning.assert_called_once()
+
+	def test_cap_rag_keeps_whole_snippets(self):
+		rag = "one two three\n\nfour five six\n\nseven eight nine ten eleven"
+
+		self.assertEqual(self.window.cap_rag("small", rag), "one two three\n\nfour five six")
+		self.assertEqual(self.window.cap_rag("small", " ".join(["x"] * 30)), " ".join(["x"] * 10))
+		self.assertEqual(self.window.cap_rag("small", "short"), "short")
+
+	def test_cached_summary_matches_longest_prefix(self):
+		dropped = [turn(1), turn(2), turn(3)]
+		self.window.store_summary(dropped[:2], "first two")
+
+		self.assertEqual(self.window.cached_summary(dropped), ("first two", 2))
+		self.assertEqual(self.window.cached_summary([turn(4)]), (None, 0))
+
+	def test_summary_message_is_capped(self):
+		message = self.window.summary_message("small", "a b c d e f g")
+
+		self.assertEqual(message, {"role": "system", "content": SUMMARY_PREFIX + "a b c d e"})
+
+if __name__ == "__main__":
+	unittest.main()
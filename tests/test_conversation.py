@@ -0,0 +1,170 @@
+import asyncio
+import unittest
+from collections import deque
+from unittest.mock import patch
+from utils.conversation import ConversationStore, _Channel
+
+class FakeDatabase:
+	"""Stores rows in a dict keyed by (channel_id, seq) and answers the store's two queries."""
+
+	def __init__(self):
+		self.rows = {}
+		self.selects = 0
+		self.batches = []
+		self.fail_batches = 0
+		# When set, batch writes wait for it, to hold a flush in flight
+		self.write_gate = None
+
+	async def run_script_async(self, script, params=None):
+		self.selects += 1
+		channel_id, limit = params
+		seqs = sorted((seq for channel, seq in self.rows if channel == channel_id), reverse=True)[:limit]
+		return [(seq, *self.rows[(channel_id, seq)]) for seq in seqs]
+
+	async def run_batch_async(self, script, rows, page_size=1000):
+		if self.fail_batches:
+			self.fail_batches -= 1
+			return False
+		if self.write_gate is not None:
+			await self.write_gate.wait()
+		self.batches.append(list(rows))
+		inserted = 0
+		for channel_id, seq, role, content, _ in rows:
+			if (channel_id, seq) not in self.rows:
+				self.rows[(channel_id, seq)] = (role, content)
+				inserted += 1
+		return inserted
+
+class TestConversationStore(unittest.IsolatedAsyncioTestCase):
+	def setUp(self):
+		self.patcher_config = patch("utils.conversation.Config")
+		self.mock_config_cls = self.patcher_config.start()
+		self.addCleanup(self.patcher_config.stop)
+		self.settings = {"CONVERSATION_HOT_TURNS": 3, "CONVERSATION_FLUSH_BATCH": 100, "CONVERSATION_HOT_CHANNELS": 2}
+		self.mock_config_cls.return_value.get_variable.side_effect = lambda key, default=None: self.settings.get(key, default)
+
+		self.db = FakeDatabase()
+		# Reset singleton between tests
+		ConversationStore._instance = None
+		self.store = ConversationStore(self.db)
+
+	async def test_appends_are_batched_until_flush(self):
+		await self.store.append(1, "user", "hi", author_id=7)
+		await self.store.append(1, "assistant", "hello")
+
+		self.assertEqual(self.db.batches, [])
+		self.assertEqual(await self.store.flush(), 2)
+		self.assertEqual(self.db.batches, [[(1, 0, "user", "hi", 7), (1, 1, "assistant", "hello", None)]])
+		self.assertEqual(await self.store.flush(), 0)
+
+	async def test_recent_is_served_from_hot_cache(self):
+		for i in range(5):
+			await self.store.append(1, "user", f"m{i}")
+		selects = self.db.selects
+
+		recent = await self.store.recent(1, 2)
+
+		self.assertEqual(recent, [{"role": "user", "content": "m3"}, {"role": "user", "content": "m4"}])
+		self.assertEqual(self.db.selects, selects)
+
+	async def test_recent_beyond_hot_cache_reads_database(self):
+		for i in range(5):
+			await self.store.append(1, "user", f"m{i}")
+
+		recent = await self.store.recent(1, 5)
+
+		self.assertEqual([turn["content"] for turn in recent], ["m0", "m1", "m2", "m3", "m4"])
+		self.assertEqual(len(self.db.batches), 1)
+
+	async def test_short_history_never_goes_back_to_database(self):
+		await self.store.append(1, "user", "only")
+		selects = self.db.selects
+
+		self.assertEqual(await self.store.recent(1, 10), [{"role": "user", "content": "only"}])
+		self.assertEqual(self.db.selects, selects)
+
+	async def test_history_survives_restart(self):
+		for i in range(4):
+			await self.store.append(1, "user", f"m{i}")
+		await self.store.close()
+
+		ConversationStore._instance = None
+		restarted = ConversationStore(self.db)
+		await restarted.append(1, "assistant", "back")
+		await restarted.flush()
+
+		self.assertEqual([turn["content"] for turn in await restarted.recent(1, 3)], ["m2", "m3", "back"])
+		self.assertEqual(self.db.rows[(1, 4)], ("assistant", "back"))
+
+	async def test_evicted_channel_keeps_its_sequence(self):
+		await self.store.append(1, "user", "a")
+		await self.store.append(2, "user", "b")
+		await self.store.append(3, "user", "c")
+
+		await self.store.append(1, "user", "d")
+		await self.store.flush()
+
+		self.assertEqual(self.db.rows[(1, 0)], ("user", "a"))
+		self.assertEqual(self.db.rows[(1, 1)], ("user", "d"))
+
+	async def test_reload_waits_for_in_flight_flush(self):
+		await self.store.append(1, "user", "a")
+		await self.store.append(2, "user", "b")
+		await self.store.append(3, "user", "c")
+		self.db.write_gate = asyncio.Event()
+		flushing = asyncio.create_task(self.store.flush())
+		await asyncio.sleep(0)
+
+		reloading = asyncio.create_task(self.store.append(1, "user", "d"))
+		await asyncio.sleep(0)
+		self.db.write_gate.set()
+		await asyncio.gather(flushing, reloading)
+		await self.store.flush()
+
+		self.assertEqual(self.db.rows[(1, 0)], ("user", "a"))
+		self.assertEqual(self.db.rows[(1, 1)], ("user", "d"))
+
+	async def test_conflicting_turns_are_logged(self):
+		# A stale hot entry hands out a sequence number that is already taken
+		self.store.channels.set(1, _Channel(deque(maxlen=3), 0, True))
+		self.db.rows[(1, 0)] = ("user", "existing")
+		await self.store.append(1, "user", "a")
+
+		with patch.object(self.store.logger, "error") as error:
+			self.assertEqual(await self.store.flush(), 0)
+		error.assert_called_once()
+
+	async def test_failed_flush_keeps_turns_for_retry(self):
+		self.db.fail_batches = 1
+		await self.store.append(1, "user", "a")
+
+		self.assertEqual(await self.store.flush(), 0)
+		await self.store.append(1, "user", "b")
+		self.assertEqual(await self.store.flush(), 2)
+
+		self.assertEqual([row[1] for row in self.db.batches[0]], [0, 1])
+
+	async def test_backlog_triggers_flush(self):
+		self.settings["CONVERSATION_FLUSH_BATCH"] = 2
+		ConversationStore._instance = None
+		store = ConversationStore(self.db)
+
+		await store.append(1, "user", "a")
+		await store.append(1, "user", "b")
+
+		self.assertEqual(len(self.db.batches), 1)
+
+	async def test_background_loop_flushes(self):
+		self.settings["CONVERSATION_FLUSH_INTERVAL"] = 0.01
+		ConversationStore._instance = None
+		store = ConversationStore(self.db)
+		await store.start()
+		self.addAsyncCleanup(store.close)
+
+		await store.append(1, "user", "a")
+		await asyncio.sleep(0.05)
+
+		self.assertEqual(len(self.db.batches), 1)
+
+if __name__ == "__main__":
+	unittest.main()
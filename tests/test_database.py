@@ -1,5 +1,8 @@
 import os
+import time
+import asyncio
 import unittest
+import psycopg2
 from unittest.mock import patch, MagicMock, mock_open
 from utils.database import Database
 
@@ -10,6 +13,9 @@ class DummyConfig:
 	DB_HOST = "localhost"
 	DB_PORT = 5432
 
+	def get_variable(self, key, default=None):
+		return getattr(self, key.upper(), default)
+
 class TestDatabase(unittest.TestCase):
 	def setUp(self):
 		# Reset singleton so __init__ runs fresh in every test
@@ -25,6 +31,7 @@ class TestDatabase(unittest.TestCase):
 		mock_logger_class.return_value = mock_logger
 
 		mock_conn = MagicMock()
+		mock_conn.closed = 0
 		mock_cursor = MagicMock()
 		mock_conn.cursor.return_value = mock_cursor
 		mock_connect.return_value = mock_conn
@@ -43,7 +50,9 @@ class TestDatabase(unittest.TestCase):
 			host="localhost",
 			port=5432,
 		)
-		mock_conn.cursor.assert_called_once()
+		# No shared cursor; cursors are opened per query on pooled connections
+		mock_conn.cursor.assert_not_called()
+		self.assertEqual(db1._size, 1)
 		mock_logger.info.assert_any_call("Database initiated")
 		mock_logger.info.assert_any_call("Successfully connected to the database")
 
@@ -55,6 +64,7 @@ class TestDatabase(unittest.TestCase):
 		mock_logger_class.return_value = mock_logger
 
 		mock_conn = MagicMock()
+		mock_conn.closed = 0
 		mock_cursor = MagicMock()
 		mock_conn.cursor.return_value = mock_cursor
 		mock_connect.return_value = mock_conn
@@ -76,6 +86,7 @@ class TestDatabase(unittest.TestCase):
 		mock_logger_class.return_value = mock_logger
 
 		mock_conn = MagicMock()
+		mock_conn.closed = 0
 		mock_cursor = MagicMock()
 		mock_conn.cursor.return_value = mock_cursor
 		mock_connect.return_value = mock_conn
@@ -104,6 +115,7 @@ class TestDatabase(unittest.TestCase):
 		mock_logger_class.return_value = mock_logger
 
 		mock_conn = MagicMock()
+		mock_conn.closed = 0
 		mock_cursor = MagicMock()
 		mock_conn.cursor.return_value = mock_cursor
 		mock_connect.return_value = mock_conn
@@ -123,6 +135,7 @@ class TestDatabase(unittest.TestCase):
 		mock_logger_class.return_value = mock_logger
 
 		mock_conn = MagicMock()
+		mock_conn.closed = 0
 		mock_cursor = MagicMock()
 		mock_conn.cursor.return_value = mock_cursor
 		mock_connect.return_value = mock_conn
@@ -131,9 +144,120 @@ class TestDatabase(unittest.TestCase):
 
 		db.close()
 
-		mock_cursor.close.assert_called_once()
 		mock_conn.close.assert_called_once()
 		mock_logger.info.assert_called_with("Database connection closed")
 
+	@patch("utils.database.Logger")
+	@patch("utils.database.psycopg2.connect")
+	def test_run_script_returns_connection_to_pool(self, mock_connect, mock_logger_class):
+		mock_conn = MagicMock()
+		mock_conn.closed = 0
+		mock_cursor = MagicMock()
+		mock_cursor.rowcount = 3
+		mock_conn.cursor.return_value = mock_cursor
+		mock_connect.return_value = mock_conn
+
+		db = Database(self.config)
+
+		self.assertEqual(db.run_script("DELETE FROM things"), 3)
+		self.assertEqual(db.run_script("DELETE FROM things"), 3)
+
+		# Both queries reuse the single pooled connection and close their cursors
+		mock_connect.assert_called_once()
+		self.assertEqual(len(db._idle), 1)
+		self.assertEqual(mock_cursor.close.call_count, 2)
+
+	@patch("utils.database.Logger")
+	@patch("utils.database.psycopg2.connect")
+	def test_run_script_discards_broken_connection_and_retries(self, mock_connect, mock_logger_class):
+		broken_conn = MagicMock()
+		broken_conn.closed = 0
+		broken_conn.cursor.return_value.execute.side_effect = psycopg2.OperationalError("server closed")
+		fresh_conn = MagicMock()
+		fresh_conn.closed = 0
+		fresh_conn.cursor.return_value.fetchall.return_value = [(1,)]
+		mock_connect.side_effect = [broken_conn, fresh_conn]
+
+		db = Database(self.config)
+
+		result = db.run_script("SELECT 1")
+
+		self.assertEqual(result, [(1,)])
+		broken_conn.close.assert_called_once()
+		self.assertEqual(db._size, 1)
+		self.assertIs(db._idle[0][0], fresh_conn)
+
+	@patch("utils.database.Logger")
+	@patch("utils.database.psycopg2.connect")
+	def test_acquire_health_checks_stale_connection(self, mock_connect, mock_logger_class):
+		stale_conn = MagicMock()
+		stale_conn.closed = 0
+		stale_conn.cursor.return_value.execute.side_effect = psycopg2.OperationalError("gone")
+		fresh_conn = MagicMock()
+		fresh_conn.closed = 0
+		mock_connect.side_effect = [stale_conn, fresh_conn]
+
+		db = Database(self.config)
+		db._idle[0] = (stale_conn, time.monotonic() - db.health_check_interval - 1)
+
+		conn = db._acquire()
+
+		self.assertIs(conn, fresh_conn)
+		stale_conn.close.assert_called_once()
+
+	@patch("utils.database.Logger")
+	@patch("utils.database.psycopg2.connect")
+	def test_release_recycles_idle_connections_above_min_size(self, mock_connect, mock_logger_class):
+		conns = [MagicMock(closed=0) for _ in range(3)]
+		mock_connect.side_effect = conns
+
+		db = Database(self.config)
+		first = db._acquire()
+		second = db._acquire()
+		self.assertEqual(db._size, 2)
+
+		db._release(first)
+		db._idle[0] = (first, time.monotonic() - db.max_idle - 1)
+		db._release(second)
+
+		first.close.assert_called_once()
+		self.assertEqual(db._size, 1)
+		self.assertEqual([conn for conn, _ in db._idle], [second])
+
+	@patch("utils.database.Logger")
+	@patch("utils.database.psycopg2.connect")
+	def test_run_script_async(self, mock_connect, mock_logger_class):
+		mock_conn = MagicMock()
+		mock_conn.closed = 0
+		mock_conn.cursor.return_value.fetchall.return_value = [("row",)]
+		mock_connect.return_value = mock_conn
+
+		db = Database(self.config)
+
+		result = asyncio.run(db.run_script_async("SELECT * FROM users"))
+
+		self.assertEqual(result, [("row",)])
+
+	@patch("utils.database.execute_values")
+	@patch("utils.database.Logger")
+	@patch("utils.database.psycopg2.connect")
+	def test_run_batch_pages_rows_and_commits_once(self, mock_connect, mock_logger_class, mock_execute_values):
+		mock_conn = MagicMock()
+		mock_conn.closed = 0
+		mock_cursor = MagicMock()
+		mock_cursor.rowcount = 2
+		mock_conn.cursor.return_value = mock_cursor
+		mock_connect.return_value = mock_conn
+		rows = [(i, "x") for i in range(5)]
+
+		db = Database(self.config)
+		result = db.run_batch("INSERT INTO t (a, b) VALUES %s", rows, page_size=2)
+
+		self.assertEqual(result, 6)
+		pages = [c.args[2] for c in mock_execute_values.call_args_list]
+		self.assertEqual(pages, [rows[0:2], rows[2:4], rows[4:5]])
+		mock_conn.commit.assert_called_once()
+		self.assertEqual(db.run_batch("INSERT INTO t (a, b) VALUES %s", []), 0)
+
 if __name__ == "__main__":
 	unittest.main()
@@ -0,0 +1,51 @@
+import unittest
+from unittest.mock import patch
+from utils.http_pool import HttpPool
+
+class TestHttpPool(unittest.IsolatedAsyncioTestCase):
+	def setUp(self):
+		self.patcher_config = patch("utils.http_pool.Config")
+		self.mock_config_cls = self.patcher_config.start()
+		self.addCleanup(self.patcher_config.stop)
+		self.mock_config_cls.return_value.get_variable.side_effect = lambda key, default=None: default
+
+		# Reset singleton between tests
+		HttpPool._instance = None
+		self.pool = HttpPool()
+
+	async def asyncTearDown(self):
+		await self.pool.close()
+
+	async def test_open_creates_shared_sessions(self):
+		self.pool.open()
+
+		session = self.pool.get_session()
+		self.assertIs(session, self.pool.get_session())
+		self.assertEqual(session.connector.limit, 100)
+		self.assertEqual(session.connector.limit_per_host, 10)
+		self.assertEqual(session.timeout.connect, 5)
+		self.assertEqual(session.timeout.sock_read, 120)
+		adapter = self.pool.get_sync_session().get_adapter("https://api.giphy.com")
+		self.assertEqual((adapter._pool_connections, adapter._pool_maxsize), (4, 10))
+
+	async def test_close_releases_sessions(self):
+		self.pool.open()
+		session = self.pool.get_session()
+
+		await self.pool.close()
+
+		self.assertTrue(session.closed)
+		self.assertIsNone(self.pool.session)
+		self.assertIsNone(self.pool.sync_session)
+
+	async def test_session_is_recreated_after_close(self):
+		first = self.pool.get_session()
+		await self.pool.close()
+
+		second = self.pool.get_session()
+
+		self.assertIsNot(first, second)
+		self.assertFalse(second.closed)
+
+if __name__ == "__main__":
+	unittest.main()
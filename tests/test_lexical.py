@@ -0,0 +1,52 @@
+import unittest
+from utils.lexical import LexicalIndex, reciprocal_rank_fusion, tokenize
+
+class TestLexicalIndex(unittest.TestCase):
+	def setUp(self):
+		self.index = LexicalIndex(filter_fields=("guild_id", "channel_id"))
+		self.index.add("a", "The bot crashed with error E404 in #general", {"guild_id": 1, "channel_id": 10})
+		self.index.add("b", "Ask user#1234 about the release notes", {"guild_id": 1, "channel_id": 11})
+		self.index.add("c", "Release notes for the error handling rewrite", {"guild_id": 2})
+
+	def test_tokenize_keeps_identifiers_whole_and_split(self):
+		self.assertEqual(tokenize("Ping user#1234 re: E404"), ["ping", "user#1234", "user", "1234", "re", "e404"])
+
+	def test_exact_keyword_ranks_first(self):
+		hits = self.index.search("who is user#1234", top_k=3)
+
+		self.assertEqual(hits[0][0], "b")
+		self.assertEqual(len(hits), 1)
+
+	def test_rare_terms_outweigh_common_ones(self):
+		hits = self.index.search("error e404", top_k=3)
+
+		self.assertEqual([doc_id for doc_id, _ in hits], ["a", "c"])
+		self.assertGreater(hits[0][1], hits[1][1])
+
+	def test_filters_narrow_candidates(self):
+		self.assertEqual([doc_id for doc_id, _ in self.index.search("release notes", where={"guild_id": 1})], ["b"])
+		self.assertEqual(self.index.search("release notes", where={"guild_id": 1, "channel_id": 10}), [])
+		with self.assertRaises(ValueError):
+			self.index.search("release", where={"author_id": 5})
+
+	def test_replace_and_remove_update_postings(self):
+		self.index.add("a", "Completely different words", {"guild_id": 3})
+		self.assertEqual(self.index.search("e404"), [])
+		self.assertEqual(self.index.search("different", where={"guild_id": 1}), [])
+
+		self.index.remove("a")
+		self.index.remove("missing")
+
+		self.assertEqual(len(self.index), 2)
+		self.assertNotIn("different", self.index.postings)
+		self.assertNotIn(("guild_id", 3), self.index.fields)
+		self.assertEqual(self.index.total_length, sum(entry[0] for entry in self.index.docs.values()))
+
+	def test_reciprocal_rank_fusion(self):
+		fused = reciprocal_rank_fusion([["x", "y", "z"], ["z", "w"]], k=60)
+
+		self.assertEqual(fused[0], "z")
+		self.assertEqual(set(fused), {"x", "y", "z", "w"})
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,234 @@
+import os
+import json
+import glob
+import gzip
+import queue
+import logging
+import tempfile
+import unittest
+from unittest.mock import MagicMock
+from utils.logger import Logger, _JsonFormatter, _BufferedFileHandler, _BoundedQueueHandler, _BatchQueueListener, _RotatingFileHandler, _IndexedFileHandler, _Compressor, read_indexed_records
+
+class TestQueueLogging(unittest.TestCase):
+	def setUp(self):
+		self.temp_dir = tempfile.TemporaryDirectory()
+		self.addCleanup(self.temp_dir.cleanup)
+		self.log_path = os.path.join(self.temp_dir.name, "test.log")
+
+		self.logger = logging.getLogger("test_queue_logger")
+		self.logger.setLevel(logging.DEBUG)
+		self.logger.propagate = False
+		self.addCleanup(self.logger.handlers.clear)
+
+	def test_records_are_written_by_listener_thread(self):
+		file_handler = _BufferedFileHandler(self.log_path, 'a', 'utf-8')
+		file_handler.setFormatter(logging.Formatter("%(levelname)s %(message)s"))
+		self.addCleanup(file_handler.close)
+		log_queue = queue.Queue(maxsize=100)
+		listener = _BatchQueueListener(log_queue, file_handler, batch_size=10)
+		self.logger.addHandler(_BoundedQueueHandler(log_queue))
+		listener.start()
+
+		for i in range(25):
+			self.logger.info("message %d", i)
+		listener.stop()
+
+		with open(self.log_path, encoding="utf-8") as f:
+			lines = f.read().splitlines()
+		self.assertEqual(len(lines), 25)
+		self.assertEqual(lines[0], "INFO message 0")
+		self.assertEqual(lines[-1], "INFO message 24")
+
+	def test_handler_levels_are_respected(self):
+		handler = MagicMock()
+		handler.level = logging.WARNING
+		log_queue = queue.Queue()
+		listener = _BatchQueueListener(log_queue, handler)
+		self.logger.addHandler(_BoundedQueueHandler(log_queue))
+		listener.start()
+
+		self.logger.info("skipped")
+		self.logger.warning("kept")
+		listener.stop()
+
+		self.assertEqual(handler.handle.call_count, 1)
+		self.assertEqual(handler.handle.call_args.args[0].getMessage(), "kept")
+		handler.flush.assert_called()
+
+	def test_arguments_are_rendered_at_call_time(self):
+		handler = MagicMock()
+		handler.level = logging.DEBUG
+		log_queue = queue.Queue()
+		listener = _BatchQueueListener(log_queue, handler)
+		self.logger.addHandler(_BoundedQueueHandler(log_queue))
+		context = [{"role": "user", "content": "first"}]
+
+		self.logger.info("context: %s", context)
+		context.append({"role": "assistant", "content": "second"})
+		listener.start()
+		listener.stop()
+
+		record = handler.handle.call_args.args[0]
+		self.assertEqual(record.getMessage(), "context: [{'role': 'user', 'content': 'first'}]")
+		self.assertIsNone(record.args)
+
+	def test_full_queue_drops_and_reports(self):
+		log_queue = queue.Queue(maxsize=2)
+		queue_handler = _BoundedQueueHandler(log_queue, policy="drop")
+		self.logger.addHandler(queue_handler)
+
+		for i in range(5):
+			self.logger.info("message %d", i)
+
+		self.assertEqual(queue_handler.dropped, 3)
+		log_queue.get_nowait()
+		log_queue.get_nowait()
+
+		self.logger.info("after drain")
+
+		messages = [log_queue.get_nowait().getMessage() for _ in range(log_queue.qsize())]
+		self.assertEqual(messages, ["after drain", "Log queue full, dropped 3 records"])
+
+	def test_block_policy_times_out_and_drops(self):
+		log_queue = queue.Queue(maxsize=1)
+		queue_handler = _BoundedQueueHandler(log_queue, policy="block", block_timeout=0.01)
+		self.logger.addHandler(queue_handler)
+
+		self.logger.info("first")
+		self.logger.info("second")
+
+		self.assertEqual(queue_handler.dropped, 1)
+		self.assertEqual(log_queue.get_nowait().getMessage(), "first")
+
+class TestLogRotation(unittest.TestCase):
+	def setUp(self):
+		self.temp_dir = tempfile.TemporaryDirectory()
+		self.addCleanup(self.temp_dir.cleanup)
+		self.compressor = _Compressor()
+
+	def _record(self, level, msg):
+		return logging.LogRecord("test", level, __file__, 0, msg, None, None)
+
+	def test_rotates_by_size_and_compresses(self):
+		path = os.path.join(self.temp_dir.name, "debug.log")
+		handler = _RotatingFileHandler(path, max_bytes=100, rotate_daily=False, backup_count=10, compress=True, compressor=self.compressor)
+		handler.setFormatter(logging.Formatter("%(message)s"))
+		self.addCleanup(handler.close)
+
+		for i in range(5):
+			handler.emit(self._record(logging.INFO, "x" * 60))
+			handler.flush()
+		self.compressor.join()
+
+		segments = sorted(glob.glob(path + ".*.gz"))
+		self.assertEqual(len(segments), 2)
+		with gzip.open(segments[0], "rt", encoding="utf-8") as f:
+			self.assertEqual(f.read(), ("x" * 60 + "\n") * 2)
+		with open(path, encoding="utf-8") as f:
+			self.assertEqual(f.read(), "x" * 60 + "\n")
+
+	def test_size_check_does_not_flush_each_record(self):
+		path = os.path.join(self.temp_dir.name, "warning.log")
+		with open(path, "w", encoding="utf-8") as f:
+			f.write("earlier\n")
+		handler = _RotatingFileHandler(path, max_bytes=1000, rotate_daily=False, compressor=self.compressor)
+		handler.setFormatter(logging.Formatter("%(message)s"))
+		self.addCleanup(handler.close)
+
+		for i in range(3):
+			handler.emit(self._record(logging.INFO, "é" * 10))
+
+		self.assertEqual(os.path.getsize(path), 8)
+		handler.flush()
+		self.assertEqual(os.path.getsize(path), handler._bytes)
+
+	def test_retention_keeps_newest_segments(self):
+		path = os.path.join(self.temp_dir.name, "info.log")
+		handler = _RotatingFileHandler(path, max_bytes=1, rotate_daily=False, backup_count=2, compress=False, compressor=self.compressor)
+		self.addCleanup(handler.close)
+
+		for i in range(6):
+			handler.emit(self._record(logging.INFO, f"line {i}"))
+			handler.flush()
+			self.compressor.join()
+
+		segments = sorted(glob.glob(path + ".*"))
+		self.assertEqual(len(segments), 2)
+		with open(segments[-1], encoding="utf-8") as f:
+			self.assertEqual(f.read(), "line 4\n")
+
+	def test_single_file_mode_indexes_levels(self):
+		path = os.path.join(self.temp_dir.name, "app.log")
+		handler = _IndexedFileHandler(path, max_bytes=0, rotate_daily=False, compressor=self.compressor)
+		handler.setFormatter(logging.Formatter("%(levelname)s %(message)s"))
+
+		handler.emit(self._record(logging.DEBUG, "debug one"))
+		handler.emit(self._record(logging.WARNING, "warning one"))
+		handler.emit(self._record(logging.INFO, "info one"))
+		handler.emit(self._record(logging.WARNING, "warning two"))
+		handler.close()
+
+		with open(path, encoding="utf-8") as f:
+			self.assertEqual(len(f.read().splitlines()), 4)
+		self.assertEqual(list(read_indexed_records(path, "WARNING")), ["WARNING warning one", "WARNING warning two"])
+		self.assertEqual(list(read_indexed_records(path, "INFO")), ["INFO info one"])
+		self.assertEqual(list(read_indexed_records(path, "ERROR")), [])
+
+class TestStructuredLogging(unittest.TestCase):
+	def setUp(self):
+		self.handler = MagicMock()
+		self.handler.level = logging.DEBUG
+		self.records = []
+		self.handler.handle.side_effect = self.records.append
+
+		self.app_logger = object.__new__(Logger)
+		self.app_logger.logger = logging.getLogger("test_structured_logger")
+		self.app_logger.logger.setLevel(logging.INFO)
+		self.app_logger.logger.propagate = False
+		self.app_logger.logger.addHandler(self.handler)
+		self.addCleanup(self.app_logger.logger.handlers.clear)
+
+	def test_disabled_level_skips_formatting(self):
+		build = MagicMock(return_value="expensive")
+
+		self.app_logger.debug(build)
+		self.app_logger.debug("value %s", build)
+
+		build.assert_not_called()
+		build.__str__.assert_not_called()
+		self.assertEqual(self.records, [])
+
+	def test_callable_message_is_built_once_on_emit(self):
+		build = MagicMock(return_value="built message")
+
+		self.app_logger.info(build)
+
+		self.assertEqual(self.records[0].getMessage(), "built message")
+		self.assertEqual(self.records[0].getMessage(), "built message")
+		build.assert_called_once()
+
+	def test_json_formatter_merges_fields(self):
+		self.app_logger.info("Completion took %d ms", 42, model="gpt-4o", guild=1, latency_ms=42)
+
+		entry = json.loads(_JsonFormatter().format(self.records[0]))
+
+		self.assertEqual(entry["msg"], "Completion took 42 ms")
+		self.assertEqual(entry["level"], "INFO")
+		self.assertEqual(entry["model"], "gpt-4o")
+		self.assertEqual(entry["guild"], 1)
+		self.assertEqual(entry["latency_ms"], 42)
+		self.assertEqual(entry["file"], "test_logger.py")
+
+	def test_json_formatter_includes_exception(self):
+		try:
+			raise ValueError("boom")
+		except ValueError:
+			self.app_logger.logger.exception("failed")
+
+		entry = json.loads(_JsonFormatter().format(self.records[0]))
+
+		self.assertIn("ValueError: boom", entry["exc"])
+		self.assertNotIn("model", entry)
+
+if __name__ == "__main__":
+	unittest.main()
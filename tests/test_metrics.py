@@ -0,0 +1,141 @@
+import asyncio
+import socket
+import unittest
+from utils.metrics import Metrics, Histogram, MetricsServer, track
+
+class Backend:
+	model_name = "embedder"
+
+	@track("fake")
+	def complete(self, model, prompt):
+		return "Error: boom" if prompt == "fail" else prompt.upper()
+
+	@track("fake")
+	async def complete_async(self, model, prompt):
+		if prompt == "raise":
+			raise RuntimeError("boom")
+		return prompt
+
+	@track("fake")
+	async def stream(self, model, parts):
+		for part in parts:
+			yield part
+
+	@track("rag", model_from_args=False)
+	def query(self, text):
+		return [text]
+
+class TestMetrics(unittest.IsolatedAsyncioTestCase):
+	def setUp(self):
+		# Reset singleton between tests
+		Metrics._instance = None
+		self.metrics = Metrics()
+		self.backend = Backend()
+
+	def test_track_counts_ok_and_error_results(self):
+		self.assertEqual(self.backend.complete("m1", "hi"), "HI")
+		self.backend.complete("m1", "fail")
+		self.backend.complete(model="m1", prompt="hi")
+
+		requests = self.metrics.requests
+		self.assertEqual(requests.get(backend="fake", model="m1", method="complete", status="ok"), 2)
+		self.assertEqual(requests.get(backend="fake", model="m1", method="complete", status="error"), 1)
+		_, cumulative, _, count = self.metrics.latency.items()[0]
+		self.assertEqual(count, 3)
+		self.assertEqual(cumulative[-1], 3)
+
+	async def test_track_async_records_exceptions(self):
+		await self.backend.complete_async("m2", "ok")
+		with self.assertRaises(RuntimeError):
+			await self.backend.complete_async("m2", "raise")
+
+		requests = self.metrics.requests
+		self.assertEqual(requests.get(backend="fake", model="m2", method="complete_async", status="ok"), 1)
+		self.assertEqual(requests.get(backend="fake", model="m2", method="complete_async", status="error"), 1)
+
+	async def test_track_stream_marks_error_deltas(self):
+		parts = [part async for part in self.backend.stream("m3", ["a", "b"])]
+		[part async for part in self.backend.stream("m3", ["a", "Error: lost"])]
+
+		self.assertEqual(parts, ["a", "b"])
+		requests = self.metrics.requests
+		self.assertEqual(requests.get(backend="fake", model="m3", method="stream", status="ok"), 1)
+		self.assertEqual(requests.get(backend="fake", model="m3", method="stream", status="error"), 1)
+
+	def test_model_label_from_instance(self):
+		self.backend.query("question")
+
+		self.assertEqual(self.metrics.requests.get(backend="rag", model="embedder", method="query", status="ok"), 1)
+
+	def test_render_prometheus_text(self):
+		self.backend.complete("gpt-4o", "hi")
+		self.metrics.record_tokens("fake", "gpt-4o", 12, 3)
+		self.metrics.record_tokens("fake", "gpt-4o", None, "n/a")
+
+		text = self.metrics.render()
+
+		self.assertIn("# TYPE bot_requests_total counter", text)
+		self.assertIn('bot_requests_total{backend="fake",model="gpt-4o",method="complete",status="ok"} 1', text)
+		self.assertIn('bot_request_duration_seconds_bucket{backend="fake",model="gpt-4o",method="complete",le="+Inf"} 1', text)
+		self.assertIn('bot_request_duration_seconds_count{backend="fake",model="gpt-4o",method="complete"} 1', text)
+		self.assertIn('bot_tokens_total{backend="fake",model="gpt-4o",direction="in"} 12', text)
+		self.assertIn('bot_tokens_total{backend="fake",model="gpt-4o",direction="out"} 3', text)
+
+	def test_histogram_quantiles_interpolate(self):
+		histogram = Histogram("h", "test", buckets=(0.1, 0.2, 0.4))
+		for value in (0.05, 0.15, 0.15, 0.3):
+			histogram.observe(value)
+		_, cumulative, total, count = histogram.items()[0]
+
+		self.assertEqual(cumulative, [1, 3, 4, 4])
+		self.assertAlmostEqual(histogram.quantile(0.5, cumulative), 0.15)
+		self.assertAlmostEqual(histogram.quantile(0.99, cumulative), 0.392)
+		self.assertAlmostEqual(total, 0.65)
+
+	def test_summary_groups_by_backend_and_model(self):
+		self.backend.complete("m1", "hi")
+		self.backend.complete("m1", "fail")
+		self.metrics.record_tokens("fake", "m1", 10, 4)
+
+		summary = self.metrics.summary()
+
+		self.assertEqual(len(summary), 1)
+		row = summary[0]
+		self.assertEqual((row["backend"], row["model"]), ("fake", "m1"))
+		self.assertEqual((row["calls"], row["errors"]), (2, 1))
+		self.assertEqual((row["tokens_in"], row["tokens_out"]), (10, 4))
+		self.assertGreater(row["p99_ms"], 0)
+
+	def test_registering_conflicting_type_raises(self):
+		self.metrics.counter("dup", "a counter")
+		with self.assertRaises(ValueError):
+			self.metrics.histogram("dup", "a histogram")
+
+	async def test_metrics_server_port_in_use_raises_on_start(self):
+		taken = socket.socket()
+		taken.bind(("127.0.0.1", 0))
+		taken.listen()
+		try:
+			server = MetricsServer(port=taken.getsockname()[1])
+			with self.assertRaises(OSError):
+				server.start()
+			self.assertIsNone(server.task)
+		finally:
+			taken.close()
+
+	async def test_metrics_server_serves_and_stops(self):
+		server = MetricsServer(port=0)
+		server.start()
+		port = server.socket.getsockname()[1]
+		while not server.server.started:
+			await asyncio.sleep(0.01)
+		reader, writer = await asyncio.open_connection("127.0.0.1", port)
+		writer.write(b"GET /metrics HTTP/1.1\r\nHost: localhost\r\nConnection: close\r\n\r\n")
+		response = await reader.read()
+		writer.close()
+		self.assertTrue(response.startswith(b"HTTP/1.1 200"))
+		await server.stop()
+		self.assertIsNone(server.task)
+
+if __name__ == "__main__":
+	unittest.main()
@@ -1,17 +1,26 @@
+import asyncio
+import shutil
+import tempfile
 import unittest
 from unittest.mock import patch, MagicMock
 import numpy as np
-from utils.rag import Rag
+from utils.chunker import Chunker
+from utils.rag import Rag, embedding_identity, load_embedder
+from utils.vector_store import MemmapVectorStore
 
 class TestRag(unittest.TestCase):
 	def setUp(self):
 		# Patch dependencies
 		self.patcher_embedder = patch("utils.rag.SentenceTransformer")
-		self.patcher_client = patch("utils.rag.chromadb.PersistentClient")
+		self.patcher_chromadb = patch("utils.rag.chromadb")
+		self.patcher_settings = patch("utils.rag.Settings")
 		self.mock_embedder_cls = self.patcher_embedder.start()
-		self.mock_client_cls = self.patcher_client.start()
+		self.mock_chromadb = self.patcher_chromadb.start()
+		self.patcher_settings.start()
+		self.mock_client_cls = self.mock_chromadb.PersistentClient
 		self.addCleanup(self.patcher_embedder.stop)
-		self.addCleanup(self.patcher_client.stop)
+		self.addCleanup(self.patcher_chromadb.stop)
+		self.addCleanup(self.patcher_settings.stop)
 
 		# Mock embedder and client/collection
 		self.mock_embedder = MagicMock()
@@ -30,6 +39,46 @@ class TestRag(unittest.TestCase):
 		rag2 = Rag()
 		self.assertIs(self.rag, rag2)
 
+	def test_initialization_is_lazy(self):
+		self.assertFalse(self.rag.ready)
+		self.mock_embedder_cls.assert_not_called()
+		self.mock_client_cls.assert_not_called()
+
+		self.rag.delete_document_by_id("doc123")
+
+		self.assertTrue(self.rag.ready)
+		self.mock_embedder_cls.assert_called_once_with("all-MiniLM-L6-v2")
+		self.assertIn("model", self.rag.timings)
+		self.assertIn("store", self.rag.timings)
+
+	def test_embedding_backends(self):
+		load_embedder("model", "onnx", "onnx/model_qint8_avx512.onnx")
+		self.mock_embedder_cls.assert_called_with("model", backend="onnx", model_kwargs={"file_name": "onnx/model_qint8_avx512.onnx"})
+
+		with patch("torch.ao.quantization.quantize_dynamic") as mock_quantize:
+			model = load_embedder("model", "torch-int8")
+		self.mock_embedder_cls.assert_called_with("model", device="cpu")
+		self.assertIs(model, mock_quantize.return_value)
+		self.assertIs(mock_quantize.call_args.args[0], self.mock_embedder)
+
+		with self.assertRaises(ValueError):
+			load_embedder("model", "tensorflow")
+
+	def test_initialize_async_loads_once(self):
+		async def run():
+			return await asyncio.gather(self.rag.initialize_async(), self.rag.wait_ready())
+
+		self.assertEqual(asyncio.run(run()), [True, True])
+		self.mock_embedder_cls.assert_called_once()
+		self.mock_client_cls.assert_called_once()
+
+	def test_initialization_failure_is_reported(self):
+		self.mock_embedder_cls.side_effect = Exception("model download failed")
+
+		self.assertFalse(asyncio.run(self.rag.wait_ready()))
+		self.assertEqual(self.rag.query_top_documents("query"), [])
+		self.assertFalse(self.rag.ready)
+
 	def test_add_document_success(self):
 		text = "some document text"
 		embedding = np.array([0.1, 0.2, 0.3])
@@ -50,6 +99,61 @@ class TestRag(unittest.TestCase):
 		self.assertIsNone(result)
 		self.mock_collection.add.assert_not_called()
 
+	def test_add_documents_batches_encoding_and_writes(self):
+		self.mock_embedder.encode.side_effect = lambda texts: np.ones((len(texts), 3))
+		self.rag.write_batch_size = 4
+		texts = (f"doc {i}" for i in range(10))
+		ids = (f"id{i}" for i in range(10))
+
+		written = self.rag.add_documents(texts, ids=ids, batch_size=2)
+
+		self.assertEqual(written, 10)
+		# 10 docs written in chunks of 4, each chunk encoded 2 at a time
+		self.assertEqual(self.mock_collection.add.call_count, 3)
+		self.assertEqual(self.mock_embedder.encode.call_count, 5)
+		_, kwargs = self.mock_collection.add.call_args_list[0]
+		self.assertEqual(kwargs["ids"], ["id0", "id1", "id2", "id3"])
+		self.assertEqual(kwargs["metadatas"][0]["id"], "id0")
+		self.assertEqual(kwargs["metadatas"][0]["content_hash"], Rag.content_id("doc 0"))
+		self.assertEqual(len(kwargs["embeddings"]), 4)
+
+	def test_upsert_documents_uses_upsert(self):
+		self.mock_embedder.encode.side_effect = lambda texts: np.ones((len(texts), 3))
+
+		written = self.rag.upsert_documents(["a", "b"], ids=["1", "2"], metadatas=[{"guild": "g"}, None])
+
+		self.assertEqual(written, 2)
+		self.mock_collection.add.assert_not_called()
+		_, kwargs = self.mock_collection.upsert.call_args
+		self.assertEqual(kwargs["metadatas"][0]["guild"], "g")
+		self.assertEqual([metadata["id"] for metadata in kwargs["metadatas"]], ["1", "2"])
+
+	def test_upsert_documents_skips_unchanged(self):
+		self.mock_embedder.encode.side_effect = lambda texts: np.ones((len(texts), 3))
+		stored_same = self.rag._build_metadata("1", "same", None)
+		stored_retagged = self.rag._build_metadata("2", "retagged", None)
+		stored_old = self.rag._build_metadata("3", "old text", None)
+		self.mock_collection.get.return_value = {"ids": ["1", "2", "3"], "metadatas": [stored_same, stored_retagged, stored_old]}
+
+		written = self.rag.upsert_documents(["same", "retagged", "new text"], ids=["1", "2", "3"], metadatas=[None, {"guild": "g"}, None])
+
+		self.assertEqual(written, 1)
+		self.mock_embedder.encode.assert_called_once_with(["new text"])
+		_, kwargs = self.mock_collection.upsert.call_args
+		self.assertEqual(kwargs["ids"], ["3"])
+		_, kwargs = self.mock_collection.update.call_args
+		self.assertEqual(kwargs["ids"], ["2"])
+		self.assertEqual(kwargs["metadatas"][0]["guild"], "g")
+
+	def test_add_documents_skips_failed_batch(self):
+		self.mock_embedder.encode.side_effect = [Exception("oom"), np.ones((1, 3))]
+		self.rag.write_batch_size = 1
+
+		written = self.rag.add_documents(["a", "b"], ids=["1", "2"])
+
+		self.assertEqual(written, 1)
+		self.mock_collection.add.assert_called_once()
+
 	def test_update_document_success(self):
 		doc_id = "123"
 		new_text = "updated text"
@@ -65,6 +169,25 @@ class TestRag(unittest.TestCase):
 		self.assertIn(embedding.tolist(), kwargs['embeddings'])
 		self.assertIn(doc_id, kwargs['ids'])
 
+	def test_update_document_skips_unchanged_text(self):
+		self.mock_collection.get.return_value = {"ids": ["123"], "metadatas": [self.rag._build_metadata("123", "same text", None)]}
+
+		self.rag.update_document("123", "same text")
+
+		self.mock_embedder.encode.assert_not_called()
+		self.mock_collection.delete.assert_not_called()
+		self.mock_collection.add.assert_not_called()
+		self.mock_collection.update.assert_not_called()
+
+	def test_add_document_uses_stable_content_id(self):
+		self.mock_embedder.encode.return_value = [np.array([0.1])]
+
+		self.rag.add_document("hello")
+
+		_, kwargs = self.mock_collection.add.call_args
+		self.assertEqual(kwargs["ids"], [Rag.content_id("hello")])
+		self.assertEqual(Rag.content_id("hello"), "2cf24dba5fb0a30e26e83b2ac5b9e29e1b161e5c1fa7425e73043362938b9824")
+
 	def test_update_document_embedding_exception(self):
 		self.mock_embedder.encode.side_effect = Exception("embedding error")
 		result = self.rag.update_document("123", "text")
@@ -92,9 +215,143 @@ class TestRag(unittest.TestCase):
 		results = self.rag.query_top_documents(query, top_k=3)
 
 		self.mock_embedder.encode.assert_called_once_with([query])
-		self.mock_collection.query.assert_called_once_with(query_embeddings=[embedding.tolist()], n_results=3)
+		# Hybrid search over-fetches RAG_HYBRID_CANDIDATES vector results for fusion
+		self.mock_collection.query.assert_called_once_with(query_embeddings=[embedding.tolist()], n_results=20)
 		self.assertEqual(results, expected_docs)
 
+	def test_hybrid_query_fuses_keyword_hits(self):
+		self.mock_embedder.encode.side_effect = lambda texts: np.ones((len(texts), 2))
+		self.mock_collection.get.return_value = {"ids": [], "documents": [], "metadatas": []}
+		self.rag.add_documents(["deploy failed with E1234 on shard 3", "how to restart the bot", "shard status overview"], ids=["err", "restart", "status"])
+		self.assertTrue(self.rag._build_lexical())
+		self.mock_collection.query.return_value = {"ids": [["restart", "status"]], "documents": [["how to restart the bot", "shard status overview"]]}
+		self.mock_collection.get.return_value = {"ids": ["err"], "documents": ["deploy failed with E1234 on shard 3"]}
+
+		results = self.rag.query_top_documents("what does e1234 mean", top_k=2)
+
+		# Only the lexical index knows the error code; it displaces the second vector hit
+		self.assertCountEqual(results, ["deploy failed with E1234 on shard 3", "how to restart the bot"])
+		self.mock_collection.get.assert_called_with(ids=["err"], include=["documents", "metadatas"])
+
+	def test_query_filters_are_pushed_down(self):
+		self.mock_embedder.encode.side_effect = lambda texts: np.ones((len(texts), 2))
+		self.mock_collection.get.return_value = {"ids": [], "documents": [], "metadatas": []}
+		self.rag.add_documents(["!ping answers pong", "!ping is slow today"], ids=["a", "b"], metadatas=[{"guild_id": 1, "channel_id": 5}, {"guild_id": 2}])
+		self.mock_collection.query.return_value = {"ids": [["a"]], "documents": [["!ping answers pong"]]}
+
+		results = self.rag.query_top_documents("ping", where={"guild_id": 1, "channel_id": 5})
+
+		self.assertEqual(results, ["!ping answers pong"])
+		_, kwargs = self.mock_collection.query.call_args
+		self.assertEqual(kwargs["where"], {"$and": [{"guild_id": 1}, {"channel_id": 5}]})
+
+	def test_lexical_index_follows_writes(self):
+		self.mock_embedder.encode.side_effect = lambda texts: np.ones((len(texts), 2))
+		self.mock_collection.get.side_effect = [
+			{"ids": ["old"], "documents": ["stored before startup"], "metadatas": [{}]},
+			{"ids": []},
+		]
+
+		self.assertTrue(self.rag._ensure_ready())
+		self.assertTrue(self.rag._build_lexical())
+		self.rag.add_document("fresh document", doc_id="new")
+		self.rag.delete_document_by_id("old")
+
+		self.assertEqual(self.rag._lexical_search("stored"), [])
+		self.assertEqual(self.rag._lexical_search("fresh"), ["new"])
+
+	def test_lexical_index_is_built_in_the_background(self):
+		self.mock_embedder.encode.side_effect = lambda texts: np.ones((len(texts), 2))
+		self.mock_collection.get.return_value = {"ids": ["doc"], "documents": ["error E77 in the ticket bot"], "metadatas": [{}]}
+		self.mock_collection.query.return_value = {"ids": [[]], "documents": [[]]}
+
+		self.assertTrue(asyncio.run(self.rag.initialize_async()))
+
+		self.assertTrue(self.rag._lexical_ready.wait(5))
+		self.assertEqual(self.rag._lexical_search("e77"), ["doc"])
+
+	def test_failed_lexical_build_backs_off(self):
+		self.mock_collection.get.side_effect = Exception("get error")
+		self.assertTrue(self.rag._ensure_ready())
+
+		self.assertFalse(self.rag._build_lexical())
+		with patch("utils.rag.threading.Thread") as mock_thread:
+			self.assertEqual(self.rag._lexical_search("anything"), [])
+			mock_thread.assert_not_called()
+			self.rag._lexical_failed_at -= self.rag.lexical_retry
+			self.rag._lexical_search("anything")
+			mock_thread.assert_called_once()
+
+	def test_delete_during_lexical_build_is_not_undone(self):
+		self.mock_embedder.encode.side_effect = lambda texts: np.ones((len(texts), 2))
+		self.assertTrue(self.rag._ensure_ready())
+		stale_page = {"ids": ["gone"], "documents": ["deleted while the build ran"], "metadatas": [{}]}
+
+		def scan(include, page_size=None):
+			# The page is read, then the document is deleted before it is indexed
+			self.mock_collection.get.return_value = {"ids": []}
+			self.rag.delete_document_by_id("gone")
+			yield stale_page
+
+		with patch.object(self.rag, "_scan", scan):
+			self.assertTrue(self.rag._build_lexical())
+
+		self.assertEqual(self.rag._lexical_search("deleted"), [])
+
+	def test_query_async_falls_back_to_lexical_over_budget(self):
+		self.mock_embedder.encode.side_effect = lambda texts: np.ones((len(texts), 2))
+		self.mock_collection.get.return_value = {"ids": [], "documents": [], "metadatas": []}
+		self.rag.add_documents(["user#4242 reported the outage"], ids=["report"])
+		self.assertTrue(self.rag._build_lexical())
+		self.mock_collection.get.return_value = {"ids": ["report"], "documents": ["user#4242 reported the outage"]}
+		self.rag.query_budget = 0.01
+
+		async def slow_search(query, top_k, where=None):
+			await asyncio.sleep(0.2)
+			return [("other", "unrelated", None)]
+
+		with patch.object(self.rag, "_vector_search_async", slow_search):
+			results = asyncio.run(self.rag.query_top_documents_async("who is user#4242"))
+
+		self.assertEqual(results, ["user#4242 reported the outage"])
+		self.assertEqual(self.rag.over_budget.get(), 1)
+
+	def test_query_embeddings_are_cached_by_normalized_text(self):
+		embedding = np.array([0.7, 0.8])
+		self.mock_embedder.encode.return_value = [embedding]
+		self.mock_embedder.tokenizer.do_lower_case = True
+		self.mock_collection.query.return_value = {'documents': [["doc1"]]}
+
+		self.rag.query_top_documents("Hello  there")
+		self.rag.query_top_documents(" hello there ")
+
+		self.mock_embedder.encode.assert_called_once_with(["Hello  there"])
+		self.assertEqual(self.mock_collection.query.call_count, 2)
+		stats = self.rag.embedding_cache_stats()
+		self.assertEqual(stats["hits"], 1)
+		self.assertEqual(stats["misses"], 1)
+
+	def test_cased_tokenizer_keeps_case_in_cache_key(self):
+		self.mock_embedder.encode.side_effect = lambda texts: np.ones((len(texts), 2))
+		self.mock_embedder.tokenizer.do_lower_case = False
+		self.mock_collection.query.return_value = {'documents': [["doc1"]]}
+
+		self.rag.query_top_documents("Hello  there")
+		self.rag.query_top_documents("Hello there")
+		self.rag.query_top_documents("hello there")
+
+		self.assertEqual([call.args[0] for call in self.mock_embedder.encode.call_args_list], [["Hello  there"], ["hello there"]])
+
+	def test_ingest_only_encodes_uncached_texts(self):
+		self.mock_embedder.encode.side_effect = lambda texts: np.ones((len(texts), 3))
+		self.rag.query_top_documents("known")
+
+		self.rag.add_documents(["known", "new", "new"], ids=["1", "2", "3"])
+
+		self.assertEqual(self.mock_embedder.encode.call_args_list[-1].args[0], ["new"])
+		_, kwargs = self.mock_collection.add.call_args
+		self.assertEqual(len(kwargs["embeddings"]), 3)
+
 	def test_query_top_documents_embedding_exception(self):
 		self.mock_embedder.encode.side_effect = Exception("embedding error")
 		results = self.rag.query_top_documents("query")
@@ -108,6 +365,97 @@ class TestRag(unittest.TestCase):
 		results = self.rag.query_top_documents("query")
 		self.assertEqual(results, [])
 
+	def test_query_top_documents_async_batches_concurrent_queries(self):
+		self.mock_embedder.encode.side_effect = lambda texts: np.ones((len(texts), 2))
+		self.mock_collection.query.return_value = {'documents': [["doc1"]]}
+
+		async def run():
+			return await asyncio.gather(
+				self.rag.query_top_documents_async("first"),
+				self.rag.query_top_documents_async("second"),
+				self.rag.query_top_documents_async("third")
+			)
+
+		results = asyncio.run(run())
+
+		self.assertEqual(results, [["doc1"]] * 3)
+		self.mock_embedder.encode.assert_called_once()
+		self.assertCountEqual(self.mock_embedder.encode.call_args.args[0], ["first", "second", "third"])
+		self.assertEqual(self.mock_collection.query.call_count, 3)
+
+	def test_query_top_documents_async_coalesces_identical_queries(self):
+		self.mock_embedder.encode.side_effect = lambda texts: np.ones((len(texts), 2))
+		self.mock_collection.query.return_value = {'documents': [["doc1"]]}
+
+		async def run():
+			return await asyncio.gather(*(self.rag.query_top_documents_async("viral") for _ in range(4)))
+
+		results = asyncio.run(run())
+
+		self.assertEqual(results, [["doc1"]] * 4)
+		self.assertEqual(self.mock_collection.query.call_count, 1)
+
+	def test_query_top_documents_async_coalesces_operator_filters(self):
+		self.mock_embedder.encode.side_effect = lambda texts: np.ones((len(texts), 2))
+		self.mock_collection.query.return_value = {'documents': [["doc1"]]}
+		where = {"guild_id": 1, "channel_id": {"$in": [2, 3]}}
+		reordered = {"channel_id": {"$in": [2, 3]}, "guild_id": 1}
+
+		async def run():
+			return await asyncio.gather(
+				self.rag.query_top_documents_async("viral", where=where),
+				self.rag.query_top_documents_async("viral", where=reordered),
+				self.rag.query_top_documents_async("viral", where={"$and": [{"guild_id": 1}, {"channel_id": 2}]})
+			)
+
+		results = asyncio.run(run())
+
+		self.assertEqual(results, [["doc1"]] * 3)
+		self.assertEqual(self.mock_collection.query.call_count, 2)
+
+	def test_query_top_documents_async_embedding_exception(self):
+		self.mock_embedder.encode.side_effect = Exception("embedding error")
+		results = asyncio.run(self.rag.query_top_documents_async("query"))
+		self.assertEqual(results, [])
+
+	def test_add_document_async(self):
+		embedding = np.array([0.1, 0.2])
+		self.mock_embedder.encode.return_value = [embedding]
+
+		asyncio.run(self.rag.add_document_async("async text", doc_id="a1"))
+
+		_, kwargs = self.mock_collection.add.call_args
+		self.assertEqual(kwargs["ids"], ["a1"])
+
+	def test_reindex_documents_only_reembeds_stale(self):
+		self.mock_embedder.encode.side_effect = lambda texts: np.ones((len(texts), 2))
+		current = self.rag._build_metadata("a", "current text", None)
+		edited = self.rag._build_metadata("b", "original text", {"guild": "g"})
+		self.mock_collection.get.side_effect = [
+			{"ids": ["a", "b"], "documents": ["current text", "edited text"], "metadatas": [current, edited]},
+			{"ids": ["c"], "documents": ["legacy text"], "metadatas": [{"id": "c"}]},
+		]
+
+		stats = self.rag.reindex_documents(page_size=2)
+
+		self.assertEqual(stats, {"scanned": 3, "reembedded": 2})
+		self.assertEqual(self.mock_collection.get.call_args_list[1].kwargs["offset"], 2)
+		upserted = [call.kwargs["ids"] for call in self.mock_collection.upsert.call_args_list]
+		self.assertEqual(upserted, [["b"], ["c"]])
+		metadata = self.mock_collection.upsert.call_args_list[0].kwargs["metadatas"][0]
+		self.assertEqual(metadata["guild"], "g")
+		self.assertEqual(metadata["content_hash"], Rag.content_id("edited text"))
+
+	def test_changing_embedding_backend_triggers_reembedding(self):
+		stored = self.rag._build_metadata("a", "text", None)
+		self.assertEqual(stored["embedding_model"], "all-MiniLM-L6-v2")
+
+		self.rag.embedding_id = embedding_identity("all-MiniLM-L6-v2", "onnx", "onnx/model_qint8_avx512.onnx")
+
+		self.assertEqual(self.rag.embedding_id, "all-MiniLM-L6-v2:onnx:onnx/model_qint8_avx512.onnx")
+		self.assertFalse(self.rag._is_current(stored, self.rag._build_metadata("a", "text", None)))
+		self.assertEqual(embedding_identity("all-MiniLM-L6-v2", "torch-int8"), "all-MiniLM-L6-v2:torch-int8")
+
 	def test_delete_document_by_id_success(self):
 		self.rag.delete_document_by_id("doc123")
 		self.mock_collection.delete.assert_called_once_with(ids=["doc123"])
@@ -126,6 +474,65 @@ class TestRag(unittest.TestCase):
 
 		self.mock_collection.delete.assert_called_once_with(ids=["id3"])
 
+	def test_remove_duplicate_documents_pages_and_batches_deletes(self):
+		self.mock_collection.get.side_effect = [
+			{"ids": ["id1", "id2"], "documents": ["docA", "docB"]},
+			{"ids": ["id3", "id4"], "documents": ["docA", "docB"]},
+			{"ids": ["id5"], "documents": ["docA"]},
+		]
+		self.mock_collection.count.return_value = 5
+		self.rag.write_batch_size = 2
+		progress = MagicMock()
+
+		removed = self.rag.remove_duplicate_documents(page_size=2, progress=progress)
+
+		self.assertEqual(removed, 3)
+		offsets = [call.kwargs["offset"] for call in self.mock_collection.get.call_args_list]
+		self.assertEqual(offsets, [0, 2, 4])
+		deleted = [doc_id for call in self.mock_collection.delete.call_args_list for doc_id in call.kwargs["ids"]]
+		self.assertCountEqual(deleted, ["id3", "id4", "id5"])
+		self.assertEqual(self.mock_collection.delete.call_count, 2)
+		progress.assert_called_with(5, 5, 3)
+
+	def test_remove_near_duplicate_documents(self):
+		self.mock_collection.get.return_value = {
+			"ids": ["id1", "id2", "id3"],
+			"documents": ["hello there", "hello there!", "something else"],
+			"embeddings": [[1.0, 0.0], [0.99, 0.01], [0.0, 1.0]],
+		}
+		self.mock_collection.query.return_value = {
+			"ids": [["id1", "id2"], ["id2", "id1"], ["id3", "id1"]],
+			"embeddings": [[[1.0, 0.0], [0.99, 0.01]], [[0.99, 0.01], [1.0, 0.0]], [[0.0, 1.0], [1.0, 0.0]]],
+		}
+
+		removed = self.rag.remove_duplicate_documents(near_duplicates=True, threshold=0.95)
+
+		self.assertEqual(removed, 1)
+		self.mock_collection.delete.assert_called_once_with(ids=["id2"])
+
+	def test_remove_duplicates_treats_chunks_by_parent(self):
+		chunk = lambda parent, parent_hash, index: {"parent_id": parent, "parent_hash": parent_hash, "chunk_index": index}
+		self.mock_collection.get.side_effect = [
+			{
+				"ids": ["a:0", "a:1", "b:0", "b:1", "c:0", "c:1", "whole"],
+				"documents": ["Shared intro.", "Part one.", "Shared intro.", "Part two.", "Shared intro.", "Part one.", "Part one."],
+				"metadatas": [chunk("a", "ha", 0), chunk("a", "ha", 1), chunk("b", "hb", 0), chunk("b", "hb", 1), chunk("c", "ha", 0), chunk("c", "ha", 1), {}],
+				"embeddings": [[1.0, 0.0]] * 7,
+			},
+			{"ids": []},
+		]
+		self.mock_collection.query.return_value = {
+			"ids": [["whole", "a:1"]],
+			"embeddings": [[[1.0, 0.0], [1.0, 0.0]]],
+			"metadatas": [[{}, chunk("a", "ha", 1)]],
+		}
+
+		removed = self.rag.remove_duplicate_documents(near_duplicates=True, threshold=0.95, page_size=7)
+
+		# c repeats a whole, so both its chunks go; b's shared chunk and the chunk-equal whole document stay
+		self.assertEqual(removed, 2)
+		self.assertCountEqual(self.mock_collection.delete.call_args.kwargs["ids"], ["c:0", "c:1"])
+
 	def test_remove_duplicate_documents_get_exception(self):
 		self.mock_collection.get.side_effect = Exception("get error")
 		self.rag.remove_duplicate_documents()
@@ -136,6 +543,99 @@ class TestRag(unittest.TestCase):
 		self.rag.remove_duplicate_documents()
 		self.mock_collection.delete.assert_not_called()
 
+	def _use_small_chunks(self):
+		self.mock_embedder.tokenizer.tokenize.side_effect = str.split
+		self.mock_embedder.encode.side_effect = lambda texts: np.ones((len(texts), 2))
+		self.rag.chunker = Chunker(max_tokens=4, overlap=2, count=self.rag._count_tokens)
+
+	def test_long_document_is_chunked(self):
+		self._use_small_chunks()
+		self.rag.add_document("One two. Three four. Five six.", doc_id="doc", metadata={"guild_id": 1})
+
+		_, kwargs = self.mock_collection.add.call_args
+		self.assertEqual(kwargs["ids"], ["doc:0", "doc:1"])
+		self.assertEqual(kwargs["documents"], ["One two. Three four.", "Three four. Five six."])
+		metadata = kwargs["metadatas"][1]
+		self.assertEqual(metadata["parent_id"], "doc")
+		self.assertEqual((metadata["chunk_index"], metadata["chunk_count"]), (1, 2))
+		self.assertEqual((metadata["chunk_start"], metadata["chunk_end"]), (9, 30))
+		self.assertEqual(metadata["guild_id"], 1)
+
+	def test_upsert_deletes_stale_chunks(self):
+		self._use_small_chunks()
+		text = "One two. Three four. Five six."
+		self.mock_collection.get.side_effect = [
+			{"ids": [], "metadatas": []},
+			{"ids": ["doc:0", "doc:1", "doc:2"], "metadatas": [
+				{"parent_id": "doc", "parent_hash": Rag.content_id(text)},
+				{"parent_id": "doc", "parent_hash": Rag.content_id(text)},
+				{"parent_id": "doc", "parent_hash": "old"},
+			]},
+		]
+
+		written = self.rag.upsert_documents([text], ids=["doc"])
+
+		self.assertEqual(written, 2)
+		# The third chunk of the longer old version, and the unchunked original
+		self.mock_collection.delete.assert_called_once_with(ids=["doc:2", "doc"])
+
+	def test_delete_document_removes_chunks(self):
+		self.mock_collection.get.return_value = {"ids": ["doc:0", "doc:1"]}
+
+		self.rag.delete_document_by_id("doc")
+
+		self.mock_collection.delete.assert_called_once_with(ids=["doc", "doc:0", "doc:1"])
+
+	def test_get_document_by_id_stitches_chunks(self):
+		self.mock_collection.get.side_effect = [
+			{"documents": []},
+			{"documents": ["Three four. Five six.", "One two. Three four."], "metadatas": [
+				{"chunk_start": 9, "chunk_end": 30}, {"chunk_start": 0, "chunk_end": 20},
+			]},
+		]
+
+		self.assertEqual(self.rag.get_document_by_id("doc"), "One two. Three four. Five six.")
+
+	def test_query_merges_neighbouring_chunks_within_budget(self):
+		self._use_small_chunks()
+		self.rag.hybrid = False
+		chunk = lambda index, start, end: {"parent_id": "doc", "chunk_index": index, "chunk_start": start, "chunk_end": end}
+		self.mock_collection.query.return_value = {
+			"ids": [["doc:1", "doc:2", "other"]],
+			"documents": [["Three four. Five six.", "Five six. Seven eight.", "short note"]],
+			"metadatas": [[chunk(1, 9, 30), chunk(2, 21, 43), {}]],
+		}
+		self.mock_collection.get.return_value = {
+			"documents": ["One two. Three four.", "Five six. Seven eight."],
+			"metadatas": [chunk(0, 0, 20), chunk(2, 21, 43)],
+		}
+
+		results = self.rag.query_top_documents("four", top_k=3, max_tokens=10)
+
+		# doc:1 grows into doc:0..doc:2 (8 tokens), so the doc:2 hit is already
+		# covered, and the 2-token note fills the budget
+		self.assertEqual(results, ["One two. Three four. Five six. Seven eight.", "short note"])
+		self.assertEqual(self.rag.query_top_documents("four", top_k=3, max_tokens=7), ["One two. Three four. Five six."])
+		where = self.mock_collection.get.call_args.kwargs["where"]
+		self.assertEqual(where, {"$and": [{"parent_id": "doc"}, {"chunk_index": {"$in": [0, 2]}}]})
+
+	def test_memmap_vector_store_skips_chromadb(self):
+		path = tempfile.mkdtemp()
+		self.addCleanup(shutil.rmtree, path)
+		settings = {"RAG_MEMMAP_PATH": path, "RAG_MEMMAP_DTYPE": "int8"}
+		self.rag.vector_store = "memmap"
+		self.mock_embedder.encode.side_effect = lambda texts: np.array([[len(text), 1.0] for text in texts])
+
+		with patch.object(self.rag.cfg, "get_variable", side_effect=lambda key, default=None: settings.get(key, default)):
+			self.rag.add_documents(["a", "bbbbbbbb"], ids=["short", "long"], metadatas=[{"guild_id": 1}, {"guild_id": 2}])
+
+		self.mock_client_cls.assert_not_called()
+		self.assertIsInstance(self.rag.collection, MemmapVectorStore)
+		self.assertEqual(self.rag.collection.dtype, "int8")
+		self.assertEqual(self.rag.query_top_documents("zzzzzzzzz", top_k=1), ["bbbbbbbb"])
+		self.assertEqual(self.rag.query_top_documents("zzzzzzzzz", top_k=1, where={"guild_id": 1}), ["a"])
+		self.rag.close()
+
 	def test_get_document_by_id_success(self):
 		self.mock_collection.get.return_value = {"documents": ["some text"]}
 		result = self.rag.get_document_by_id("doc1")
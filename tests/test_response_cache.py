@@ -0,0 +1,71 @@
+import unittest
+from unittest.mock import patch, AsyncMock
+from utils.response_cache import ResponseCache, SELECT_RESPONSE, UPSERT_RESPONSE
+
+class TestResponseCache(unittest.IsolatedAsyncioTestCase):
+	def setUp(self):
+		self.patcher_config = patch("utils.response_cache.Config")
+		self.mock_config_cls = self.patcher_config.start()
+		self.addCleanup(self.patcher_config.stop)
+		self.settings = {"RESPONSE_CACHE_DB": True, "RESPONSE_CACHE_TTL": 60, "RESPONSE_CACHE_PRUNE_EVERY": 2}
+		self.mock_config_cls.return_value.get_variable.side_effect = lambda key, default=None: self.settings.get(key, default)
+
+		# Reset singleton between tests
+		ResponseCache._instance = None
+		self.cache = ResponseCache()
+		self.messages = [{"role": "user", "content": "lol"}]
+
+	def test_key_depends_on_model_messages_and_params(self):
+		key = self.cache.key("m", self.messages)
+
+		self.assertEqual(key, self.cache.key("m", [{"content": "lol", "role": "user"}]))
+		self.assertNotEqual(key, self.cache.key("other", self.messages))
+		self.assertNotEqual(key, self.cache.key("m", self.messages, {"temperature": 0}))
+
+	async def test_memory_tier_round_trip(self):
+		self.assertIsNone(await self.cache.get("site", "m", self.messages))
+		await self.cache.set("m", self.messages, "laughing")
+
+		self.assertEqual(await self.cache.get("site", "m", self.messages), "laughing")
+		self.assertEqual(self.cache.stats()["sites"]["site"], {"memory_hits": 1, "db_hits": 0, "misses": 1, "hit_rate": 0.5})
+
+	async def test_database_tier_fills_memory(self):
+		db = AsyncMock()
+		db.run_script_async.return_value = [("from db",)]
+		self.cache.attach_database(db)
+
+		self.assertEqual(await self.cache.get("site", "m", self.messages), "from db")
+		self.assertEqual(await self.cache.get("site", "m", self.messages), "from db")
+
+		db.run_script_async.assert_awaited_once_with(SELECT_RESPONSE, (self.cache.key("m", self.messages),))
+		counts = self.cache.stats()["sites"]["site"]
+		self.assertEqual((counts["db_hits"], counts["memory_hits"]), (1, 1))
+
+	async def test_writes_go_to_database_and_prune_periodically(self):
+		db = AsyncMock()
+		db.run_script_async.return_value = 1
+		self.cache.attach_database(db)
+
+		await self.cache.set("m", self.messages, "a")
+		await self.cache.set("m", [{"role": "user", "content": "hi"}], "b")
+		await self.cache.close()
+
+		scripts = [c.args[0] for c in db.run_script_async.await_args_list]
+		self.assertEqual(scripts.count(UPSERT_RESPONSE), 2)
+		self.assertEqual(len(scripts), 4)
+		self.assertEqual(db.run_script_async.await_args_list[0].args[1], (self.cache.key("m", self.messages), "m", "a", 60))
+
+	async def test_database_tier_is_opt_in(self):
+		self.settings["RESPONSE_CACHE_DB"] = False
+		ResponseCache._instance = None
+		cache = ResponseCache()
+		db = AsyncMock()
+		cache.attach_database(db)
+
+		await cache.set("m", self.messages, "a")
+		await cache.get("site", "other", self.messages)
+
+		db.run_script_async.assert_not_awaited()
+
+if __name__ == "__main__":
+	unittest.main()
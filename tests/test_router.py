@@ -0,0 +1,134 @@
+import asyncio
+import unittest
+from unittest.mock import patch, AsyncMock
+from utils.router import BackendRouter, CircuitBreaker
+
+class HttpError(Exception):
+	def __init__(self, status):
+		super().__init__(f"HTTP {status}")
+		self.status = status
+
+class TestCircuitBreaker(unittest.TestCase):
+	def test_opens_after_threshold_and_half_opens_after_timeout(self):
+		breaker = CircuitBreaker(failure_threshold=2, reset_timeout=10)
+
+		self.assertFalse(breaker.record_failure())
+		self.assertTrue(breaker.record_failure())
+		self.assertFalse(breaker.allow())
+
+		with patch("utils.router.time.monotonic", return_value=breaker.opened_at + 11):
+			self.assertTrue(breaker.allow())
+			# Only one trial request while half-open
+			self.assertFalse(breaker.allow())
+		breaker.record_success()
+
+		self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+		self.assertTrue(breaker.allow())
+
+	def test_failed_trial_reopens(self):
+		breaker = CircuitBreaker(failure_threshold=1, reset_timeout=10)
+		breaker.record_failure()
+
+		with patch("utils.router.time.monotonic", return_value=breaker.opened_at + 11):
+			self.assertTrue(breaker.allow())
+			self.assertTrue(breaker.record_failure())
+			self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+
+class TestBackendRouter(unittest.IsolatedAsyncioTestCase):
+	def setUp(self):
+		self.patcher_config = patch("utils.router.Config")
+		self.mock_config_cls = self.patcher_config.start()
+		self.addCleanup(self.patcher_config.stop)
+		self.settings = {
+			"ROUTER_BACKENDS": [{"backend": "openai", "model": "gpt"}, {"backend": "ollama", "model": "llama"}],
+			"ROUTER_MAX_ATTEMPTS": 2,
+			"ROUTER_BACKOFF_BASE": 0,
+			"ROUTER_FAILURE_THRESHOLD": 2,
+			"ROUTER_SLOW_THRESHOLD": 1.0
+		}
+		self.mock_config_cls.return_value.get_variable.side_effect = lambda key, default=None: self.settings.get(key, default)
+
+		self.openai = AsyncMock(return_value="remote")
+		self.ollama = AsyncMock(return_value="local")
+		self.router = BackendRouter({"openai": self.openai, "ollama": self.ollama})
+		self.messages = [{"role": "user", "content": "hi"}]
+
+	async def test_uses_first_backend_in_priority_order(self):
+		self.assertEqual(await self.router.complete(self.messages), ("remote", "openai"))
+		self.openai.assert_awaited_once_with("gpt", self.messages)
+		self.ollama.assert_not_awaited()
+
+	async def test_retries_then_succeeds(self):
+		self.openai.side_effect = [ConnectionError("reset"), "remote"]
+
+		self.assertEqual(await self.router.complete(self.messages), ("remote", "openai"))
+		self.assertEqual(self.openai.await_count, 2)
+
+	async def test_falls_back_and_trips_breaker(self):
+		self.openai.side_effect = ConnectionError("down")
+
+		self.assertEqual(await self.router.complete(self.messages), ("local", "ollama"))
+		self.assertEqual(self.openai.await_count, 2)
+		self.assertEqual(self.router.backends[0].breaker.state, CircuitBreaker.OPEN)
+
+		# Open circuit: OpenAI is skipped entirely
+		await self.router.complete(self.messages)
+		self.assertEqual(self.openai.await_count, 2)
+		self.assertEqual(self.router.trips.get(backend="openai"), 1)
+
+	async def test_client_errors_are_not_retried(self):
+		self.openai.side_effect = HttpError(400)
+
+		self.assertEqual(await self.router.complete(self.messages), ("local", "ollama"))
+		self.assertEqual(self.openai.await_count, 1)
+		self.assertEqual(self.router.backends[0].breaker.state, CircuitBreaker.CLOSED)
+
+	async def test_client_error_leaves_breaker_state_alone(self):
+		breaker = self.router.backends[0].breaker
+		breaker.record_failure()
+		breaker.record_failure()
+		self.openai.side_effect = HttpError(400)
+
+		with patch("utils.router.time.monotonic", return_value=breaker.opened_at + 60):
+			self.assertEqual(await self.router.complete(self.messages), ("local", "ollama"))
+			# A rejected probe neither closes the circuit nor blocks the next probe
+			self.assertEqual((breaker.state, breaker.failures), (CircuitBreaker.HALF_OPEN, 2))
+			self.assertTrue(breaker.allow())
+
+	async def test_rate_limits_are_retried(self):
+		self.openai.side_effect = [HttpError(429), "remote"]
+
+		self.assertEqual(await self.router.complete(self.messages), ("remote", "openai"))
+
+	async def test_slow_backend_is_tried_last(self):
+		self.router._observe(self.router.backends[0], 5.0)
+
+		self.assertEqual(await self.router.complete(self.messages), ("local", "ollama"))
+		self.assertEqual([row["backend"] for row in self.router.status()], ["ollama", "openai"])
+
+		# Once the observation is stale the slow backend gets another chance
+		self.router.backends[0].observed_at -= 60
+		self.assertEqual(await self.router.complete(self.messages), ("remote", "openai"))
+
+	async def test_timeout_counts_as_failure(self):
+		self.settings["ROUTER_ATTEMPT_TIMEOUT"] = 0.01
+		self.settings["ROUTER_MAX_ATTEMPTS"] = 1
+
+		async def hang(model, messages):
+			await asyncio.sleep(1)
+
+		router = BackendRouter({"openai": hang, "ollama": self.ollama})
+
+		self.assertEqual(await router.complete(self.messages), ("local", "ollama"))
+		self.assertEqual(router.backends[0].breaker.failures, 1)
+
+	async def test_raises_last_error_when_all_fail(self):
+		self.openai.side_effect = ConnectionError("down")
+		self.ollama.side_effect = ConnectionError("also down")
+
+		with self.assertRaises(ConnectionError) as ctx:
+			await self.router.complete(self.messages)
+		self.assertEqual(str(ctx.exception), "also down")
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,150 @@
+import asyncio
+import unittest
+from unittest.mock import patch
+from utils.metrics import Metrics
+from utils.scheduler import TokenBucket, RateLimiter, RateLimited, FairScheduler, QueueFull, Admission, request_context, current_request
+
+class TestRateLimiting(unittest.TestCase):
+	def setUp(self):
+		# Reset metrics singleton so counters start at zero
+		Metrics._instance = None
+
+	def test_token_bucket_refills_over_time(self):
+		bucket = TokenBucket(rate=2.0, capacity=2)
+
+		self.assertEqual(bucket.acquire(now=bucket.updated), 0.0)
+		self.assertEqual(bucket.acquire(now=bucket.updated), 0.0)
+		self.assertAlmostEqual(bucket.acquire(now=bucket.updated), 0.5)
+		self.assertEqual(bucket.acquire(now=bucket.updated + 0.5), 0.0)
+
+	def test_user_and_guild_limits_are_separate(self):
+		limiter = RateLimiter(guild_rate=0.001, guild_burst=3, user_rate=0.001, user_burst=2)
+
+		limiter.check(guild_id=1, user_id=10)
+		limiter.check(guild_id=1, user_id=10)
+		with self.assertRaises(RateLimited) as ctx:
+			limiter.check(guild_id=1, user_id=10)
+		self.assertEqual(ctx.exception.scope, "user")
+
+		limiter.check(guild_id=1, user_id=11)
+		with self.assertRaises(RateLimited) as ctx:
+			limiter.check(guild_id=1, user_id=12)
+		self.assertEqual(ctx.exception.scope, "guild")
+		self.assertEqual(limiter.limited.get(scope="user"), 1)
+		self.assertEqual(limiter.limited.get(scope="guild"), 1)
+
+	def test_guild_rejection_does_not_charge_the_user(self):
+		limiter = RateLimiter(guild_rate=0.001, guild_burst=1, user_rate=0.001, user_burst=2)
+
+		limiter.check(guild_id=1, user_id=10)
+		with self.assertRaises(RateLimited) as ctx:
+			limiter.check(guild_id=1, user_id=11)
+		self.assertEqual(ctx.exception.scope, "guild")
+
+		limiter.check(guild_id=2, user_id=11)
+		limiter.check(guild_id=3, user_id=11)
+
+class TestFairScheduler(unittest.IsolatedAsyncioTestCase):
+	def setUp(self):
+		Metrics._instance = None
+
+	async def _grant_order(self, scheduler, requests):
+		"""Queue requests behind a held slot and return the order they are granted in."""
+		order = []
+		await scheduler.acquire("blocker")
+
+		async def request(guild_id, priority, name):
+			async with scheduler.slot(guild_id, priority):
+				order.append(name)
+
+		tasks = []
+		for guild_id, priority, name in requests:
+			tasks.append(asyncio.create_task(request(guild_id, priority, name)))
+			await asyncio.sleep(0)
+		scheduler.release()
+		await asyncio.gather(*tasks)
+		return order
+
+	async def test_round_robin_across_guilds(self):
+		scheduler = FairScheduler(max_concurrency=1)
+
+		order = await self._grant_order(scheduler, [("a", False, "a1"), ("a", False, "a2"), ("a", False, "a3"), ("b", False, "b1"), ("c", False, "c1")])
+
+		self.assertEqual(order, ["a1", "b1", "c1", "a2", "a3"])
+
+	async def test_weights_give_more_slots_per_turn(self):
+		scheduler = FairScheduler(max_concurrency=1, weights={"a": 2})
+
+		order = await self._grant_order(scheduler, [("a", False, "a1"), ("a", False, "a2"), ("a", False, "a3"), ("b", False, "b1"), ("b", False, "b2")])
+
+		self.assertEqual(order, ["a1", "a2", "b1", "a3", "b2"])
+
+	async def test_priority_requests_go_first(self):
+		scheduler = FairScheduler(max_concurrency=1)
+
+		order = await self._grant_order(scheduler, [("a", False, "a1"), ("b", False, "b1"), ("a", True, "admin")])
+
+		self.assertEqual(order, ["admin", "a1", "b1"])
+		self.assertEqual(scheduler.depth.get(queue="guild"), 0)
+		# The blocker got its slot without waiting, so it is observed too
+		_, _, _, count = [item for item in scheduler.wait.items() if item[0]["queue"] == "guild"][0]
+		self.assertEqual(count, 3)
+
+	async def test_queue_full_rejects(self):
+		scheduler = FairScheduler(max_concurrency=1, max_queue=1)
+		await scheduler.acquire("a")
+		waiter = asyncio.create_task(scheduler.acquire("a"))
+		await asyncio.sleep(0)
+
+		with self.assertRaises(QueueFull):
+			await scheduler.acquire("a")
+		waiter.cancel()
+
+	async def test_cancelled_waiter_is_skipped(self):
+		scheduler = FairScheduler(max_concurrency=1)
+		await scheduler.acquire("a")
+		cancelled = asyncio.create_task(scheduler.acquire("a"))
+		kept = asyncio.create_task(scheduler.acquire("b"))
+		await asyncio.sleep(0)
+		cancelled.cancel()
+		await asyncio.sleep(0)
+
+		scheduler.release()
+		await kept
+
+		self.assertEqual(scheduler.active, 1)
+		self.assertEqual(scheduler.waiting(), 0)
+
+class TestAdmission(unittest.IsolatedAsyncioTestCase):
+	def setUp(self):
+		Metrics._instance = None
+		self.patcher_config = patch("utils.scheduler.Config")
+		self.mock_config_cls = self.patcher_config.start()
+		self.addCleanup(self.patcher_config.stop)
+		self.settings = {"RATE_LIMIT_USER_RATE": 0.001, "RATE_LIMIT_USER_BURST": 1, "SCHEDULER_MAX_CONCURRENCY": 1}
+		self.mock_config_cls.return_value.get_variable.side_effect = lambda key, default=None: self.settings.get(key, default)
+		self.admission = Admission()
+
+	def test_admit_charges_once_per_request(self):
+		with request_context(guild_id=1, user_id=10):
+			self.assertEqual(current_request(), (1, 10, False))
+			self.admission.admit()
+			self.admission.admit()
+		with request_context(guild_id=1, user_id=10):
+			with self.assertRaises(RateLimited):
+				self.admission.admit()
+		with request_context(guild_id=1, user_id=10, priority=True):
+			self.admission.admit()
+
+	def test_requests_without_context_are_not_limited(self):
+		for _ in range(5):
+			self.admission.admit()
+
+	async def test_nested_slots_do_not_deadlock(self):
+		async with self.admission.slot():
+			async with self.admission.slot():
+				self.assertEqual(self.admission.scheduler.active, 1)
+		self.assertEqual(self.admission.scheduler.active, 0)
+
+if __name__ == "__main__":
+	unittest.main()
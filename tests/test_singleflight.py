@@ -0,0 +1,91 @@
+import asyncio
+import threading
+import time
+import unittest
+from utils.metrics import Metrics
+from utils.singleflight import SingleFlight
+
+class TestSingleFlight(unittest.IsolatedAsyncioTestCase):
+	def setUp(self):
+		# Reset metrics singleton so counters start at zero
+		Metrics._instance = None
+		self.flights = SingleFlight("test")
+
+	def calls(self, result):
+		return self.flights.calls.get(group="test", result=result)
+
+	async def test_concurrent_calls_share_one_result(self):
+		started = 0
+
+		async def fetch():
+			nonlocal started
+			started += 1
+			await asyncio.sleep(0.01)
+			return "value"
+
+		results = await asyncio.gather(*(self.flights.do("k", fetch) for _ in range(4)))
+
+		self.assertEqual(results, ["value"] * 4)
+		self.assertEqual(started, 1)
+		self.assertEqual((self.calls("leader"), self.calls("coalesced")), (1, 3))
+		self.assertEqual(self.flights.in_flight(), 0)
+
+	async def test_different_keys_run_separately(self):
+		async def fetch(value):
+			await asyncio.sleep(0)
+			return value
+
+		results = await asyncio.gather(self.flights.do("a", lambda: fetch(1)), self.flights.do("b", lambda: fetch(2)))
+
+		self.assertEqual(results, [1, 2])
+		self.assertEqual(self.calls("coalesced"), 0)
+
+	async def test_exception_is_shared(self):
+		async def fail():
+			await asyncio.sleep(0.01)
+			raise RuntimeError("boom")
+
+		results = await asyncio.gather(*(self.flights.do("k", fail) for _ in range(3)), return_exceptions=True)
+
+		self.assertTrue(all(isinstance(result, RuntimeError) for result in results))
+
+	async def test_cancelled_leader_does_not_cancel_followers(self):
+		async def fetch():
+			await asyncio.sleep(0.02)
+			return "value"
+
+		leader = asyncio.create_task(self.flights.do("k", fetch))
+		await asyncio.sleep(0)
+		follower = asyncio.create_task(self.flights.do("k", fetch))
+		await asyncio.sleep(0)
+		leader.cancel()
+
+		self.assertEqual(await follower, "value")
+
+	def test_do_sync_coalesces_threads(self):
+		release = threading.Event()
+		started = []
+
+		def fetch():
+			started.append(1)
+			release.wait(1)
+			return "value"
+
+		results = []
+		threads = [threading.Thread(target=lambda: results.append(self.flights.do_sync("k", fetch))) for _ in range(3)]
+		threads[0].start()
+		while not started:
+			time.sleep(0.001)
+		for thread in threads[1:]:
+			thread.start()
+		while self.calls("coalesced") < 2:
+			time.sleep(0.001)
+		release.set()
+		for thread in threads:
+			thread.join()
+
+		self.assertEqual(results, ["value"] * 3)
+		self.assertEqual(len(started), 1)
+
+if __name__ == "__main__":
+	unittest.main()
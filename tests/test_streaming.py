@@ -0,0 +1,56 @@
+import unittest
+from unittest.mock import MagicMock, AsyncMock
+from utils.streaming import MessageStreamer
+
+async def deltas_from(parts):
+	for part in parts:
+		yield part
+
+class TestMessageStreamer(unittest.IsolatedAsyncioTestCase):
+	def setUp(self):
+		self.message = MagicMock()
+		self.message.edit = AsyncMock()
+		self.channel = MagicMock()
+		self.channel.send = AsyncMock(return_value=self.message)
+
+	async def test_first_delta_sends_then_edits(self):
+		streamer = MessageStreamer(self.channel, min_interval=0)
+
+		result = await streamer.consume(deltas_from(["Hel", "lo", " world"]))
+
+		self.assertEqual(result, "Hello world")
+		self.channel.send.assert_awaited_once_with("Hel")
+		self.message.edit.assert_awaited_with(content="Hello world")
+
+	async def test_edits_are_coalesced_within_interval(self):
+		streamer = MessageStreamer(self.channel, min_interval=60)
+
+		await streamer.consume(deltas_from(["a", "b", "c", "d"]))
+
+		# One send for the first delta, one final edit with everything else
+		self.channel.send.assert_awaited_once_with("a")
+		self.message.edit.assert_awaited_once_with(content="abcd")
+
+	async def test_long_output_rolls_over_into_new_message(self):
+		streamer = MessageStreamer(self.channel, min_interval=60, max_length=10)
+
+		result = await streamer.consume(deltas_from(["hello ", "there ", "friend"]))
+
+		self.assertEqual(result, "hello there friend")
+		sent = [call.args[0] for call in self.channel.send.await_args_list]
+		self.assertTrue(all(len(call.kwargs["content"]) <= 10 for call in self.message.edit.await_args_list))
+		self.assertEqual(sent, ["hello ", "there", "friend"])
+		self.assertEqual(len(streamer.messages), 3)
+
+	async def test_write_errors_are_logged(self):
+		self.channel.send = AsyncMock(side_effect=Exception("forbidden"))
+		streamer = MessageStreamer(self.channel, min_interval=0)
+		streamer.logger = MagicMock()
+
+		result = await streamer.consume(deltas_from(["hi"]))
+
+		self.assertEqual(result, "hi")
+		streamer.logger.error.assert_called()
+
+if __name__ == "__main__":
+	unittest.main()
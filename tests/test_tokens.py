@@ -0,0 +1,95 @@
+import unittest
+from unittest.mock import patch
+from utils.tokens import TokenCounter
+
+class FakeEncoding:
+	"""Whitespace tokenizer standing in for a tiktoken encoding."""
+
+	def __init__(self, name):
+		self.name = name
+		self.encoded = []
+
+	def encode_ordinary(self, text):
+		self.encoded.append(text)
+		return text.split()
+
+	def encode_ordinary_batch(self, texts):
+		self.encoded.extend(texts)
+		return [text.split() for text in texts]
+
+class TestTokenCounter(unittest.TestCase):
+	def setUp(self):
+		self.patcher_tiktoken = patch("utils.tokens.tiktoken")
+		self.patcher_config = patch("utils.tokens.Config")
+		self.mock_tiktoken = self.patcher_tiktoken.start()
+		self.mock_config_cls = self.patcher_config.start()
+		self.addCleanup(self.patcher_tiktoken.stop)
+		self.addCleanup(self.patcher_config.stop)
+
+		self.prices = {
+			"gpt-4o": {"input": 2.5, "output": 10.0},
+			"gpt-4o-mini": {"input": 0.15, "output": 0.6}
+		}
+		self.mock_config_cls.return_value.get_variable.side_effect = lambda key, default=None: self.prices if key == "TOKEN_PRICES" else default
+
+		self.encoding = FakeEncoding("o200k_base")
+		self.mock_tiktoken.encoding_for_model.return_value = self.encoding
+
+		# Reset singleton between tests
+		TokenCounter._instance = None
+		self.tokens = TokenCounter()
+
+	def test_encoder_is_loaded_once_per_model(self):
+		self.tokens.count("gpt-4o", "one two")
+		self.tokens.count("gpt-4o", "three")
+
+		self.mock_tiktoken.encoding_for_model.assert_called_once_with("gpt-4o")
+
+	def test_unknown_model_falls_back(self):
+		self.mock_tiktoken.encoding_for_model.side_effect = KeyError("llama3")
+		self.mock_tiktoken.get_encoding.return_value = FakeEncoding("cl100k_base")
+
+		self.assertEqual(self.tokens.count("llama3", "a b c"), 3)
+		self.mock_tiktoken.get_encoding.assert_called_once_with("cl100k_base")
+
+	def test_counts_are_cached(self):
+		self.assertEqual(self.tokens.count("gpt-4o", "a b c"), 3)
+		self.assertEqual(self.tokens.count("gpt-4o", "a b c"), 3)
+		self.assertEqual(self.tokens.count("gpt-4o", ""), 0)
+
+		self.assertEqual(self.encoding.encoded, ["a b c"])
+
+	def test_count_many_batches_misses(self):
+		self.tokens.count("gpt-4o", "a b")
+
+		counts = self.tokens.count_many("gpt-4o", ["a b", "c d e", "", "c d e"])
+
+		self.assertEqual(counts, [2, 3, 0, 3])
+		self.assertEqual(self.encoding.encoded, ["a b", "c d e"])
+
+	def test_count_messages_includes_overhead(self):
+		messages = [
+			{"role": "system", "content": "be brief"},
+			{"role": "user", "content": "hello there", "name": "bob"}
+		]
+
+		# content 2 + 2, roles 1 + 1, name 1, 3 per message, 1 per name, 3 reply priming
+		self.assertEqual(self.tokens.count_messages("gpt-4o", messages), 7 + 6 + 1 + 3)
+		self.assertEqual(sum(self.tokens.count_message("gpt-4o", m) for m in messages) + 3, 17)
+
+	def test_price_matches_longest_prefix(self):
+		self.assertEqual(self.tokens.price("gpt-4o-mini-2024-07-18"), (0.15, 0.6))
+		self.assertEqual(self.tokens.price("gpt-4o-2024-08-06"), (2.5, 10.0))
+		self.assertEqual(self.tokens.price("llama3"), (0.0, 0.0))
+
+	def test_cost_uses_table_or_explicit_prices(self):
+		self.assertEqual(self.tokens.cost("gpt-4o", 1_000_000, 500_000), 7.5)
+		self.assertEqual(self.tokens.cost("gpt-4o", 1000, 1000, cpm_prompt=1.0, cpm_completion=2.0), 0.003)
+
+	def test_estimate_cost_from_text(self):
+		cost = self.tokens.estimate_cost("gpt-4o", "a b c d", "e f")
+
+		self.assertEqual(cost, round((2.5 * 4 + 10.0 * 2) / 1_000_000.0, 8))
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,149 @@
+import shutil
+import tempfile
+import unittest
+import numpy as np
+from utils.vector_store import MemmapVectorStore, VectorStore, _where_sql
+
+try:
+	from chromadb.api.models.Collection import Collection
+except ImportError:
+	Collection = None
+
+class TestMemmapVectorStore(unittest.TestCase):
+	def setUp(self):
+		self.path = tempfile.mkdtemp()
+		self.addCleanup(shutil.rmtree, self.path)
+		self.store = self._open()
+		self.store.add(
+			ids=["a", "b", "c"],
+			embeddings=[[1.0, 0.0, 0.0], [0.0, 1.0, 0.0], [0.7, 0.7, 0.0]],
+			documents=["doc a", "doc b", "doc c"],
+			metadatas=[{"guild_id": 1, "chunk_index": 0}, {"guild_id": 2, "chunk_index": 1}, {"guild_id": 1, "chunk_index": 2}]
+		)
+
+	def _open(self, **kwargs):
+		store = MemmapVectorStore(self.path, initial_capacity=2, **kwargs)
+		self.addCleanup(store.close)
+		return store
+
+	def test_query_ranks_by_cosine_similarity(self):
+		result = self.store.query(query_embeddings=[[2.0, 0.1, 0.0]], n_results=2)
+
+		self.assertEqual(result["ids"], [["a", "c"]])
+		self.assertEqual(result["documents"], [["doc a", "doc c"]])
+		self.assertEqual(result["metadatas"][0][0]["guild_id"], 1)
+		self.assertAlmostEqual(result["distances"][0][0], 1 - 2.0 / np.linalg.norm([2.0, 0.1]), places=3)
+
+	def test_where_filters_query_get_and_delete(self):
+		result = self.store.query(query_embeddings=[[0.0, 1.0, 0.0]], n_results=3, where={"guild_id": 1})
+		self.assertEqual(result["ids"], [["c", "a"]])
+
+		page = self.store.get(where={"$and": [{"guild_id": 1}, {"chunk_index": {"$in": [0, 5]}}]}, include=[])
+		self.assertEqual(page, {"ids": ["a"]})
+
+		self.store.delete(where={"chunk_index": {"$gte": 1}})
+		self.assertEqual(self.store.get()["ids"], ["a"])
+		self.assertEqual(self.store.query(query_embeddings=[[0.0, 1.0, 0.0]], n_results=3)["ids"], [["a"]])
+
+	def test_add_skips_existing_and_upsert_replaces(self):
+		self.store.add(ids=["a"], embeddings=[[0.0, 0.0, 1.0]], documents=["ignored"])
+		self.assertEqual(self.store.get(ids=["a"])["documents"], ["doc a"])
+
+		self.store.upsert(ids=["a"], embeddings=[[0.0, 0.0, 1.0]], documents=["new a"], metadatas=[{"guild_id": 3}])
+
+		self.assertEqual(self.store.count(), 3)
+		self.assertEqual(self.store.query(query_embeddings=[[0.0, 0.0, 1.0]], n_results=1)["ids"], [["a"]])
+		self.assertEqual(self.store.get(ids=["a"]), {"ids": ["a"], "documents": ["new a"], "metadatas": [{"guild_id": 3}]})
+
+	def test_update_and_paging(self):
+		self.store.update(ids=["b", "missing"], metadatas=[{"guild_id": 9}, {}])
+
+		self.assertEqual(self.store.get(ids=["b"])["metadatas"], [{"guild_id": 9}])
+		self.assertEqual(self.store.get(limit=2, offset=1, include=["documents"]), {"ids": ["b", "c"], "documents": ["doc b", "doc c"]})
+
+	def test_reopen_persists_and_grows(self):
+		self.store.add(ids=[f"x{i}" for i in range(10)], embeddings=np.eye(3)[np.arange(10) % 3].tolist())
+		self.store.close()
+
+		reopened = self._open(dtype="int8")
+
+		self.assertEqual(reopened.dtype, "float16")
+		self.assertEqual(reopened.count(), 13)
+		self.assertGreaterEqual(reopened.capacity, 13)
+		embedding = reopened.get(ids=["b"], include=["embeddings"])["embeddings"][0]
+		np.testing.assert_allclose(embedding, [0.0, 1.0, 0.0], atol=1e-3)
+
+	def test_deleted_rows_are_reused(self):
+		self.store.delete(ids=["a", "b"])
+		self.store.close()
+		store = self._open()
+
+		store.add(ids=["d", "e", "f"], embeddings=[[0.0, 0.0, 1.0], [1.0, 0.0, 0.0], [0.0, 1.0, 0.0]], documents=["doc d", "doc e", "doc f"])
+
+		self.assertEqual(store.size, 4)
+		self.assertEqual(store.query(query_embeddings=[[1.0, 0.0, 0.0]], n_results=1)["ids"], [["e"]])
+		self.assertCountEqual(store.get()["ids"], ["c", "d", "e", "f"])
+
+	def test_compact_reclaims_deleted_rows(self):
+		self.store.add(ids=[f"x{i}" for i in range(13)], embeddings=np.eye(3)[np.arange(13) % 3].tolist())
+		self.store.delete(where={"guild_id": 1})
+		self.store.delete(ids=[f"x{i}" for i in range(1, 13)])
+
+		self.assertEqual(self.store.compact(), 14)
+
+		self.assertEqual((self.store.size, self.store.capacity), (2, 2))
+		self.assertEqual(self.store.get()["ids"], ["b", "x0"])
+		self.assertEqual(self.store.query(query_embeddings=[[0.0, 1.0, 0.0]], n_results=2)["ids"], [["b", "x0"]])
+		self.store.close()
+		reopened = self._open()
+		self.assertEqual(reopened.get(ids=["b"])["documents"], ["doc b"])
+		np.testing.assert_allclose(reopened.get(ids=["x0"], include=["embeddings"])["embeddings"][0], [1.0, 0.0, 0.0], atol=1e-3)
+
+	def test_int8_quantization(self):
+		shutil.rmtree(self.path)
+		store = self._open(dtype="int8")
+		rng = np.random.default_rng(0)
+		vectors = rng.normal(size=(200, 16)).astype(np.float32)
+		store.add(ids=[str(i) for i in range(200)], embeddings=vectors.tolist())
+
+		for i in (0, 57, 199):
+			self.assertEqual(store.query(query_embeddings=[vectors[i].tolist()], n_results=1)["ids"][0], [str(i)])
+
+	def test_ivf_probes_nearest_lists(self):
+		shutil.rmtree(self.path)
+		store = self._open(ivf_lists=4, ivf_probes=1)
+		rng = np.random.default_rng(1)
+		centers = np.eye(4, 8) * 10
+		vectors = np.repeat(centers, 50, axis=0) + rng.normal(size=(200, 8))
+		store.add(ids=[str(i) for i in range(200)], embeddings=vectors.tolist())
+
+		self.assertTrue(store.ensure_ivf())
+		self.assertEqual(len(np.unique(store._lists[:200])), 4)
+		result = store.query(query_embeddings=[vectors[120].tolist()], n_results=5)
+		self.assertEqual(result["ids"][0][0], "120")
+		self.assertTrue(all(100 <= int(doc_id) < 150 for doc_id in result["ids"][0]))
+
+	def test_index_fields_get_expression_indexes_used_by_filters(self):
+		self.store.close()
+		store = self._open(index_fields=["guild_id"])
+
+		indexes = [name for (name,) in store._db.execute("SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'docs'")]
+		self.assertIn("docs_guild_id", indexes)
+		sql, params = _where_sql({"guild_id": {"$in": [1, 2]}})
+		plan = " ".join(row[-1] for row in store._db.execute(f"EXPLAIN QUERY PLAN SELECT row FROM docs WHERE {sql}", params))
+		self.assertIn("USING INDEX docs_guild_id", plan)
+		with self.assertRaises(ValueError):
+			self._open(index_fields=["guild_id); DROP TABLE docs; --"])
+
+	def test_backends_satisfy_vector_store_protocol(self):
+		self.assertIsInstance(self.store, VectorStore)
+		if Collection is not None:
+			self.assertTrue(issubclass(Collection, VectorStore))
+
+	def test_where_sql_rejects_unsafe_fields(self):
+		self.assertEqual(_where_sql({"a": {"$nin": [1, True]}}), ("json_extract(metadata, '$.a') NOT IN (?, ?)", [1, 1]))
+		with self.assertRaises(ValueError):
+			_where_sql({"a') OR 1=1 --": 1})
+
+if __name__ == "__main__":
+	unittest.main()
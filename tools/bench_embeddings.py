@@ -0,0 +1,164 @@
+# tools/bench_embeddings.py
+#
+# Compare RAG embedding backends on a fixed synthetic corpus: load time, encode
+# throughput, single-query latency, peak RSS, and retrieval quality against the
+# fp32 torch reference. Each backend runs in its own process so RSS figures are
+# not polluted by the others.
+#
+#   python tools/bench_embeddings.py
+#   python tools/bench_embeddings.py --backends torch onnx --onnx-file onnx/model_qint8_avx512.onnx --docs 5000
+#
+# recall@k is the mean overlap between a backend's top-k documents and the
+# reference's top-k for the same query; hit@k is the share of queries whose
+# source document is in the backend's top-k.
+
+import argparse
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+SUBJECTS = [
+	("the music bot", "music"), ("server backups", "backups"), ("the welcome message", "welcome"),
+	("role assignment", "roles"), ("the giphy command", "gifs"), ("voice channel limits", "voice"),
+	("the moderation log", "modlog"), ("slash command sync", "slash commands"), ("the ticket system", "tickets"),
+	("rate limiting", "rate limits"), ("the leveling system", "levels"), ("scheduled events", "events"),
+	("the verification gate", "verification"), ("emoji uploads", "emojis"), ("thread archiving", "threads"),
+	("the reminder command", "reminders"),
+]
+PROBLEMS = [
+	"stops responding after a restart", "fails with error code {code}", "is slow during peak hours",
+	"ignores the configured channel", "posts duplicates", "needs the Manage Server permission",
+	"was reset by the last update", "only works for admins", "times out after {minutes} minutes",
+	"breaks when the prefix is changed",
+]
+FIXES = [
+	"Run !reload {module} and check the logs.", "Ask user#{user} to re-invite the bot with the new scopes.",
+	"Set {setting} in config.yaml and restart.", "Clear the cache with !cache clear {module}.",
+	"Move the bot's role above the managed roles.", "Upgrade to version {version} which fixes it.",
+]
+QUESTIONS = [
+	"why does {keyword} {symptom}?", "{keyword} problem: it {symptom}", "how do I fix {keyword} when it {symptom}",
+	"anyone know why {keyword} {symptom}",
+]
+
+def build_corpus(size: int, seed: int = 7) -> tuple[list[str], list[str], list[int]]:
+	"""Deterministic support-channel style documents, and one paraphrased query per sampled document."""
+	rng = random.Random(seed)
+	documents, queries, targets = [], [], []
+	for index in range(size):
+		subject, keyword = rng.choice(SUBJECTS)
+		fields = {
+			"code": rng.randint(400, 599), "minutes": rng.randint(2, 30), "module": keyword.replace(" ", "_"),
+			"user": rng.randint(1000, 9999), "setting": keyword.upper().replace(" ", "_") + "_ENABLED",
+			"version": f"{rng.randint(1, 4)}.{rng.randint(0, 20)}",
+		}
+		problem = rng.choice(PROBLEMS).format(**fields)
+		documents.append(f"{subject.capitalize()} {problem}. {rng.choice(FIXES).format(**fields)}")
+		if index % 5 == 0:
+			queries.append(rng.choice(QUESTIONS).format(keyword=keyword, symptom=problem))
+			targets.append(index)
+	return documents, queries, targets
+
+def run_worker(args):
+	from utils.rag import load_embedder
+
+	documents, queries, _ = build_corpus(args.docs)
+	started = time.perf_counter()
+	model = load_embedder(args.model, args.worker, args.onnx_file if args.worker == "onnx" else None)
+	load_seconds = time.perf_counter() - started
+
+	model.encode(documents[:args.batch_size], batch_size=args.batch_size)
+	started = time.perf_counter()
+	doc_embeddings = np.asarray(model.encode(documents, batch_size=args.batch_size), dtype=np.float32)
+	encode_seconds = time.perf_counter() - started
+
+	latencies = []
+	for query in queries[:100]:
+		started = time.perf_counter()
+		model.encode([query])
+		latencies.append(time.perf_counter() - started)
+	query_embeddings = np.asarray(model.encode(queries, batch_size=args.batch_size), dtype=np.float32)
+
+	np.savez(args.output, documents=doc_embeddings, queries=query_embeddings)
+	print(json.dumps({
+		"backend": args.worker,
+		"load_s": round(load_seconds, 2),
+		"docs_per_s": round(len(documents) / encode_seconds, 1),
+		"query_p50_ms": round(float(np.median(latencies)) * 1000, 2),
+		"peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+	}))
+
+def top_k(doc_embeddings: np.ndarray, query_embeddings: np.ndarray, k: int) -> np.ndarray:
+	docs = doc_embeddings / np.linalg.norm(doc_embeddings, axis=1, keepdims=True)
+	queries = query_embeddings / np.linalg.norm(query_embeddings, axis=1, keepdims=True)
+	return np.argsort(-(queries @ docs.T), axis=1)[:, :k]
+
+def main():
+	parser = argparse.ArgumentParser(description="Benchmark RAG embedding backends.")
+	parser.add_argument("--backends", nargs="+", default=["torch", "torch-int8", "onnx"], help="Backends to compare; torch is always run as the reference.")
+	parser.add_argument("--model", default="all-MiniLM-L6-v2")
+	parser.add_argument("--onnx-file", default=None, help="ONNX export to load for the onnx backend, e.g. onnx/model_qint8_avx512.onnx")
+	parser.add_argument("--docs", type=int, default=2000, help="Corpus size.")
+	parser.add_argument("--batch-size", type=int, default=64)
+	parser.add_argument("-k", type=int, default=4, help="Retrieval depth for recall@k and hit@k.")
+	parser.add_argument("--json", help="Also write the results to this file.")
+	parser.add_argument("--worker", help=argparse.SUPPRESS)
+	parser.add_argument("--output", help=argparse.SUPPRESS)
+	args = parser.parse_args()
+
+	if args.worker:
+		run_worker(args)
+		return
+
+	backends = ["torch"] + [backend for backend in args.backends if backend != "torch"]
+	_, _, targets = build_corpus(args.docs)
+	targets = np.asarray(targets)
+	results, rankings = [], {}
+	with tempfile.TemporaryDirectory() as workdir:
+		for backend in backends:
+			output = os.path.join(workdir, f"{backend}.npz")
+			command = [sys.executable, os.path.abspath(__file__), "--worker", backend, "--output", output,
+				"--model", args.model, "--docs", str(args.docs), "--batch-size", str(args.batch_size)]
+			if args.onnx_file:
+				command += ["--onnx-file", args.onnx_file]
+			completed = subprocess.run(command, capture_output=True, text=True)
+			if completed.returncode != 0:
+				print(f"{backend}: failed\n{completed.stderr.strip()[-2000:]}", file=sys.stderr)
+				continue
+			result = json.loads(completed.stdout.strip().splitlines()[-1])
+			embeddings = np.load(output)
+			rankings[backend] = top_k(embeddings["documents"], embeddings["queries"], args.k)
+			result["hit_at_k"] = round(float(np.mean([target in row for target, row in zip(targets, rankings[backend])])), 4)
+			results.append(result)
+
+	if not results:
+		sys.exit("No backend completed")
+	reference = rankings.get("torch")
+	for result in results:
+		ranking = rankings[result["backend"]]
+		if reference is None:
+			result["recall_at_k"] = None
+			continue
+		overlap = [len(set(row) & set(expected)) / args.k for row, expected in zip(ranking, reference)]
+		result["recall_at_k"] = round(float(np.mean(overlap)), 4)
+
+	columns = ["backend", "load_s", "docs_per_s", "query_p50_ms", "peak_rss_mb", "recall_at_k", "hit_at_k"]
+	widths = [max(len(column), *(len(str(result[column])) for result in results)) for column in columns]
+	print(f"{args.docs} documents, {len(targets)} queries, k={args.k}, model={args.model}")
+	print("  ".join(column.ljust(width) for column, width in zip(columns, widths)))
+	for result in results:
+		print("  ".join(str(result[column]).ljust(width) for column, width in zip(columns, widths)))
+	if args.json:
+		with open(args.json, "w") as f:
+			json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+	main()
@@ -1,11 +1,20 @@
 # utils/ai.py
 
-from openai import OpenAI
-import tiktoken
-import requests
+import asyncio
+import json
+from openai import OpenAI, AsyncOpenAI
+from utils.config import Config
+from utils.context import ContextWindow
+from utils.http_pool import HttpPool
 from utils.logger import Logger
+from utils.metrics import Metrics, track
 from utils.personality import Personality
+from utils.tokens import TokenCounter
 from utils.rag import Rag
+from utils.response_cache import ResponseCache
+from utils.router import BackendRouter
+from utils.scheduler import Admission, holding_slot
+from utils.singleflight import SingleFlight
 
 class AI:
 
@@ -21,11 +30,34 @@ class AI:
 			return
 
 		self.client = OpenAI()
+		self.async_client = AsyncOpenAI()
+		# The router retries and falls back itself; SDK retries would multiply its attempts
+		self.routed_client = AsyncOpenAI(max_retries=0)
 		self.logger = Logger()
+		self.cfg = Config()
+		self.http = HttpPool()
+		self.metrics = Metrics()
+		self.tokens = TokenCounter()
+		self.context_window = ContextWindow(self.tokens)
+		self.response_cache = ResponseCache()
+		self._inflight = SingleFlight("ai")
+		self.admission = Admission()
+		# Router attempts are not coalesced, so a timed-out attempt is really
+		# cancelled instead of being waited on again by the retry
+		self.router = BackendRouter({
+			"openai": lambda model, messages: self._call_in_slot(self._openai_create_routed, model, messages),
+			"ollama": lambda model, messages: self._call_in_slot(self._ollama_post, model, messages)
+		})
 		self.rag = Rag()
 		self.ollama_url = "http://localhost:11434/api/chat"
+
+		# Bound the number of in-flight requests per backend so a burst of
+		# messages queues up here instead of overwhelming the API or the Ollama host.
+		self._openai_semaphore = asyncio.Semaphore(self.cfg.get_variable("OPENAI_MAX_CONCURRENCY", 16))
+		self._ollama_semaphore = asyncio.Semaphore(self.cfg.get_variable("OLLAMA_MAX_CONCURRENCY", 4))
 		self._initialized = True
 
+	@track("openai")
 	def openai_chat_completion(self, model: str, system_prompt: str, user_prompt: str) -> str:
 		try:
 			completion = self.client.chat.completions.create(
@@ -35,27 +67,31 @@ class AI:
 					{"role": "user", "content": user_prompt}
 				]
 			)
+			self._record_openai_usage(model, completion)
 			response = completion.choices[0].message.content
 			# Safe strip: only if it exists and callable
 			if hasattr(response, "strip") and callable(response.strip):
 				response = response.strip()
 			return response
 		except Exception as e:
-			self.logger.error(f"OpenAI completion error (model={model}): {e}")
+			self.logger.error("OpenAI completion error (model=%s): %s", model, e, model=model)
 			return f"Error: {str(e)}"
 
 
+	@track("openai")
 	def openai_chat_completion_with_context(self, model: str, context: list) -> str:
 		"""Get OpenAI response from full conversation context."""
 		try:
 			completion = self.client.chat.completions.create(model=model, messages=context)
+			self._record_openai_usage(model, completion)
 			response = completion.choices[0].message.content.strip()
-			self.logger.debug(f"OpenAI completion with context success (model={model}): {response}")
+			self.logger.debug("OpenAI completion with context success (model=%s): %s", model, response, model=model)
 			return response
 		except Exception as e:
-			self.logger.error(f"Chat completion context error (model={model}): {e}\nContext: {context}")
+			self.logger.error("Chat completion context error (model=%s): %s\nContext: %s", model, e, context, model=model)
 			return f"Error: {str(e)}"
 
+	@track("ollama")
 	def ollama_chat_completion(self, model: str, system_prompt: str, user_prompt: str) -> str:
 		"""Get Ollama response from system and user prompt."""
 		payload = {
@@ -66,16 +102,18 @@ class AI:
 			]
 		}
 		try:
-			resp = requests.post(self.ollama_url, json=payload)
+			resp = self.http.get_sync_session().post(self.ollama_url, json=payload, timeout=self.http.timeout)
 			resp.raise_for_status()
 			data = resp.json()
+			self._record_ollama_usage(model, data)
 			response = data["message"]["content"].strip()
-			self.logger.debug(f"Ollama completion success (model={model}): {response}")
+			self.logger.debug("Ollama completion success (model=%s): %s", model, response, model=model)
 			return response
 		except Exception as e:
-			self.logger.error(f"Ollama completion error (model={model}): {e}")
+			self.logger.error("Ollama completion error (model=%s): %s", model, e, model=model)
 			return f"Error: {str(e)}"
 
+	@track("openai")
 	def openai_summarize_conversation(self, model: str, context: list) -> str:
 		"""Summarize a conversation using OpenAI."""
 		try:
@@ -83,13 +121,15 @@ class AI:
 				model=model,
 				messages=context + [{"role": "user", "content": "Please summarize our conversation with detail.  It will be used to update my user document (memory)."}]
 			)
+			self._record_openai_usage(model, summary)
 			response = summary.choices[0].message.content.strip()
-			self.logger.debug(f"OpenAI summarize success (model={model}): {response}")
+			self.logger.debug("OpenAI summarize success (model=%s): %s", model, response, model=model)
 			return response
 		except Exception as e:
-			self.logger.error(f"OpenAI summarize error (model={model}): {e}\nContext: {context}")
+			self.logger.error("OpenAI summarize error (model=%s): %s\nContext: %s", model, e, context, model=model)
 			return f"Error: {str(e)}"
 
+	@track("ollama")
 	def ollama_chat_completion_with_context(self, model: str, context: list) -> str:
 		"""Get Ollama response from full conversation context."""
 		payload = {
@@ -97,28 +137,31 @@ class AI:
 			"messages": context
 		}
 		try:
-			resp = requests.post(self.ollama_url, json=payload)
+			resp = self.http.get_sync_session().post(self.ollama_url, json=payload, timeout=self.http.timeout)
 			resp.raise_for_status()
 			data = resp.json()
+			self._record_ollama_usage(model, data)
 			response = data["message"]["content"].strip()
-			self.logger.debug(f"Ollama completion with context success (model={model}): {response}")
+			self.logger.debug("Ollama completion with context success (model=%s): %s", model, response, model=model)
 			return response
 		except Exception as e:
-			self.logger.error(f"Ollama chat context error (model={model}): {e}\nContext: {context}")
+			self.logger.error("Ollama chat context error (model=%s): %s\nContext: %s", model, e, context, model=model)
 			return f"Error: {str(e)}"
 
-	def tokens_to_usd(model, context, result, cpm_context, cpm_result) -> float:
-		encoding = tiktoken.encoding_for_model(model)
-		t_context = len(encoding.encode(context))
-		t_result = len(encoding.encode(result))
-		cost = ((cpm_context * t_context) + (cpm_result * t_result)) / 1_000_000.0
-		return round(cost, 8)
+	def tokens_to_usd(self, model: str, context, result: str, cpm_context: float = None, cpm_result: float = None) -> float:
+		"""
+		Estimate the USD cost of a call from its prompt (string or message list)
+		and result text. Per-million prices default to TOKEN_PRICES in config.
+		"""
+		return self.tokens.estimate_cost(model, context, result, cpm_context, cpm_result)
 
-	def count_tokens(model, text) -> int:
-		encoding = tiktoken.encoding_for_model(model)
-		return len(encoding.encode(text))
+	def count_tokens(self, model: str, text) -> int:
+		"""Count tokens in a string, or in a chat message list including per-message overhead."""
+		if isinstance(text, list):
+			return self.tokens.count_messages(model, text)
+		return self.tokens.count(model, text)
 
-	def build_context(self, personality: Personality, rag_data: str = None, previous_context: list = []) -> list:
+	def build_context(self, personality: Personality, rag_data: str = None, previous_context: list = [], model: str = None) -> list:
 		"""
 		Build the context for the chat completion request.
 
@@ -126,6 +169,8 @@ class AI:
 			personality (Personality): The personality to use for the chat.
 			rag_data (str): The RAG data to include in the context.
 			previous_context (list): The previous context messages.
+			model (str): If given, RAG data is capped and the oldest turns are
+				dropped so the context fits the model's token budget.
 
 		Returns:
 			list: The constructed context for the chat completion request.
@@ -139,16 +184,296 @@ class AI:
 		system_prompt = personality.get_system_prompt()
 
 		if rag_data:
+			if model:
+				rag_data = self.context_window.cap_rag(model, rag_data)
 			system_prompt += f"\n\n{rag_data}"
 
-		context.insert(0, {"role": "system", "content": system_prompt})
+		system_message = {"role": "system", "content": system_prompt}
+
+		if model:
+			context, dropped = self.context_window.split(model, system_message, context)
+			if dropped:
+				self.logger.debug("Dropped %d oldest turns to fit the context budget (model=%s)", len(dropped), model, model=model)
+
+		context.insert(0, system_message)
 
 		return context
-	
+
+	async def build_context_async(self, personality: Personality, model: str, rag_data: str = None, previous_context: list = [], summary_model: str = None) -> list:
+		"""
+		Budgeted variant of build_context that keeps the gist of dropped turns.
+
+		Turns that no longer fit are replaced by a summary from
+		openai_summarize_conversation_async, placed right after the system
+		prompt. Summaries are cached and extended incrementally, so only turns
+		dropped since the last summary are sent. If summarizing fails the
+		dropped turns are simply left out.
+
+		Parameters:
+			personality (Personality): The personality to use for the chat.
+			model (str): The model the context is built for.
+			rag_data (str): The RAG data to include in the context.
+			previous_context (list): The previous context messages.
+			summary_model (str): OpenAI model used for summaries; defaults to
+				CONTEXT_SUMMARY_MODEL, then model.
+
+		Returns:
+			list: The constructed context for the chat completion request.
+		"""
+		window = self.context_window
+		context = previous_context.copy()
+
+		if context and context[0].get("role") == "system":
+			context.pop(0)
+
+		system_prompt = personality.get_system_prompt()
+
+		if rag_data:
+			system_prompt += f"\n\n{window.cap_rag(model, rag_data)}"
+
+		system_message = {"role": "system", "content": system_prompt}
+		kept, dropped = window.split(model, system_message, context, reserve=window.summary_max_tokens)
+
+		messages = [system_message]
+		if dropped:
+			summary_model = summary_model or self.cfg.get_variable("CONTEXT_SUMMARY_MODEL") or model
+			summary = await self._summarize_turns(summary_model, dropped)
+			if summary:
+				messages.append(window.summary_message(model, summary))
+		return messages + kept
+
+	async def _summarize_turns(self, model: str, dropped: list) -> str:
+		"""Return a summary of dropped, extending the longest cached summary of a prefix of it."""
+		window = self.context_window
+		summary, covered = window.cached_summary(dropped)
+		if covered == len(dropped):
+			return summary
+
+		turns = dropped[covered:]
+		if summary:
+			turns = [window.summary_message(model, summary)] + turns
+		result = await self.openai_summarize_conversation_async(model, turns)
+		if result.startswith("Error: "):
+			# A stale summary is still better than none
+			return summary
+		window.store_summary(dropped, result)
+		return result
+
 	def append_context(self, context: list, role: str, content: str) -> list:
 		context.append({"role": role, "content": content})
 
 		if not isinstance(role, str) or not isinstance(content, str):
 			self.logger.error("Invalid role or content type in append_context")
 			return None
-		return context
\ No newline at end of file
+		return context
+
+	def _record_openai_usage(self, model: str, completion):
+		usage = getattr(completion, "usage", None)
+		self.metrics.record_tokens("openai", model, getattr(usage, "prompt_tokens", None), getattr(usage, "completion_tokens", None))
+
+	def _record_ollama_usage(self, model: str, data: dict):
+		self.metrics.record_tokens("ollama", model, data.get("prompt_eval_count"), data.get("eval_count"))
+
+	async def _complete(self, model: str, messages: list, call, cache_site: str = None) -> str:
+		"""
+		Run call(model, messages) for the current request: rate limited once per
+		request, coalesced with identical concurrent requests, and run in a
+		fair-share scheduler slot. Call sites that pass cache_site are also
+		served from the response cache.
+		"""
+		self.admission.admit()
+		if cache_site:
+			response = await self.response_cache.get(cache_site, model, messages)
+			if response is not None:
+				return response
+		if holding_slot():
+			# A caller holding a slot must not wait on a leader that is queued
+			# for one, or every slot can end up blocked on the queue
+			response = await call(model, messages)
+		else:
+			key = json.dumps([call.__name__, model, messages], sort_keys=True)
+			response = await self._inflight.do(key, lambda: self._call_in_slot(call, model, messages))
+		if cache_site:
+			await self.response_cache.set(model, messages, response)
+		return response
+
+	async def _call_in_slot(self, call, model: str, messages: list) -> str:
+		async with self.admission.slot():
+			return await call(model, messages)
+
+	async def _openai_create(self, model: str, messages: list, client: AsyncOpenAI = None) -> str:
+		async with self._openai_semaphore:
+			completion = await (client or self.async_client).chat.completions.create(model=model, messages=messages)
+		self._record_openai_usage(model, completion)
+		response = completion.choices[0].message.content
+		if hasattr(response, "strip") and callable(response.strip):
+			response = response.strip()
+		return response
+
+	async def _openai_create_routed(self, model: str, messages: list) -> str:
+		return await self._openai_create(model, messages, self.routed_client)
+
+	async def _ollama_post(self, model: str, messages: list) -> str:
+		payload = {
+			"model": model,
+			"messages": messages,
+			"stream": False
+		}
+		session = self.http.get_session()
+		async with self._ollama_semaphore:
+			async with session.post(self.ollama_url, json=payload) as resp:
+				resp.raise_for_status()
+				data = await resp.json()
+		self._record_ollama_usage(model, data)
+		return data["message"]["content"].strip()
+
+	@track("openai")
+	async def openai_chat_completion_async(self, model: str, system_prompt: str, user_prompt: str, cache_site: str = None) -> str:
+		"""
+		Async variant of openai_chat_completion. Passing cache_site opts the call
+		into the response cache; the site name labels its hit-rate stats.
+		"""
+		try:
+			return await self._complete(model, [
+				{"role": "system", "content": system_prompt},
+				{"role": "user", "content": user_prompt}
+			], self._openai_create, cache_site)
+		except Exception as e:
+			self.logger.error("OpenAI completion error (model=%s): %s", model, e, model=model)
+			return f"Error: {str(e)}"
+
+	@track("openai")
+	async def openai_chat_completion_with_context_async(self, model: str, context: list, cache_site: str = None) -> str:
+		"""Async variant of openai_chat_completion_with_context; cache_site opts into the response cache."""
+		try:
+			response = await self._complete(model, context, self._openai_create, cache_site)
+			self.logger.debug("OpenAI completion with context success (model=%s): %s", model, response, model=model)
+			return response
+		except Exception as e:
+			self.logger.error("Chat completion context error (model=%s): %s\nContext: %s", model, e, context, model=model)
+			return f"Error: {str(e)}"
+
+	@track("openai")
+	async def openai_summarize_conversation_async(self, model: str, context: list) -> str:
+		"""Async variant of openai_summarize_conversation."""
+		try:
+			response = await self._complete(
+				model,
+				context + [{"role": "user", "content": "Please summarize our conversation with detail.  It will be used to update my user document (memory)."}],
+				self._openai_create
+			)
+			self.logger.debug("OpenAI summarize success (model=%s): %s", model, response, model=model)
+			return response
+		except Exception as e:
+			self.logger.error("OpenAI summarize error (model=%s): %s\nContext: %s", model, e, context, model=model)
+			return f"Error: {str(e)}"
+
+	@track("ollama")
+	async def ollama_chat_completion_async(self, model: str, system_prompt: str, user_prompt: str, cache_site: str = None) -> str:
+		"""Async variant of ollama_chat_completion; cache_site opts into the response cache."""
+		try:
+			response = await self._complete(model, [
+				{"role": "system", "content": system_prompt},
+				{"role": "user", "content": user_prompt}
+			], self._ollama_post, cache_site)
+			self.logger.debug("Ollama completion success (model=%s): %s", model, response, model=model)
+			return response
+		except Exception as e:
+			self.logger.error("Ollama completion error (model=%s): %s", model, e, model=model)
+			return f"Error: {str(e)}"
+
+	@track("ollama")
+	async def ollama_chat_completion_with_context_async(self, model: str, context: list, cache_site: str = None) -> str:
+		"""Async variant of ollama_chat_completion_with_context; cache_site opts into the response cache."""
+		try:
+			response = await self._complete(model, context, self._ollama_post, cache_site)
+			self.logger.debug("Ollama completion with context success (model=%s): %s", model, response, model=model)
+			return response
+		except Exception as e:
+			self.logger.error("Ollama chat context error (model=%s): %s\nContext: %s", model, e, context, model=model)
+			return f"Error: {str(e)}"
+
+	@track("router", model_from_args=False)
+	async def chat_completion_async(self, system_prompt: str, user_prompt: str, cache_site: str = None) -> str:
+		"""Routed variant of the *_chat_completion_async methods; see chat_completion_with_context_async."""
+		return await self.chat_completion_with_context_async([
+			{"role": "system", "content": system_prompt},
+			{"role": "user", "content": user_prompt}
+		], cache_site)
+
+	@track("router", model_from_args=False)
+	async def chat_completion_with_context_async(self, context: list, cache_site: str = None) -> str:
+		"""
+		Get a response from whichever backend the router picks: ROUTER_BACKENDS in
+		priority order, skipping backends whose circuit is open and trying slow
+		ones last, with retries and fallback to the next backend on failure.
+		"""
+		try:
+			self.admission.admit()
+			if cache_site:
+				response = await self.response_cache.get(cache_site, "router", context)
+				if response is not None:
+					return response
+			async with self.admission.slot():
+				response, backend = await self.router.complete(context)
+			self.logger.debug("Routed completion success (backend=%s): %s", backend, response, model=backend)
+			if cache_site:
+				await self.response_cache.set("router", context, response)
+			return response
+		except Exception as e:
+			self.logger.error("Routed completion error: %s\nContext: %s", e, context)
+			return f"Error: {str(e)}"
+
+	@track("openai")
+	async def openai_chat_completion_stream(self, model: str, context: list):
+		"""Yield OpenAI response deltas from full conversation context as they arrive."""
+		try:
+			self.admission.admit()
+			async with self.admission.slot(), self._openai_semaphore:
+				stream = await self.async_client.chat.completions.create(model=model, messages=context, stream=True)
+				async for chunk in stream:
+					if not chunk.choices:
+						continue
+					delta = chunk.choices[0].delta.content
+					if delta:
+						yield delta
+			self.logger.debug("OpenAI stream with context complete (model=%s)", model, model=model)
+		except Exception as e:
+			self.logger.error("Chat completion stream error (model=%s): %s\nContext: %s", model, e, context, model=model)
+			yield f"Error: {str(e)}"
+
+	@track("ollama")
+	async def ollama_chat_completion_stream(self, model: str, context: list):
+		"""Yield Ollama response deltas from full conversation context as they arrive."""
+		payload = {
+			"model": model,
+			"messages": context,
+			"stream": True
+		}
+		try:
+			self.admission.admit()
+			session = self.http.get_session()
+			async with self.admission.slot(), self._ollama_semaphore:
+				async with session.post(self.ollama_url, json=payload) as resp:
+					resp.raise_for_status()
+					# Ollama streams newline-delimited JSON objects, one per delta
+					async for line in resp.content:
+						line = line.strip()
+						if not line:
+							continue
+						data = json.loads(line)
+						delta = data.get("message", {}).get("content")
+						if delta:
+							yield delta
+						if data.get("done"):
+							self._record_ollama_usage(model, data)
+							break
+			self.logger.debug("Ollama stream with context complete (model=%s)", model, model=model)
+		except Exception as e:
+			self.logger.error("Ollama chat stream error (model=%s): %s\nContext: %s", model, e, context, model=model)
+			yield f"Error: {str(e)}"
+
+	async def close(self):
+		"""Close the async clients owned by this instance."""
+		await self.async_client.close()
+		await self.routed_client.close()
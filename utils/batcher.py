@@ -0,0 +1,67 @@
+# utils/batcher.py
+
+import asyncio
+from concurrent.futures import Executor
+from typing import Any, Callable
+
+class MicroBatcher:
+	"""
+	Merge items submitted concurrently within a short window into one batched call.
+
+	fn takes a list of items and returns a list of results in the same order; it
+	runs on the given executor so the event loop is never blocked. A batch is
+	dispatched when the window elapses or max_batch items are waiting, whichever
+	comes first.
+
+	Usage:
+		batcher = MicroBatcher(model.encode, executor, window_ms=5)
+		embedding = await batcher.submit("some text")
+	"""
+
+	def __init__(self, fn: Callable[[list], list], executor: Executor = None, window_ms: float = 5, max_batch: int = 64):
+		self.fn = fn
+		self.executor = executor
+		self.window = window_ms / 1000.0
+		self.max_batch = max_batch
+		self._pending = []
+		self._timer = None
+		self._tasks = set()
+		self.batches = 0
+		self.items = 0
+
+	async def submit(self, item: Any) -> Any:
+		"""Queue an item for the next batch and wait for its result."""
+		loop = asyncio.get_running_loop()
+		future = loop.create_future()
+		self._pending.append((item, future))
+		if len(self._pending) >= self.max_batch:
+			self._dispatch(loop)
+		elif self._timer is None:
+			self._timer = loop.call_later(self.window, self._dispatch, loop)
+		return await future
+
+	def _dispatch(self, loop: asyncio.AbstractEventLoop):
+		if self._timer is not None:
+			self._timer.cancel()
+			self._timer = None
+		batch, self._pending = self._pending, []
+		if batch:
+			task = loop.create_task(self._run(loop, batch))
+			self._tasks.add(task)
+			task.add_done_callback(self._tasks.discard)
+
+	async def _run(self, loop: asyncio.AbstractEventLoop, batch: list):
+		self.batches += 1
+		self.items += len(batch)
+		try:
+			results = list(await loop.run_in_executor(self.executor, self.fn, [item for item, _ in batch]))
+			if len(results) != len(batch):
+				raise ValueError(f"Batched call returned {len(results)} results for {len(batch)} items")
+		except Exception as e:
+			for _, future in batch:
+				if not future.done():
+					future.set_exception(e)
+			return
+		for (_, future), result in zip(batch, results):
+			if not future.done():
+				future.set_result(result)
@@ -0,0 +1,80 @@
+# utils/cache.py
+
+import time
+import threading
+from collections import OrderedDict
+
+_MISSING = object()
+
+class LRUCache:
+	"""
+	Thread-safe LRU cache bounded by entry count, with optional per-entry TTL.
+
+	Hit, miss and eviction counters are kept so callers can size the cache.
+
+	Usage:
+		cache = LRUCache(max_entries=1024, ttl=3600)
+		cache.set("key", value)
+		value = cache.get("key")
+	"""
+
+	def __init__(self, max_entries: int = 1024, ttl: float = None):
+		self.max_entries = max_entries
+		self.ttl = ttl
+		self._data = OrderedDict()
+		self._lock = threading.Lock()
+		self.hits = 0
+		self.misses = 0
+		self.evictions = 0
+
+	def get(self, key, default=None):
+		"""Return the cached value for key, or default if missing or expired."""
+		with self._lock:
+			entry = self._data.get(key, _MISSING)
+			if entry is _MISSING:
+				self.misses += 1
+				return default
+			value, expires_at = entry
+			if expires_at is not None and expires_at <= time.monotonic():
+				del self._data[key]
+				self.evictions += 1
+				self.misses += 1
+				return default
+			self._data.move_to_end(key)
+			self.hits += 1
+			return value
+
+	def set(self, key, value, ttl: float = None):
+		"""Store value under key, evicting the least recently used entries beyond max_entries."""
+		ttl = self.ttl if ttl is None else ttl
+		expires_at = time.monotonic() + ttl if ttl else None
+		with self._lock:
+			self._data[key] = (value, expires_at)
+			self._data.move_to_end(key)
+			while len(self._data) > self.max_entries:
+				self._data.popitem(last=False)
+				self.evictions += 1
+
+	def delete(self, key):
+		with self._lock:
+			self._data.pop(key, None)
+
+	def clear(self):
+		with self._lock:
+			self._data.clear()
+
+	def __len__(self) -> int:
+		return len(self._data)
+
+	def stats(self) -> dict:
+		"""Return size and hit/miss/eviction counters."""
+		with self._lock:
+			lookups = self.hits + self.misses
+			return {
+				"size": len(self._data),
+				"max_entries": self.max_entries,
+				"hits": self.hits,
+				"misses": self.misses,
+				"evictions": self.evictions,
+				"hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+			}
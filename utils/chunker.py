@@ -0,0 +1,119 @@
+# utils/chunker.py
+
+import re
+from typing import Callable
+
+# A sentence runs to terminal punctuation followed by whitespace, or to the end of its line
+_SENTENCE = re.compile(r"[^\n]*?[.!?]+(?=\s|$)|[^\n]+")
+_WORD = re.compile(r"\S+")
+
+class Chunk:
+	"""A window of a document: its text and [start, end) character offsets into the document."""
+
+	__slots__ = ("text", "start", "end", "tokens")
+
+	def __init__(self, text: str, start: int, end: int, tokens: int):
+		self.text = text
+		self.start = start
+		self.end = end
+		self.tokens = tokens
+
+class Chunker:
+	"""
+	Split long documents into overlapping, sentence-aligned windows that fit
+	the embedding model.
+
+	Sentences are packed into windows of at most max_tokens tokens (as counted
+	by count, normally the embedding model's tokenizer); each window repeats
+	up to overlap tokens of trailing sentences from the previous one, so a
+	passage cut at a boundary is still whole in one of the chunks. Sentences
+	longer than a window are split between words. Chunk text is a slice of the
+	document, so neighbouring chunks can be stitched back together by offset.
+
+	Usage:
+		chunker = Chunker(max_tokens=200, overlap=40, count=lambda text: len(tokenizer.tokenize(text)))
+		for chunk in chunker.split(document):
+			embed(chunk.text)
+	"""
+
+	def __init__(self, max_tokens: int = 200, overlap: int = 40, count: Callable[[str], int] = None):
+		if overlap >= max_tokens:
+			raise ValueError("overlap must be smaller than max_tokens")
+		self.max_tokens = max_tokens
+		self.overlap = overlap
+		self.count = count or (lambda text: len(text.split()))
+
+	def _units(self, text: str) -> list[tuple[int, int, int]]:
+		"""(start, end, tokens) of each sentence, with oversized sentences split into word runs."""
+		units = []
+		for match in _SENTENCE.finditer(text):
+			start, end = match.span()
+			start += len(match.group()) - len(match.group().lstrip())
+			if start >= end:
+				continue
+			tokens = self.count(text[start:end])
+			if tokens <= self.max_tokens:
+				units.append((start, end, tokens))
+				continue
+			piece_start, piece_end, piece_tokens = None, None, 0
+			for word in _WORD.finditer(text, start, end):
+				word_tokens = self.count(word.group())
+				if piece_start is not None and piece_tokens + word_tokens > self.max_tokens:
+					units.append((piece_start, piece_end, piece_tokens))
+					piece_start, piece_tokens = None, 0
+				if piece_start is None:
+					piece_start = word.start()
+				piece_end = word.end()
+				piece_tokens += word_tokens
+			if piece_start is not None:
+				units.append((piece_start, piece_end, piece_tokens))
+		return units
+
+	def split(self, text: str) -> list[Chunk]:
+		"""Return the chunks of text in order; text that fits in one window comes back as a single chunk."""
+		chunks = []
+		window, tokens = [], 0
+		for unit in self._units(text):
+			if window and tokens + unit[2] > self.max_tokens:
+				chunks.append(self._chunk(text, window, tokens))
+				# Carry trailing sentences into the next window, up to overlap tokens
+				carried, carried_tokens = [], 0
+				for previous in reversed(window):
+					if carried_tokens + previous[2] > self.overlap:
+						break
+					carried.insert(0, previous)
+					carried_tokens += previous[2]
+				window, tokens = carried, carried_tokens
+				while window and tokens + unit[2] > self.max_tokens:
+					tokens -= window.pop(0)[2]
+			window.append(unit)
+			tokens += unit[2]
+		if window:
+			chunks.append(self._chunk(text, window, tokens))
+		return chunks
+
+	@staticmethod
+	def _chunk(text: str, window: list, tokens: int) -> Chunk:
+		start, end = window[0][0], window[-1][1]
+		return Chunk(text[start:end], start, end, tokens)
+
+	@staticmethod
+	def merge(parts: list[tuple[int, int, str]]) -> str:
+		"""
+		Stitch (start, end, text) chunks of one document back into a single
+		passage, dropping the text they overlap on. Gaps are joined with a space.
+		"""
+		parts = sorted(parts)
+		if not parts:
+			return ""
+		merged = [parts[0][2]]
+		covered = parts[0][1]
+		for start, end, text in parts[1:]:
+			if end <= covered:
+				continue
+			if start <= covered:
+				merged.append(text[covered - start:])
+			else:
+				merged.append(" " + text)
+			covered = end
+		return "".join(merged)
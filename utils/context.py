@@ -0,0 +1,127 @@
+# utils/context.py
+
+import hashlib
+from utils.cache import LRUCache
+from utils.config import Config
+from utils.logger import Logger
+from utils.tokens import TokenCounter, TOKENS_PER_REPLY
+
+SUMMARY_PREFIX = "Summary of the earlier conversation:\n"
+
+class ContextWindow:
+	"""
+	Fits a system prompt, RAG snippets and conversation history into a
+	per-model token budget.
+
+	The budget is the model's context limit minus a reserve for the reply.
+	RAG data is capped to its own token allowance, whole snippets first. When
+	the history no longer fits, the oldest turns are split off down to a
+	low-water mark. That cut is remembered for the conversation (by a digest
+	of the turns before it) and reused until the turns after it overflow
+	again, so trimming (and summarizing, for callers that do) happens once
+	every few messages rather than on every one. Token counts come from
+	TokenCounter's per-text cache, so rebuilding the window only encodes
+	messages that have not been seen before.
+
+	Usage:
+		window = ContextWindow()
+		kept, dropped = window.split("gpt-4o", system_message, history)
+	"""
+
+	def __init__(self, tokens: TokenCounter = None):
+		self.logger = Logger()
+		self.cfg = Config()
+		self.tokens = tokens or TokenCounter()
+		self.limits = self.cfg.get_variable("CONTEXT_TOKEN_LIMITS", {}) or {}
+		self.default_limit = self.cfg.get_variable("CONTEXT_DEFAULT_TOKEN_LIMIT", 8192)
+		self.reply_reserve = self.cfg.get_variable("CONTEXT_REPLY_RESERVE", 1024)
+		self.rag_max_tokens = self.cfg.get_variable("CONTEXT_RAG_MAX_TOKENS", 1500)
+		self.summary_max_tokens = self.cfg.get_variable("CONTEXT_SUMMARY_MAX_TOKENS", 512)
+		self.trim_target = self.cfg.get_variable("CONTEXT_TRIM_TARGET", 0.75)
+		self.summaries = LRUCache(max_entries=self.cfg.get_variable("CONTEXT_SUMMARY_CACHE_SIZE", 256))
+		# Digest of the dropped prefix -> True, for each conversation's current cut
+		self.cuts = LRUCache(max_entries=self.cfg.get_variable("CONTEXT_SUMMARY_CACHE_SIZE", 256))
+
+	def budget(self, model: str) -> int:
+		"""Prompt tokens available for model: its limit (exact or longest prefix match) minus the reply reserve."""
+		limit = self.limits.get(model)
+		if limit is None:
+			matches = [prefix for prefix in self.limits if model.startswith(prefix)]
+			limit = self.limits[max(matches, key=len)] if matches else self.default_limit
+		return max(int(limit) - self.reply_reserve, 0)
+
+	def cap_rag(self, model: str, rag_data: str) -> str:
+		"""Cap RAG data at rag_max_tokens, keeping whole snippets (blank-line separated) in order."""
+		if not rag_data or self.tokens.count(model, rag_data) <= self.rag_max_tokens:
+			return rag_data
+		kept = []
+		used = 0
+		for snippet in rag_data.split("\n\n"):
+			# Joining blank lines costs about one token per snippet
+			cost = self.tokens.count(model, snippet) + 1
+			if used + cost > self.rag_max_tokens:
+				break
+			kept.append(snippet)
+			used += cost
+		if not kept:
+			return self.tokens.truncate(model, rag_data, self.rag_max_tokens)
+		return "\n\n".join(kept)
+
+	def split(self, model: str, system_message: dict, history: list, reserve: int = 0) -> tuple[list, list]:
+		"""
+		Return (kept, dropped) where kept is the newest part of history that fits
+		the budget alongside system_message and reserve extra tokens. Nothing is
+		dropped while the whole history fits. Otherwise the conversation's
+		previous cut is reused while the turns after it still fit, and only
+		when they overflow is history cut again, to trim_target of the
+		available tokens. The newest message is always kept.
+		"""
+		available = self.budget(model) - self.tokens.count_message(model, system_message) - TOKENS_PER_REPLY - reserve
+		counts = [self.tokens.count_message(model, message) for message in history]
+		if sum(counts) <= available:
+			return history, []
+
+		digests = self._digests(history)
+		start = next((i + 1 for i in reversed(range(len(history) - 1)) if self.cuts.get(digests[i])), 0)
+		if start and sum(counts[start:]) <= available:
+			return history[start:], history[:start]
+
+		target = int(available * self.trim_target)
+		used = 0
+		start = len(history)
+		while start > 0 and (used + counts[start - 1] <= target or start == len(history)):
+			start -= 1
+			used += counts[start]
+		if used > available:
+			self.logger.warning("Newest message alone exceeds the context budget for %s (%d > %d tokens)", model, used, available, model=model)
+		if start:
+			self.cuts.set(digests[start - 1], True)
+		return history[start:], history[:start]
+
+	@staticmethod
+	def _digests(messages: list) -> list[str]:
+		"""Rolling digests: entry i identifies messages[:i + 1]."""
+		digest = hashlib.blake2b(digest_size=16)
+		result = []
+		for message in messages:
+			digest.update(f"{message.get('role', '')}\x1f{message.get('content') or ''}\x1e".encode("utf-8"))
+			result.append(digest.copy().hexdigest())
+		return result
+
+	def cached_summary(self, dropped: list) -> tuple[str, int]:
+		"""
+		Return (summary, covered) for the longest prefix of dropped that already
+		has a summary, so only the turns after it need summarizing.
+		"""
+		for i, digest in reversed(list(enumerate(self._digests(dropped)))):
+			summary = self.summaries.get(digest)
+			if summary is not None:
+				return summary, i + 1
+		return None, 0
+
+	def store_summary(self, dropped: list, summary: str):
+		if dropped:
+			self.summaries.set(self._digests(dropped)[-1], summary)
+
+	def summary_message(self, model: str, summary: str) -> dict:
+		return {"role": "system", "content": SUMMARY_PREFIX + self.tokens.truncate(model, summary, self.summary_max_tokens)}
@@ -0,0 +1,173 @@
+# utils/conversation.py
+
+import asyncio
+from collections import deque
+from utils.cache import LRUCache
+from utils.config import Config
+from utils.logger import Logger
+
+INSERT_TURNS = "INSERT INTO conversation_turns (channel_id, seq, role, content, author_id) VALUES %s ON CONFLICT (channel_id, seq) DO NOTHING"
+SELECT_RECENT = "SELECT seq, role, content FROM conversation_turns WHERE channel_id = %s ORDER BY seq DESC LIMIT %s"
+
+class _Channel:
+	"""Hot state for one channel: newest turns and the next sequence number."""
+
+	__slots__ = ("turns", "next_seq", "complete")
+
+	def __init__(self, turns: deque, next_seq: int, complete: bool):
+		self.turns = turns
+		self.next_seq = next_seq
+		# True when turns holds the channel's entire history
+		self.complete = complete
+
+class ConversationStore:
+	"""
+	Per-channel conversation history persisted in the conversation_turns table.
+
+	Writes are append-only: each turn gets the next sequence number for its
+	channel and is queued, then written in batches by a background flush loop
+	(or as soon as flush_batch turns are waiting). The newest hot_turns turns of
+	recently used channels stay in memory, so building context for an active
+	channel never touches the database; older turns are read by the
+	(channel_id, seq) index. Only the channels in use are loaded after a restart.
+
+	Usage:
+		store = ConversationStore(db)
+		await store.start()
+		await store.append(channel.id, "user", message.content, author_id=author.id)
+		history = await store.recent(channel.id, 20)
+	"""
+
+	_instance = None
+
+	def __new__(cls, *args, **kwargs):
+		if cls._instance is None:
+			cls._instance = super().__new__(cls)
+		return cls._instance
+
+	def __init__(self, db):
+		if hasattr(self, "_initialized") and self._initialized:
+			return
+
+		self.logger = Logger()
+		self.cfg = Config()
+		self.db = db
+		self.hot_turns = self.cfg.get_variable("CONVERSATION_HOT_TURNS", 50)
+		self.flush_interval = self.cfg.get_variable("CONVERSATION_FLUSH_INTERVAL", 1.0)
+		self.flush_batch = self.cfg.get_variable("CONVERSATION_FLUSH_BATCH", 500)
+		self.channels = LRUCache(max_entries=self.cfg.get_variable("CONVERSATION_HOT_CHANNELS", 1024))
+		self._pending = []
+		self._load_lock = None
+		self._flush_lock = None
+		self._flush_task = None
+		self._initialized = True
+
+	def _locks(self):
+		# Created lazily so they bind to the running event loop
+		if self._load_lock is None:
+			self._load_lock = asyncio.Lock()
+			self._flush_lock = asyncio.Lock()
+		return self._load_lock, self._flush_lock
+
+	async def start(self):
+		"""Start the background flush loop."""
+		if self._flush_task is None:
+			self._flush_task = asyncio.create_task(self._flush_loop())
+
+	async def _flush_loop(self):
+		while True:
+			await asyncio.sleep(self.flush_interval)
+			try:
+				await self.flush()
+			except Exception as e:
+				self.logger.error(f"Conversation flush failed: {e}")
+
+	async def _channel(self, channel_id: int) -> _Channel:
+		channel = self.channels.get(channel_id)
+		if channel is not None:
+			return channel
+		load_lock, flush_lock = self._locks()
+		async with load_lock:
+			channel = self.channels.get(channel_id)
+			if channel is not None:
+				return channel
+			# Turns of an evicted channel may still be queued or being written by
+			# an in-flight flush; holding the flush lock waits for the latter, and
+			# the former are written here, so the sequence read back is current.
+			async with flush_lock:
+				if any(row[0] == channel_id for row in self._pending):
+					await self._flush_pending()
+				rows = await self.db.run_script_async(SELECT_RECENT, (channel_id, self.hot_turns))
+			if rows is False:
+				raise RuntimeError(f"Could not load conversation for channel {channel_id}")
+			turns = deque(({"role": role, "content": content} for _, role, content in reversed(rows)), maxlen=self.hot_turns)
+			next_seq = rows[0][0] + 1 if rows else 0
+			channel = _Channel(turns, next_seq, complete=len(rows) < self.hot_turns)
+			self.channels.set(channel_id, channel)
+			return channel
+
+	async def append(self, channel_id: int, role: str, content: str, author_id: int = None) -> dict:
+		"""Append a turn to a channel's history and queue it for the next flush."""
+		channel = await self._channel(channel_id)
+		turn = {"role": role, "content": content}
+		if len(channel.turns) == channel.turns.maxlen:
+			channel.complete = False
+		channel.turns.append(turn)
+		self._pending.append((channel_id, channel.next_seq, role, content, author_id))
+		channel.next_seq += 1
+		if len(self._pending) >= self.flush_batch:
+			await self.flush()
+		return turn
+
+	async def recent(self, channel_id: int, n: int = None) -> list[dict]:
+		"""
+		Return the last n turns of a channel, oldest first, as role/content
+		messages ready for AI.build_context. n defaults to hot_turns.
+		"""
+		n = self.hot_turns if n is None else n
+		if n <= 0:
+			return []
+		channel = await self._channel(channel_id)
+		if n <= len(channel.turns) or channel.complete:
+			return list(channel.turns)[-n:]
+
+		await self.flush()
+		rows = await self.db.run_script_async(SELECT_RECENT, (channel_id, n))
+		if rows is False:
+			self.logger.warning("Falling back to cached turns for channel %s", channel_id, channel=channel_id)
+			return list(channel.turns)
+		return [{"role": role, "content": content} for _, role, content in reversed(rows)]
+
+	async def flush(self) -> int:
+		"""Write queued turns in one batch. Returns the number of turns written."""
+		_, flush_lock = self._locks()
+		async with flush_lock:
+			return await self._flush_pending()
+
+	async def _flush_pending(self) -> int:
+		# Caller holds the flush lock
+		if not self._pending:
+			return 0
+		rows, self._pending = self._pending, []
+		result = await self.db.run_batch_async(INSERT_TURNS, rows)
+		if result is False:
+			# Keep the turns, ahead of anything appended meanwhile, for the next flush
+			self._pending[:0] = rows
+			self.logger.error(f"Failed to write {len(rows)} conversation turns, will retry")
+			return 0
+		if result < len(rows):
+			# A sequence number was reused; those turns are lost
+			self.logger.error(f"{len(rows) - result} of {len(rows)} conversation turns conflicted with existing sequence numbers and were not written")
+		self.logger.debug("Flushed %d conversation turns", result)
+		return result
+
+	async def close(self):
+		"""Stop the flush loop and write anything still queued."""
+		if self._flush_task is not None:
+			self._flush_task.cancel()
+			try:
+				await self._flush_task
+			except asyncio.CancelledError:
+				pass
+			self._flush_task = None
+		await self.flush()
@@ -1,7 +1,12 @@
 # utils/database.py
 
 import os
+import time
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import psycopg2
+from psycopg2.extras import execute_values
 from utils.logger import Logger
 
 class Database:
@@ -19,8 +24,21 @@ class Database:
 
 		self.logger = Logger()
 		self.cfg = config
-		self.connection = self.connect_to_db()
-		self.cursor = self.connection.cursor()
+		self.min_size = self.cfg.get_variable("DB_POOL_MIN_SIZE", 1)
+		self.max_size = max(self.cfg.get_variable("DB_POOL_MAX_SIZE", 10), self.min_size)
+		self.max_idle = self.cfg.get_variable("DB_POOL_MAX_IDLE", 300)
+		self.health_check_interval = self.cfg.get_variable("DB_POOL_HEALTH_CHECK_INTERVAL", 30)
+		self.acquire_timeout = self.cfg.get_variable("DB_POOL_ACQUIRE_TIMEOUT", 10)
+
+		# Idle connections as (connection, last_used) pairs, most recently used last
+		self._idle = []
+		self._size = 0
+		self._cond = threading.Condition()
+		self._executor = ThreadPoolExecutor(max_workers=self.max_size, thread_name_prefix="db")
+
+		for _ in range(self.min_size):
+			self._idle.append((self.connect_to_db(), time.monotonic()))
+			self._size += 1
 		self.logger.info("Database initiated")
 		self._initialized = True
 
@@ -39,6 +57,82 @@ class Database:
 			self.logger.error(f"Database connection error: {e}")
 			raise
 
+	def _is_healthy(self, conn) -> bool:
+		"""Ping a connection that has been idle for a while."""
+		if conn.closed:
+			return False
+		try:
+			cursor = conn.cursor()
+			try:
+				cursor.execute("SELECT 1")
+			finally:
+				cursor.close()
+			conn.rollback()
+			return True
+		except Exception as e:
+			self.logger.warning(f"Pooled connection failed health check: {e}")
+			return False
+
+	def _discard(self, conn):
+		try:
+			conn.close()
+		except Exception:
+			pass
+		with self._cond:
+			self._size -= 1
+			self._cond.notify()
+
+	def _acquire(self):
+		"""Check a connection out of the pool, opening a new one if below max_size."""
+		deadline = time.monotonic() + self.acquire_timeout
+		while True:
+			with self._cond:
+				if self._idle:
+					conn, last_used = self._idle.pop()
+				elif self._size < self.max_size:
+					self._size += 1
+					conn, last_used = None, None
+				else:
+					remaining = deadline - time.monotonic()
+					if remaining <= 0:
+						raise TimeoutError(f"Timed out waiting for a database connection (max_size={self.max_size})")
+					self._cond.wait(remaining)
+					continue
+
+			if conn is None:
+				try:
+					return self.connect_to_db()
+				except Exception:
+					with self._cond:
+						self._size -= 1
+						self._cond.notify()
+					raise
+
+			idle_for = time.monotonic() - last_used
+			if idle_for > self.health_check_interval and not self._is_healthy(conn):
+				self._discard(conn)
+				continue
+			if conn.closed:
+				self._discard(conn)
+				continue
+			return conn
+
+	def _release(self, conn):
+		"""Return a connection to the pool and recycle idle ones beyond min_size."""
+		now = time.monotonic()
+		expired = []
+		with self._cond:
+			self._idle.append((conn, now))
+			while self._idle and self._size - len(expired) > self.min_size and now - self._idle[0][1] > self.max_idle:
+				expired.append(self._idle.pop(0)[0])
+			self._size -= len(expired)
+			self._cond.notify()
+		for stale in expired:
+			try:
+				stale.close()
+			except Exception:
+				pass
+
 	def run_script(self, script, params=None):
 		"""
 		Args:
@@ -59,35 +153,110 @@ class Database:
 				self.logger.error(f"SQL file not found: {script_path}")
 				raise
 
-		def execute_query():
-			self.cursor.execute(script, params)
-			if script.strip().lower().startswith(("select", "with")):
-				return self.cursor.fetchall()
-			else:
-				affected = self.cursor.rowcount
-				self.connection.commit()
+		def execute_query(conn):
+			cursor = conn.cursor()
+			try:
+				cursor.execute(script, params)
+				if script.strip().lower().startswith(("select", "with")):
+					rows = cursor.fetchall()
+					conn.rollback()
+					return rows
+				else:
+					affected = cursor.rowcount
+					conn.commit()
+					return affected
+			finally:
+				cursor.close()
+
+		return self._run(execute_query)
+
+	def run_batch(self, script, rows, page_size=1000):
+		"""
+		Insert many rows in one round trip per page with psycopg2's execute_values.
+
+		Args:
+			script (str): Statement with a single 'VALUES %s' placeholder,
+				e.g. 'INSERT INTO t (a, b) VALUES %s'.
+			rows (list[tuple]): Row tuples to expand into the VALUES list.
+			page_size (int): Rows per statement.
+
+		Returns:
+			int: Number of affected rows.
+			False: If execution fails after retry.
+		"""
+		if not rows:
+			return 0
+
+		def execute_batch(conn):
+			cursor = conn.cursor()
+			try:
+				affected = 0
+				for start in range(0, len(rows), page_size):
+					execute_values(cursor, script, rows[start:start + page_size], page_size=page_size)
+					affected += cursor.rowcount
+				conn.commit()
 				return affected
+			finally:
+				cursor.close()
+
+		return self._run(execute_batch)
+
+	def _run(self, execute):
+		"""Run execute(conn) on a pooled connection, retrying once on a broken connection."""
+		try:
+			conn = self._acquire()
+		except Exception as e:
+			self.logger.error(f"Database connection unavailable: {e}")
+			return False
 
 		try:
-			return execute_query()
+			result = execute(conn)
+			self._release(conn)
+			return result
 		except (psycopg2.OperationalError, psycopg2.InterfaceError) as e:
 			self.logger.warning(f"Database operation failed, retrying once: {e}")
+			self._discard(conn)
 			try:
-				self.connection.close()
-			except Exception:
-				pass
+				conn = self._acquire()
+			except Exception as e2:
+				self.logger.error(f"Retry failed: {e2}")
+				return False
 			try:
-				self.connection = self.connect_to_db()
-				self.cursor = self.connection.cursor()
-				return execute_query()
+				result = execute(conn)
+				self._release(conn)
+				return result
 			except Exception as e2:
 				self.logger.error(f"Retry failed: {e2}")
+				self._discard(conn)
 				return False
 		except Exception as e:
 			self.logger.error(f"Database operation error: {e}")
+			try:
+				conn.rollback()
+				self._release(conn)
+			except Exception:
+				self._discard(conn)
 			return False
 
+	async def run_script_async(self, script, params=None):
+		"""Run run_script on the pool's worker threads without blocking the event loop."""
+		loop = asyncio.get_running_loop()
+		return await loop.run_in_executor(self._executor, self.run_script, script, params)
+
+	async def run_batch_async(self, script, rows, page_size=1000):
+		"""Run run_batch on the pool's worker threads without blocking the event loop."""
+		loop = asyncio.get_running_loop()
+		return await loop.run_in_executor(self._executor, self.run_batch, script, rows, page_size)
+
 	def close(self):
-		self.cursor.close()
-		self.connection.close()
+		with self._cond:
+			idle = [conn for conn, _ in self._idle]
+			self._idle.clear()
+			self._size -= len(idle)
+		for conn in idle:
+			try:
+				conn.close()
+			except Exception:
+				pass
+		self._executor.shutdown(wait=False)
 		self.logger.info("Database connection closed")
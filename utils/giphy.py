@@ -1,9 +1,9 @@
 # utils/giphy.py
 
 import random
-import requests
 from utils.ai import AI
 from utils.config import Config
+from utils.http_pool import HttpPool
 from utils.logger import Logger
 
 class Giphy:
@@ -22,6 +22,7 @@ class Giphy:
 		self.logger = Logger()
 		self.ai = AI()
 		self.cfg = Config()
+		self.http = HttpPool()
 		self.api_url = "https://api.giphy.com/v1/gifs/search"
 		self._initialized = True
 
@@ -37,7 +38,7 @@ class Giphy:
 			str | None: URL of a relevant reaction GIF, or None if none found or on error.
 		"""
 		try:
-			search_string = self.ai.openai_chat_completion(
+			search_string = await self.ai.openai_chat_completion_async(
 				'gpt-4.1-mini',
 				(
 					'Analyze the text and suggest a concise search string for finding a relevant REACTION GIF. '
@@ -47,7 +48,8 @@ class Giphy:
 					'If a user says "where is everyone?" the search string could be "john travolta" because of the popular gif. '
 					'When possible, try to use known, popular or funny search strings to find the best response.'
 				),
-				message
+				message,
+				cache_site="giphy"
 			)
 			params = {
 				"api_key": self.cfg.GIPHY_API_KEY,
@@ -58,12 +60,12 @@ class Giphy:
 				"lang": "en",
 				"bundle": "messaging_non_clips"
 			}
-			response = requests.get(self.api_url, params=params)
-			response.raise_for_status()
-			data = response.json()
+			async with self.http.get_session().get(self.api_url, params=params) as response:
+				response.raise_for_status()
+				data = await response.json()
 			if data.get('data'):
 				react_gif_url = data['data'][0].get('url')
-				self.logger.info(f"Found GIF URL: {react_gif_url} for search '{search_string}'")
+				self.logger.info("Found GIF URL: %s for search '%s'", react_gif_url, search_string)
 				return react_gif_url
 			else:
 				self.logger.warning(f"No GIFs found for search '{search_string}'")
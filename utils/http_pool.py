@@ -0,0 +1,100 @@
+# utils/http_pool.py
+
+import asyncio
+import aiohttp
+import requests
+from requests.adapters import HTTPAdapter
+from utils.config import Config
+from utils.logger import Logger
+
+class HttpPool:
+	"""
+	Shared keep-alive HTTP connection pool for every outbound caller in utils/.
+
+	Owns one aiohttp session for async callers and one requests session for the
+	remaining synchronous paths, both with per-host connection limits and
+	connect/read timeouts from config. Opened by Core.load_utils and closed on
+	shutdown.
+
+	Usage:
+		session = HttpPool().get_session()
+		async with session.get(url) as resp:
+			...
+	"""
+
+	_instance = None
+
+	def __new__(cls, *args, **kwargs):
+		if cls._instance is None:
+			cls._instance = super().__new__(cls)
+		return cls._instance
+
+	def __init__(self):
+		if hasattr(self, "_initialized") and self._initialized:
+			return
+
+		self.logger = Logger()
+		self.cfg = Config()
+		self.limit = self.cfg.get_variable("HTTP_POOL_LIMIT", 100)
+		self.limit_per_host = self.cfg.get_variable("HTTP_POOL_LIMIT_PER_HOST", 10)
+		# Distinct hosts the sync session keeps a connection pool for
+		self.pool_hosts = self.cfg.get_variable("HTTP_POOL_HOSTS", 4)
+		self.keepalive_timeout = self.cfg.get_variable("HTTP_KEEPALIVE_TIMEOUT", 30)
+		self.connect_timeout = self.cfg.get_variable("HTTP_CONNECT_TIMEOUT", 5)
+		self.read_timeout = self.cfg.get_variable("HTTP_READ_TIMEOUT", 120)
+		self.session = None
+		self.sync_session = None
+		self._initialized = True
+
+	@property
+	def timeout(self) -> tuple:
+		"""(connect, read) timeout tuple for the synchronous session."""
+		return (self.connect_timeout, self.read_timeout)
+
+	def open(self):
+		"""Create the pooled sessions. The async session needs a running event loop."""
+		if self.sync_session is None:
+			self.sync_session = requests.Session()
+			adapter = HTTPAdapter(pool_connections=self.pool_hosts, pool_maxsize=self.limit_per_host)
+			self.sync_session.mount("http://", adapter)
+			self.sync_session.mount("https://", adapter)
+
+		try:
+			asyncio.get_running_loop()
+		except RuntimeError:
+			self.logger.debug("No running event loop, deferring async HTTP session creation")
+			return
+		self.get_session()
+
+	def get_session(self) -> aiohttp.ClientSession:
+		"""Return the shared async session, creating it on first use."""
+		if self.session is None or self.session.closed:
+			connector = aiohttp.TCPConnector(
+				limit=self.limit,
+				limit_per_host=self.limit_per_host,
+				keepalive_timeout=self.keepalive_timeout,
+				ttl_dns_cache=300
+			)
+			timeout = aiohttp.ClientTimeout(
+				total=None,
+				connect=self.connect_timeout,
+				sock_read=self.read_timeout
+			)
+			self.session = aiohttp.ClientSession(connector=connector, timeout=timeout)
+			self.logger.info(f"HTTP pool opened (limit={self.limit}, per_host={self.limit_per_host})")
+		return self.session
+
+	def get_sync_session(self) -> requests.Session:
+		"""Return the shared synchronous session, creating it on first use."""
+		if self.sync_session is None:
+			self.open()
+		return self.sync_session
+
+	async def close(self):
+		if self.session is not None and not self.session.closed:
+			await self.session.close()
+		self.session = None
+		if self.sync_session is not None:
+			self.sync_session.close()
+			self.sync_session = None
+		self.logger.info("HTTP pool closed")
@@ -0,0 +1,147 @@
+# utils/lexical.py
+
+import heapq
+import math
+import re
+import threading
+from collections import Counter
+
+# Words plus identifiers joined by #, @, :, ., /, - or _ (user#1234, e_404,
+# api.example.com), so exact usernames, error codes and command names survive
+_TOKEN = re.compile(r"[0-9a-z_]+(?:[#@:./-][0-9a-z_]+)*")
+_PARTS = re.compile(r"[0-9a-z]+")
+
+def tokenize(text: str) -> list[str]:
+	"""Lowercased terms of text; compound identifiers are kept whole and also split into their parts."""
+	terms = []
+	for token in _TOKEN.findall(text.lower()):
+		terms.append(token)
+		parts = _PARTS.findall(token)
+		if len(parts) > 1 or parts and parts[0] != token:
+			terms.extend(parts)
+	return terms
+
+class LexicalIndex:
+	"""
+	Incrementally maintained BM25 inverted index over the RAG collection.
+
+	Documents are added, replaced and removed by ID as the collection changes,
+	so the index never needs a full rebuild. Only term frequencies, document
+	lengths and the values of filter_fields are kept, not the text itself.
+	Filter fields get their own posting sets, so metadata filters narrow the
+	candidates before any scoring happens.
+
+	Usage:
+		index = LexicalIndex(filter_fields=("guild_id", "channel_id"))
+		index.add("doc1", "Error E404 from !ping", {"guild_id": 1})
+		hits = index.search("e404", top_k=10, where={"guild_id": 1})
+	"""
+
+	def __init__(self, filter_fields: tuple = (), k1: float = 1.2, b: float = 0.75, max_terms: int = 16):
+		self.filter_fields = tuple(filter_fields)
+		self.k1 = k1
+		self.b = b
+		self.max_terms = max_terms
+		# term -> {doc_id: term frequency}
+		self.postings = {}
+		# (field, value) -> {doc_id}
+		self.fields = {}
+		# doc_id -> (length, terms, filter values)
+		self.docs = {}
+		self.total_length = 0
+		self._lock = threading.Lock()
+
+	def __len__(self) -> int:
+		return len(self.docs)
+
+	def add(self, doc_id: str, text: str, metadata: dict = None):
+		"""Index a document, replacing any earlier version with the same ID."""
+		counts = Counter(tokenize(text))
+		metadata = metadata or {}
+		values = tuple((field, metadata[field]) for field in self.filter_fields if field in metadata)
+		with self._lock:
+			self._remove(doc_id)
+			for term, tf in counts.items():
+				self.postings.setdefault(term, {})[doc_id] = tf
+			for value in values:
+				self.fields.setdefault(value, set()).add(doc_id)
+			length = sum(counts.values())
+			self.docs[doc_id] = (length, tuple(counts), values)
+			self.total_length += length
+
+	def remove(self, doc_id: str):
+		with self._lock:
+			self._remove(doc_id)
+
+	def _remove(self, doc_id: str):
+		entry = self.docs.pop(doc_id, None)
+		if entry is None:
+			return
+		length, terms, values = entry
+		self.total_length -= length
+		for term in terms:
+			posting = self.postings[term]
+			del posting[doc_id]
+			if not posting:
+				del self.postings[term]
+		for value in values:
+			ids = self.fields[value]
+			ids.discard(doc_id)
+			if not ids:
+				del self.fields[value]
+
+	def clear(self):
+		with self._lock:
+			self.postings.clear()
+			self.fields.clear()
+			self.docs.clear()
+			self.total_length = 0
+
+	def can_filter(self, where: dict = None) -> bool:
+		"""True if every key of where is a filter field this index can apply."""
+		return not where or all(field in self.filter_fields for field in where)
+
+	def search(self, query: str, top_k: int = 10, where: dict = None) -> list[tuple[str, float]]:
+		"""
+		Return up to top_k (doc_id, score) pairs by BM25 score, best first.
+		where is an equality filter on filter_fields; raises ValueError for
+		other fields. Only the max_terms rarest query terms are scored.
+		"""
+		if not self.can_filter(where):
+			raise ValueError(f"Cannot filter on {sorted(set(where) - set(self.filter_fields))}")
+		terms = set(tokenize(query))
+		with self._lock:
+			if not terms or not self.docs:
+				return []
+			allowed = None
+			for value in (where or {}).items():
+				ids = self.fields.get(value, set())
+				allowed = ids if allowed is None else allowed & ids
+				if not allowed:
+					return []
+
+			count = len(self.docs)
+			average = self.total_length / count or 1
+			postings = sorted((self.postings[term] for term in terms if term in self.postings), key=len)[:self.max_terms]
+			scores = {}
+			for posting in postings:
+				idf = math.log(1 + (count - len(posting) + 0.5) / (len(posting) + 0.5))
+				if allowed is not None and len(allowed) < len(posting):
+					matches = ((doc_id, posting[doc_id]) for doc_id in allowed if doc_id in posting)
+				else:
+					matches = ((doc_id, tf) for doc_id, tf in posting.items() if allowed is None or doc_id in allowed)
+				for doc_id, tf in matches:
+					norm = self.k1 * (1 - self.b + self.b * self.docs[doc_id][0] / average)
+					scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+		return heapq.nlargest(top_k, scores.items(), key=lambda item: item[1])
+
+def reciprocal_rank_fusion(rankings: list[list], k: int = 60) -> list:
+	"""
+	Merge ranked lists of keys into one ranking by reciprocal-rank fusion:
+	each key scores sum(1 / (k + rank)) over the lists it appears in.
+	"""
+	scores = {}
+	for ranking in rankings:
+		for rank, key in enumerate(ranking, start=1):
+			scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank)
+	return sorted(scores, key=scores.get, reverse=True)
@@ -1,7 +1,318 @@
 # utils/logger.py
 
+import atexit
+import glob
+import gzip
+import json
 import logging
+import logging.handlers
 import os
+import queue
+import re
+import shutil
+import struct
+import sys
+import threading
+from datetime import datetime
+
+LOG_FORMAT = '%(asctime)s - %(levelname)s - [%(filename)s] %(message)s'
+
+class _LazyMessage:
+	"""Defers building a log message until a handler formats the record."""
+
+	__slots__ = ("_build", "_text")
+
+	def __init__(self, build):
+		self._build = build
+		self._text = None
+
+	def __str__(self):
+		if self._text is None:
+			self._text = str(self._build())
+		return self._text
+
+class _JsonFormatter(logging.Formatter):
+	"""Formats records as one JSON object per line, merging structured fields at the top level."""
+
+	def format(self, record):
+		entry = {
+			"ts": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+			"level": record.levelname,
+			"file": record.filename,
+			"line": record.lineno,
+			"msg": record.getMessage()
+		}
+		fields = getattr(record, "fields", None)
+		if fields:
+			entry.update(fields)
+		if record.exc_info:
+			entry["exc"] = self.formatException(record.exc_info)
+		return json.dumps(entry, default=str, ensure_ascii=False)
+
+class _BufferedFileHandler(logging.FileHandler):
+	"""FileHandler that leaves flushing to the queue listener so writes are batched."""
+
+	def emit(self, record):
+		if self.stream is None:
+			self.stream = self._open()
+		try:
+			self.stream.write(self.format(record) + self.terminator)
+		except Exception:
+			self.handleError(record)
+
+class _Compressor:
+	"""Background thread that gzips rotated log segments and enforces retention."""
+
+	def __init__(self):
+		self._queue = queue.Queue()
+		self._thread = threading.Thread(target=self._run, name="log-compressor", daemon=True)
+		self._thread.start()
+
+	def submit(self, path: str, base: str, compress: bool, backup_count: int):
+		self._queue.put((path, base, compress, backup_count))
+
+	def join(self):
+		self._queue.join()
+
+	def _run(self):
+		while True:
+			path, base, compress, backup_count = self._queue.get()
+			try:
+				if compress:
+					with open(path, 'rb') as src, gzip.open(path + '.gz', 'wb') as dst:
+						shutil.copyfileobj(src, dst)
+					os.remove(path)
+				_prune_segments(base, backup_count)
+			except Exception as e:
+				sys.stderr.write(f"Log compression failed for {path}: {e}\n")
+			finally:
+				self._queue.task_done()
+
+_SEGMENT_SUFFIX = re.compile(r'^\.(\d{8}-\d{6}-\d{6})(\.gz)?$')
+
+def _prune_segments(base: str, backup_count: int):
+	"""Delete the oldest rotated segments of base beyond backup_count."""
+	if not backup_count:
+		return
+	rotations = {}
+	for segment in glob.glob(glob.escape(base) + '.*'):
+		match = _SEGMENT_SUFFIX.match(segment[len(base):])
+		if match:
+			rotations.setdefault(match.group(1), []).append(segment)
+	for stamp in sorted(rotations)[:-backup_count]:
+		for segment in rotations[stamp]:
+			os.remove(segment)
+
+class _RotatingFileHandler(_BufferedFileHandler):
+	"""
+	Buffered file handler that rotates by size and at the start of each day.
+
+	Rotated segments are renamed with a timestamp suffix and handed to the
+	compressor thread, which gzips them and keeps the newest backup_count.
+	"""
+
+	def __init__(self, filename, max_bytes=0, rotate_daily=True, backup_count=0, compress=True, compressor=None):
+		super().__init__(filename, 'a', 'utf-8')
+		self.max_bytes = max_bytes
+		self.rotate_daily = rotate_daily
+		self.backup_count = backup_count
+		self.compress = compress
+		self.compressor = compressor
+		# Date of the current segment, so daily rotation also happens across restarts
+		self._opened_on = datetime.fromtimestamp(os.path.getmtime(self.baseFilename)).date()
+		# Bytes in the current segment, counted here because tell() on a text
+		# stream flushes its buffer and would undo the batched writes
+		self._bytes = os.path.getsize(self.baseFilename)
+
+	def _should_rollover(self) -> bool:
+		if self.rotate_daily and datetime.now().date() != self._opened_on:
+			return True
+		return bool(self.max_bytes) and self._bytes >= self.max_bytes
+
+	def _write(self, text: str) -> int:
+		"""Write text to the current segment and return the byte offset it starts at."""
+		if self.stream is None:
+			self.stream = self._open()
+		offset = self._bytes
+		self.stream.write(text)
+		self._bytes += len(text.encode(self.encoding or 'utf-8'))
+		return offset
+
+	def _rotated_paths(self) -> list:
+		"""Files that rotate together with this handler's log file."""
+		return [self.baseFilename]
+
+	def rollover(self):
+		if self.stream is not None:
+			self.stream.close()
+			self.stream = None
+		stamp = datetime.now().strftime('%Y%m%d-%H%M%S-%f')
+		for path in self._rotated_paths():
+			if os.path.exists(path):
+				rotated = f"{path}.{stamp}"
+				os.rename(path, rotated)
+				if self.compressor is not None:
+					self.compressor.submit(rotated, path, self.compress, self.backup_count)
+		self._opened_on = datetime.now().date()
+		self.stream = self._open()
+		self._bytes = 0
+
+	def emit(self, record):
+		try:
+			if self._should_rollover():
+				self.rollover()
+			self._write(self.format(record) + self.terminator)
+		except Exception:
+			self.handleError(record)
+
+class _IndexedFileHandler(_RotatingFileHandler):
+	"""
+	Writes every record once to a single file, plus a sidecar index per level.
+
+	Each sidecar (e.g. app.log.WARNING.idx) holds the 8-byte byte offsets of the
+	records at that level, so per-level views can be read back with
+	read_indexed_records without duplicating the records across files.
+	"""
+
+	INDEXED_LEVELS = ('INFO', 'WARNING', 'ERROR', 'CRITICAL')
+
+	def __init__(self, filename, **kwargs):
+		self._indexes = {}
+		super().__init__(filename, **kwargs)
+
+	def _index_path(self, level_name: str) -> str:
+		return f"{self.baseFilename}.{level_name}.idx"
+
+	def _rotated_paths(self) -> list:
+		return [self.baseFilename] + [self._index_path(level) for level in self.INDEXED_LEVELS]
+
+	def rollover(self):
+		self._close_indexes()
+		super().rollover()
+
+	def _close_indexes(self):
+		for index in self._indexes.values():
+			index.close()
+		self._indexes.clear()
+
+	def emit(self, record):
+		try:
+			if self._should_rollover():
+				self.rollover()
+			offset = self._write(self.format(record) + self.terminator)
+			if record.levelname in self.INDEXED_LEVELS:
+				index = self._indexes.get(record.levelname)
+				if index is None:
+					index = open(self._index_path(record.levelname), 'ab')
+					self._indexes[record.levelname] = index
+				index.write(struct.pack('<Q', offset))
+		except Exception:
+			self.handleError(record)
+
+	def flush(self):
+		super().flush()
+		for index in self._indexes.values():
+			index.flush()
+
+	def close(self):
+		self._close_indexes()
+		super().close()
+
+def read_indexed_records(log_path: str, level_name: str):
+	"""Yield the lines of a single-file log written at level_name, using its sidecar index."""
+	index_path = f"{log_path}.{level_name}.idx"
+	if not os.path.exists(index_path):
+		return
+	with open(index_path, 'rb') as index, open(log_path, 'rb') as log:
+		while True:
+			chunk = index.read(8)
+			if len(chunk) < 8:
+				return
+			log.seek(struct.unpack('<Q', chunk)[0])
+			yield log.readline().decode('utf-8').rstrip('\n')
+
+class _BoundedQueueHandler(logging.handlers.QueueHandler):
+	"""
+	QueueHandler with a bounded queue and a drop or block policy when it is full.
+
+	The message is rendered on the calling thread, so arguments are captured
+	as they were at the call and never read from the listener thread; records
+	are laid out and written by the listener thread. Disabled levels are
+	skipped by Logger before a record is built.
+	"""
+
+	def __init__(self, log_queue: queue.Queue, policy: str = "drop", block_timeout: float = 1.0):
+		super().__init__(log_queue)
+		self.policy = policy
+		self.block_timeout = block_timeout
+		self.dropped = 0
+		self._unreported = 0
+
+	def prepare(self, record):
+		record.msg = record.getMessage()
+		record.args = None
+		return record
+
+	def enqueue(self, record):
+		try:
+			if self.policy == "block":
+				self.queue.put(record, timeout=self.block_timeout)
+			else:
+				self.queue.put_nowait(record)
+		except queue.Full:
+			self.dropped += 1
+			self._unreported += 1
+			return
+
+		if self._unreported:
+			notice = logging.LogRecord(
+				record.name, logging.WARNING, __file__, 0,
+				f"Log queue full, dropped {self._unreported} records", None, None
+			)
+			try:
+				self.queue.put_nowait(notice)
+				self._unreported = 0
+			except queue.Full:
+				pass
+
+class _BatchQueueListener(logging.handlers.QueueListener):
+	"""QueueListener that drains records in batches and flushes handlers once per batch."""
+
+	def __init__(self, log_queue: queue.Queue, *handlers, batch_size: int = 256):
+		super().__init__(log_queue, *handlers, respect_handler_level=True)
+		self.batch_size = batch_size
+
+	def enqueue_sentinel(self):
+		# Block rather than fail when the queue is full so shutdown always drains it
+		self.queue.put(self._sentinel)
+
+	def _flush_handlers(self):
+		for handler in self.handlers:
+			try:
+				handler.flush()
+			except Exception:
+				pass
+
+	def _monitor(self):
+		q = self.queue
+		while True:
+			record = q.get()
+			handled = 0
+			while True:
+				if record is self._sentinel:
+					q.task_done()
+					self._flush_handlers()
+					return
+				self.handle(record)
+				q.task_done()
+				handled += 1
+				if handled >= self.batch_size:
+					break
+				try:
+					record = q.get_nowait()
+				except queue.Empty:
+					break
+			self._flush_handlers()
 
 class Logger:
 
@@ -12,48 +323,155 @@ class Logger:
 			cls._instance = super().__new__(cls)
 		return cls._instance
 
-	def __init__(self, log_dir='./logs'):
+	def __init__(self, log_dir='./logs', queue_size=10000, queue_policy='drop', batch_size=256):
 		if hasattr(self, "_initialized") and self._initialized:
 			return
 
 		self.logger = logging.getLogger("app_logger")
 		self.logger.setLevel(logging.DEBUG)
+		self.log_dir = log_dir
+		self.handlers = []
+		self.queue_handler = None
+		self.listener = None
+		self.compressor = None
+		self.file_options = {
+			"output": "text",
+			"file_mode": "per_level",
+			"max_bytes": 50 * 1024 * 1024,
+			"rotate_daily": True,
+			"backup_count": 14,
+			"compress": True
+		}
 
 		if not self.logger.handlers:
 			os.makedirs(log_dir, exist_ok=True)
-
-			# Create and add file handlers
-			self.logger.addHandler(self._create_handler(logging.DEBUG, os.path.join(log_dir, 'debug.log')))
-			self.logger.addHandler(self._create_handler(logging.INFO, os.path.join(log_dir, 'info.log')))
-			self.logger.addHandler(self._create_handler(logging.WARNING, os.path.join(log_dir, 'warning.log')))
-			self.logger.addHandler(self._create_handler(logging.ERROR, os.path.join(log_dir, 'error.log')))
-
-			# Create and add console handler with formatter
-			console_handler = logging.StreamHandler()
-			console_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - [%(filename)s] %(message)s'))
-			self.logger.addHandler(console_handler)
+			self.compressor = _Compressor()
+			self._build_handlers()
+			self._start(queue_size, queue_policy, batch_size)
+			atexit.register(self.stop)
 
 			self.logger.info("Logger initialized.")
 
 		self._initialized = True
 
+	def _build_handlers(self):
+		"""Create the file and console handlers that run on the listener's background thread."""
+		for handler in self.handlers:
+			handler.close()
+		self.handlers = []
+
+		options = dict(self.file_options)
+		file_mode = options.pop("file_mode")
+		options.pop("output")
+		if file_mode == "single":
+			# Each record is written once; per-level views come from sidecar offset indexes
+			handler = _IndexedFileHandler(os.path.join(self.log_dir, 'app.log'), compressor=self.compressor, **options)
+			handler.setLevel(logging.DEBUG)
+			handler.setFormatter(self._file_formatter())
+			self.handlers.append(handler)
+		else:
+			self.handlers.append(self._create_handler(logging.DEBUG, os.path.join(self.log_dir, 'debug.log')))
+			self.handlers.append(self._create_handler(logging.INFO, os.path.join(self.log_dir, 'info.log')))
+			self.handlers.append(self._create_handler(logging.WARNING, os.path.join(self.log_dir, 'warning.log')))
+			self.handlers.append(self._create_handler(logging.ERROR, os.path.join(self.log_dir, 'error.log')))
+
+		console_handler = logging.StreamHandler()
+		console_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+		self.handlers.append(console_handler)
+
+	def _file_formatter(self) -> logging.Formatter:
+		if self.file_options["output"] == "json":
+			return _JsonFormatter()
+		return logging.Formatter(LOG_FORMAT)
+
 	def _create_handler(self, level, filepath):
-		handler = logging.FileHandler(filepath, 'a', 'utf-8')
+		options = dict(self.file_options)
+		options.pop("file_mode")
+		options.pop("output")
+		handler = _RotatingFileHandler(filepath, compressor=self.compressor, **options)
 		handler.setLevel(level)
-		handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - [%(filename)s] %(message)s'))
+		handler.setFormatter(self._file_formatter())
 		return handler
 
-	def debug(self, msg):
-		self.logger.debug(msg, stacklevel=2)
+	def _start(self, queue_size, queue_policy, batch_size):
+		log_queue = queue.Queue(maxsize=queue_size)
+		self.queue_handler = _BoundedQueueHandler(log_queue, queue_policy)
+		self.listener = _BatchQueueListener(log_queue, *self.handlers, batch_size=batch_size)
+		self.logger.addHandler(self.queue_handler)
+		self.listener.start()
+
+	def configure(self, level=None, queue_size=None, queue_policy=None, batch_size=None, **file_options):
+		"""
+		Apply settings loaded from config, draining records queued so far.
+
+		Args:
+			level (str): Minimum level to record, e.g. 'INFO'. Calls below it
+				return before any message formatting happens.
+			queue_size (int): Maximum number of queued records.
+			queue_policy (str): 'drop' or 'block' when the queue is full.
+			batch_size (int): Records written between flushes.
+			file_options: output ('text' or 'json'), file_mode ('per_level' or
+				'single'), max_bytes, rotate_daily, backup_count and compress.
+				None values are ignored.
+		"""
+		if level:
+			self.logger.setLevel(level.upper() if isinstance(level, str) else level)
+		if self.listener is None:
+			return
+		queue_size = queue_size or self.queue_handler.queue.maxsize
+		queue_policy = queue_policy or self.queue_handler.policy
+		batch_size = batch_size or self.listener.batch_size
+		self.stop()
+		changed = {key: value for key, value in file_options.items() if value is not None}
+		if changed and changed != {key: self.file_options.get(key) for key in changed}:
+			self.file_options.update(changed)
+			self._build_handlers()
+		self._start(queue_size, queue_policy, batch_size)
+
+	def stop(self):
+		"""Flush queued records and stop the background writer."""
+		if self.listener is None or self.listener._thread is None:
+			return
+		self.logger.removeHandler(self.queue_handler)
+		self.listener.stop()
+		if self.compressor is not None:
+			self.compressor.join()
+
+	def stats(self) -> dict:
+		if self.queue_handler is None:
+			return {}
+		return {
+			"queued": self.queue_handler.queue.qsize(),
+			"queue_size": self.queue_handler.queue.maxsize,
+			"dropped": self.queue_handler.dropped
+		}
+
+	def _log(self, level, msg, args, fields):
+		"""
+		Log msg lazily.
+
+		msg may use %-style placeholders filled from args, or be a zero-argument
+		callable returning the message; either way it is only formatted if the
+		record is emitted. Keyword fields (guild, channel, cog, latency_ms, model,
+		...) are attached to the record and written as top-level keys in JSON output.
+		"""
+		if not self.logger.isEnabledFor(level):
+			return
+		if callable(msg):
+			msg = _LazyMessage(msg)
+		self.logger.log(level, msg, *args, extra={"fields": fields} if fields else None, stacklevel=3)
+
+	def debug(self, msg, *args, **fields):
+		self._log(logging.DEBUG, msg, args, fields)
 
-	def info(self, msg):
-		self.logger.info(msg, stacklevel=2)
+	def info(self, msg, *args, **fields):
+		self._log(logging.INFO, msg, args, fields)
 
-	def warning(self, msg):
-		self.logger.warning(msg, stacklevel=2)
+	def warning(self, msg, *args, **fields):
+		self._log(logging.WARNING, msg, args, fields)
 
-	def error(self, msg):
-		self.logger.error(msg, stacklevel=2)
+	def error(self, msg, *args, **fields):
+		self._log(logging.ERROR, msg, args, fields)
 
-	def critical(self, msg):
-		self.logger.critical(msg, stacklevel=2)
+	def critical(self, msg, *args, **fields):
+		self._log(logging.CRITICAL, msg, args, fields)
@@ -0,0 +1,397 @@
+# utils/metrics.py
+
+import asyncio
+import bisect
+import contextlib
+import functools
+import inspect
+import math
+import socket
+import threading
+import time
+from utils.logger import Logger
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+def _escape(value) -> str:
+	return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+def _format_labels(labels: dict) -> str:
+	if not labels:
+		return ""
+	return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + "}"
+
+def _format_value(value: float) -> str:
+	if value == math.inf:
+		return "+Inf"
+	return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Counter:
+	"""Monotonic counter keyed by label values."""
+
+	type = "counter"
+
+	def __init__(self, name: str, description: str, labelnames: tuple = ()):
+		self.name = name
+		self.description = description
+		self.labelnames = tuple(labelnames)
+		self._values = {}
+		self._lock = threading.Lock()
+
+	def _key(self, labels: dict) -> tuple:
+		return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+	def inc(self, amount: float = 1, **labels):
+		key = self._key(labels)
+		with self._lock:
+			self._values[key] = self._values.get(key, 0) + amount
+
+	def get(self, **labels) -> float:
+		with self._lock:
+			return self._values.get(self._key(labels), 0)
+
+	def items(self) -> list:
+		"""Return (labels, value) pairs."""
+		with self._lock:
+			return [(dict(zip(self.labelnames, key)), value) for key, value in self._values.items()]
+
+	def render(self) -> list[str]:
+		return [f"{self.name}{_format_labels(labels)} {_format_value(value)}" for labels, value in self.items()]
+
+class Gauge(Counter):
+	"""Value that can go up and down, keyed by label values."""
+
+	type = "gauge"
+
+	def set(self, value: float, **labels):
+		key = self._key(labels)
+		with self._lock:
+			self._values[key] = value
+
+	def dec(self, amount: float = 1, **labels):
+		self.inc(-amount, **labels)
+
+class Histogram:
+	"""Cumulative bucketed histogram keyed by label values, with quantile estimates."""
+
+	type = "histogram"
+
+	def __init__(self, name: str, description: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+		self.name = name
+		self.description = description
+		self.labelnames = tuple(labelnames)
+		self.buckets = tuple(sorted(buckets)) + (math.inf,)
+		# label key -> [per-bucket counts, sum, count]
+		self._series = {}
+		self._lock = threading.Lock()
+
+	def _key(self, labels: dict) -> tuple:
+		return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+	def observe(self, value: float, **labels):
+		key = self._key(labels)
+		index = bisect.bisect_left(self.buckets, value)
+		with self._lock:
+			series = self._series.get(key)
+			if series is None:
+				series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+			series[0][index] += 1
+			series[1] += value
+			series[2] += 1
+
+	def items(self) -> list:
+		"""Return (labels, cumulative bucket counts, sum, count) tuples."""
+		with self._lock:
+			snapshot = [(key, list(series[0]), series[1], series[2]) for key, series in self._series.items()]
+		result = []
+		for key, counts, total, count in snapshot:
+			cumulative, running = [], 0
+			for bucket_count in counts:
+				running += bucket_count
+				cumulative.append(running)
+			result.append((dict(zip(self.labelnames, key)), cumulative, total, count))
+		return result
+
+	def quantile(self, q: float, cumulative: list) -> float:
+		"""
+		Estimate the q-quantile from cumulative bucket counts by linear
+		interpolation inside the bucket that holds the target rank, the same way
+		Prometheus' histogram_quantile does.
+		"""
+		count = cumulative[-1] if cumulative else 0
+		if not count:
+			return 0.0
+		rank = q * count
+		index = bisect.bisect_left(cumulative, rank)
+		upper = self.buckets[index]
+		lower = self.buckets[index - 1] if index > 0 else 0.0
+		if upper == math.inf:
+			return lower
+		below = cumulative[index - 1] if index > 0 else 0
+		in_bucket = cumulative[index] - below
+		if not in_bucket:
+			return upper
+		return lower + (upper - lower) * (rank - below) / in_bucket
+
+	def render(self) -> list[str]:
+		lines = []
+		for labels, cumulative, total, count in self.items():
+			for bound, value in zip(self.buckets, cumulative):
+				lines.append(f"{self.name}_bucket{_format_labels({**labels, 'le': _format_value(bound)})} {value}")
+			lines.append(f"{self.name}_sum{_format_labels(labels)} {_format_value(total)}")
+			lines.append(f"{self.name}_count{_format_labels(labels)} {count}")
+		return lines
+
+class Metrics:
+	"""
+	Process-wide registry of counters and histograms, rendered in the
+	Prometheus text exposition format.
+
+	AI backends and RAG queries are instrumented with the track decorator, which
+	records call counts by status and latency; AI additionally records prompt and
+	completion token usage reported by the backend.
+
+	Usage:
+		metrics = Metrics()
+		metrics.counter("jobs_total", "Jobs run", ("kind",)).inc(kind="sync")
+		text = metrics.render()
+	"""
+
+	_instance = None
+
+	def __new__(cls, *args, **kwargs):
+		if cls._instance is None:
+			cls._instance = super().__new__(cls)
+		return cls._instance
+
+	def __init__(self):
+		if hasattr(self, "_initialized") and self._initialized:
+			return
+
+		self._metrics = {}
+		self._lock = threading.Lock()
+		self.requests = self.counter("bot_requests_total", "Instrumented calls by backend, model, method and status.", ("backend", "model", "method", "status"))
+		self.latency = self.histogram("bot_request_duration_seconds", "Latency of instrumented calls in seconds.", ("backend", "model", "method"))
+		self.tokens = self.counter("bot_tokens_total", "Tokens reported by AI backends.", ("backend", "model", "direction"))
+		self._initialized = True
+
+	def _register(self, cls, name: str, *args, **kwargs):
+		with self._lock:
+			metric = self._metrics.get(name)
+			if metric is None:
+				metric = self._metrics[name] = cls(name, *args, **kwargs)
+			elif type(metric) is not cls:
+				raise ValueError(f"Metric {name} is already registered as a {metric.type}")
+			return metric
+
+	def counter(self, name: str, description: str, labelnames: tuple = ()) -> Counter:
+		"""Return the counter registered under name, creating it if needed."""
+		return self._register(Counter, name, description, labelnames)
+
+	def gauge(self, name: str, description: str, labelnames: tuple = ()) -> Gauge:
+		"""Return the gauge registered under name, creating it if needed."""
+		return self._register(Gauge, name, description, labelnames)
+
+	def histogram(self, name: str, description: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS) -> Histogram:
+		"""Return the histogram registered under name, creating it if needed."""
+		return self._register(Histogram, name, description, labelnames, buckets)
+
+	def record_tokens(self, backend: str, model: str, prompt_tokens, completion_tokens):
+		"""Add token usage; values the backend did not report (None or non-integers) are ignored."""
+		if isinstance(prompt_tokens, int):
+			self.tokens.inc(prompt_tokens, backend=backend, model=model, direction="in")
+		if isinstance(completion_tokens, int):
+			self.tokens.inc(completion_tokens, backend=backend, model=model, direction="out")
+
+	def render(self) -> str:
+		"""Render every metric in the Prometheus text format."""
+		with self._lock:
+			metrics = list(self._metrics.values())
+		lines = []
+		for metric in metrics:
+			lines.append(f"# HELP {metric.name} {metric.description}")
+			lines.append(f"# TYPE {metric.name} {metric.type}")
+			lines.extend(metric.render())
+		return "\n".join(lines) + "\n"
+
+	def summary(self) -> list[dict]:
+		"""
+		Per backend/model totals for a human-readable dump: call and error
+		counts, p50/p99 latency in milliseconds and tokens in/out.
+		"""
+		rows = {}
+
+		def row_for(labels):
+			return rows.setdefault((labels["backend"], labels["model"]), {"calls": 0, "errors": 0, "p50_ms": 0.0, "p99_ms": 0.0, "tokens_in": 0, "tokens_out": 0})
+
+		latencies = {}
+		for labels, cumulative, _, _ in self.latency.items():
+			row_for(labels)
+			key = (labels["backend"], labels["model"])
+			merged = latencies.get(key)
+			latencies[key] = cumulative if merged is None else [a + b for a, b in zip(merged, cumulative)]
+		for labels, value in self.requests.items():
+			row = row_for(labels)
+			row["calls"] += value
+			if labels["status"] == "error":
+				row["errors"] += value
+		for labels, value in self.tokens.items():
+			row_for(labels)["tokens_" + labels["direction"]] += value
+
+		summary = []
+		for (backend, model), row in sorted(rows.items()):
+			cumulative = latencies.get((backend, model))
+			if cumulative:
+				row["p50_ms"] = round(self.latency.quantile(0.5, cumulative) * 1000, 1)
+				row["p99_ms"] = round(self.latency.quantile(0.99, cumulative) * 1000, 1)
+			summary.append({"backend": backend, "model": model, **row})
+		return summary
+
+def _is_error(result) -> bool:
+	# AI methods report failures by returning an "Error: ..." string instead of raising
+	return isinstance(result, str) and result.startswith("Error: ")
+
+def track(backend: str, model_from_args: bool = True):
+	"""
+	Decorate a sync method, coroutine or async generator to record call counts
+	by status and latency in the Metrics registry.
+
+	The model label is the first positional argument (or the model keyword) when
+	model_from_args is set, otherwise the instance's model_name attribute. A call
+	is an error if it raises or returns/yields an "Error: ..." string.
+	"""
+	def decorator(func):
+		method = func.__name__
+
+		def model_label(self, args, kwargs):
+			if model_from_args:
+				return kwargs.get("model", args[0] if args else "")
+			return getattr(self, "model_name", "")
+
+		def record(model, started, failed):
+			metrics = Metrics()
+			metrics.latency.observe(time.perf_counter() - started, backend=backend, model=model, method=method)
+			metrics.requests.inc(backend=backend, model=model, method=method, status="error" if failed else "ok")
+
+		if inspect.isasyncgenfunction(func):
+			@functools.wraps(func)
+			async def stream_wrapper(self, *args, **kwargs):
+				model = model_label(self, args, kwargs)
+				started = time.perf_counter()
+				failed = False
+				try:
+					async for item in func(self, *args, **kwargs):
+						failed = failed or _is_error(item)
+						yield item
+				except GeneratorExit:
+					# The consumer stopped early; that is not a backend failure
+					raise
+				except BaseException:
+					failed = True
+					raise
+				finally:
+					record(model, started, failed)
+			return stream_wrapper
+
+		if asyncio.iscoroutinefunction(func):
+			@functools.wraps(func)
+			async def async_wrapper(self, *args, **kwargs):
+				model = model_label(self, args, kwargs)
+				started = time.perf_counter()
+				failed = True
+				try:
+					result = await func(self, *args, **kwargs)
+					failed = _is_error(result)
+					return result
+				finally:
+					record(model, started, failed)
+			return async_wrapper
+
+		@functools.wraps(func)
+		def wrapper(self, *args, **kwargs):
+			model = model_label(self, args, kwargs)
+			started = time.perf_counter()
+			failed = True
+			try:
+				result = func(self, *args, **kwargs)
+				failed = _is_error(result)
+				return result
+			finally:
+				record(model, started, failed)
+		return wrapper
+	return decorator
+
+class MetricsServer:
+	"""
+	Serves Metrics().render() at GET /metrics with FastAPI on uvicorn, inside
+	the bot's event loop. FastAPI and uvicorn are imported on start so the rest
+	of the bot does not depend on them.
+
+	The listening socket is bound in start(), so a port that is already taken
+	raises OSError to the caller instead of uvicorn exiting the process from
+	inside the background task.
+	"""
+
+	def __init__(self, host: str = "127.0.0.1", port: int = 9100):
+		self.host = host
+		self.port = port
+		self.logger = Logger()
+		self.server = None
+		self.task = None
+		self.socket = None
+
+	def build_app(self):
+		from fastapi import FastAPI
+		from fastapi.responses import PlainTextResponse
+
+		app = FastAPI(docs_url=None, redoc_url=None, openapi_url=None)
+
+		@app.get("/metrics", response_class=PlainTextResponse)
+		async def metrics():
+			return PlainTextResponse(Metrics().render(), media_type="text/plain; version=0.0.4")
+
+		return app
+
+	def bind(self) -> socket.socket:
+		"""Bind the listening socket; raises OSError if the address is unavailable."""
+		family = socket.AF_INET6 if ":" in self.host else socket.AF_INET
+		sock = socket.socket(family, socket.SOCK_STREAM)
+		try:
+			sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+			sock.bind((self.host, self.port))
+			sock.set_inheritable(True)
+		except BaseException:
+			sock.close()
+			raise
+		return sock
+
+	def start(self) -> asyncio.Task:
+		"""Start serving in the background on the running event loop."""
+		import uvicorn
+
+		self.socket = self.bind()
+		config = uvicorn.Config(self.build_app(), host=self.host, port=self.port, log_level="warning", lifespan="off")
+		self.server = uvicorn.Server(config)
+		# The bot owns signal handling; uvicorn must not replace its handlers
+		self.server.capture_signals = contextlib.nullcontext
+		self.task = asyncio.create_task(self._serve())
+		self.logger.info("Metrics endpoint listening on %s:%d/metrics", self.host, self.port)
+		return self.task
+
+	async def _serve(self):
+		# uvicorn calls sys.exit() when startup fails; keep that from ending the bot
+		try:
+			await self.server.serve(sockets=[self.socket])
+		except (SystemExit, OSError) as e:
+			self.logger.error("Metrics endpoint stopped: %r", e)
+		finally:
+			self.socket.close()
+
+	async def stop(self):
+		if self.server is None:
+			return
+		self.server.should_exit = True
+		if self.task is not None:
+			await self.task
+		self.server = None
+		self.task = None
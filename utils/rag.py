@@ -1,10 +1,78 @@
 # utils/rag.py
 import os
+import json
+import time
+import hashlib
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from typing import Callable, Iterable
+import numpy as np
 os.environ["ANONYMIZED_TELEMETRY"] = "False" # disable anonymized telemetry for ChromaDB
-from sentence_transformers import SentenceTransformer
-import chromadb
-from chromadb.config import Settings
+from utils.batcher import MicroBatcher
+from utils.cache import LRUCache
+from utils.chunker import Chunker
+from utils.config import Config
+from utils.lexical import LexicalIndex, reciprocal_rank_fusion
 from utils.logger import Logger
+from utils.metrics import Metrics, track
+from utils.singleflight import SingleFlight
+from utils.vector_store import MemmapVectorStore, VectorStore
+
+# sentence_transformers and chromadb take seconds to import, so they are loaded on
+# first use by _import_dependencies rather than when this module is imported.
+SentenceTransformer = None
+chromadb = None
+Settings = None
+
+def _import_dependencies(chroma: bool = True):
+	global SentenceTransformer, chromadb, Settings
+	if SentenceTransformer is None:
+		from sentence_transformers import SentenceTransformer as _SentenceTransformer
+		SentenceTransformer = _SentenceTransformer
+	if not chroma:
+		return
+	if chromadb is None:
+		import chromadb as _chromadb
+		chromadb = _chromadb
+	if Settings is None:
+		from chromadb.config import Settings as _Settings
+		Settings = _Settings
+
+EMBEDDING_BACKENDS = ("torch", "torch-int8", "onnx")
+
+def embedding_identity(model_name: str, backend: str = "torch", onnx_file: str = None) -> str:
+	"""
+	Name recorded with every stored embedding. Backends produce slightly
+	different vectors, so a change of backend or ONNX export counts as a change
+	of model and reindex_documents re-embeds. torch keeps the bare model name.
+	"""
+	if backend == "torch":
+		return model_name
+	if backend == "onnx" and onnx_file:
+		return f"{model_name}:onnx:{onnx_file}"
+	return f"{model_name}:{backend}"
+
+def load_embedder(model_name: str, backend: str = "torch", onnx_file: str = None):
+	"""
+	Load the sentence embedding model with one of EMBEDDING_BACKENDS:
+
+		torch       fp32 PyTorch, the reference
+		torch-int8  PyTorch on CPU with Linear layers dynamically quantized to int8
+		onnx        ONNX Runtime; onnx_file picks an export from the model repo,
+		            e.g. "onnx/model_qint8_avx512.onnx" for a quantized one
+	"""
+	_import_dependencies(chroma=False)
+	if backend == "onnx":
+		return SentenceTransformer(model_name, backend="onnx", model_kwargs={"file_name": onnx_file} if onnx_file else None)
+	if backend == "torch-int8":
+		import torch
+		model = SentenceTransformer(model_name, device="cpu")
+		return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+	if backend != "torch":
+		raise ValueError(f"Unknown embedding backend {backend!r}, expected one of {EMBEDDING_BACKENDS}")
+	return SentenceTransformer(model_name)
 
 class Rag:
 
@@ -20,35 +88,361 @@ class Rag:
 			return
 
 		self.logger = Logger()
+		self.cfg = Config()
+		self.model_name = self.cfg.get_variable("RAG_EMBEDDING_MODEL", "all-MiniLM-L6-v2")
+		self.embedding_backend = self.cfg.get_variable("RAG_EMBEDDING_BACKEND", "torch")
+		self.onnx_file = self.cfg.get_variable("RAG_ONNX_FILE", None)
+		self.embedding_id = embedding_identity(self.model_name, self.embedding_backend, self.onnx_file)
+		self.vector_store = self.cfg.get_variable("RAG_VECTOR_STORE", "chroma")
+		self.embed_batch_size = self.cfg.get_variable("RAG_EMBED_BATCH_SIZE", 64)
+		self.write_batch_size = self.cfg.get_variable("RAG_WRITE_BATCH_SIZE", 1000)
+		self.scan_page_size = self.cfg.get_variable("RAG_SCAN_PAGE_SIZE", 1000)
+		self.near_duplicate_threshold = self.cfg.get_variable("RAG_NEAR_DUPLICATE_THRESHOLD", 0.97)
+		self.near_duplicate_neighbors = self.cfg.get_variable("RAG_NEAR_DUPLICATE_NEIGHBORS", 5)
+		self.top_k = self.cfg.get_variable("RAG_TOP_K", 4)
+		self.hybrid = self.cfg.get_variable("RAG_HYBRID", True)
+		self.candidates = self.cfg.get_variable("RAG_HYBRID_CANDIDATES", 20)
+		self.rrf_k = self.cfg.get_variable("RAG_RRF_K", 60)
+		self.query_budget = self.cfg.get_variable("RAG_QUERY_BUDGET_MS", 250) / 1000
+		# MiniLM truncates input at 256 word pieces, so longer documents are
+		# split into overlapping chunks that each get their own embedding
+		self.chunking = self.cfg.get_variable("RAG_CHUNKING", True)
+		self.chunk_neighbors = self.cfg.get_variable("RAG_CHUNK_NEIGHBORS", 1)
+		self.chunker = Chunker(
+			max_tokens=self.cfg.get_variable("RAG_CHUNK_TOKENS", 200),
+			overlap=self.cfg.get_variable("RAG_CHUNK_OVERLAP", 40),
+			count=self._count_tokens
+		)
+		self.embedding_cache = LRUCache(
+			max_entries=self.cfg.get_variable("RAG_EMBEDDING_CACHE_SIZE", 4096),
+			ttl=self.cfg.get_variable("RAG_EMBEDDING_CACHE_TTL", 3600)
+		)
+
+		# Encoding runs on a dedicated pool so it never blocks the event loop; concurrent
+		# async queries arriving within the batch window share a single forward pass.
+		self._executor = ThreadPoolExecutor(
+			max_workers=self.cfg.get_variable("RAG_ENCODE_WORKERS", 1),
+			thread_name_prefix="rag-encode"
+		)
+		self._query_batcher = MicroBatcher(
+			self._encode,
+			self._executor,
+			window_ms=self.cfg.get_variable("RAG_BATCH_WINDOW_MS", 5),
+			max_batch=self.embed_batch_size
+		)
+		self._inflight = SingleFlight("rag")
+
+		# BM25 index for exact keyword hits (usernames, error codes, command names)
+		# that embeddings miss; built from the collection by a background thread,
+		# then kept up to date by every write. Queries skip it until it is built.
+		self.filter_fields = self.cfg.get_variable("RAG_FILTER_FIELDS", ["guild_id", "channel_id", "author_id"])
+		self.lexical = LexicalIndex(
+			filter_fields=self.filter_fields,
+			max_terms=self.cfg.get_variable("RAG_LEXICAL_MAX_TERMS", 16)
+		)
+		self.lexical_retry = self.cfg.get_variable("RAG_LEXICAL_RETRY_SECONDS", 60)
+		self._lexical_ready = threading.Event()
+		self._lexical_lock = threading.Lock()
+		self._lexical_building = False
+		self._lexical_failed_at = None
+		# IDs written or deleted while the build runs; the build must not
+		# overwrite them with the older copies it read from the collection
+		self._lexical_touched = set()
+		self.over_budget = Metrics().counter("bot_rag_over_budget_total", "RAG queries answered without vector results because they missed RAG_QUERY_BUDGET_MS.")
+
+		# The model and vector store are loaded on first use, or ahead of time in the
+		# background via initialize_async; readiness is tracked here. collection is
+		# whichever store RAG_VECTOR_STORE selects; both speak the VectorStore API.
+		self.embedder = None
+		self.chroma = None
+		self.collection: VectorStore = None
+		self.timings = {}
+		self._ready = threading.Event()
+		self._init_lock = threading.Lock()
+		self._initialized = True
 
+	@property
+	def ready(self) -> bool:
+		return self._ready.is_set()
+
+	def _load(self):
+		"""Import dependencies, load the embedding model and open the vector store, timing each phase."""
+		started = time.perf_counter()
+		_import_dependencies(chroma=self.vector_store == "chroma")
+		self.timings["imports"] = time.perf_counter() - started
+
+		phase_started = time.perf_counter()
 		try:
-			self.embedder = SentenceTransformer("all-MiniLM-L6-v2")
+			self.embedder = load_embedder(self.model_name, self.embedding_backend, self.onnx_file)
 		except Exception as e:
-			self.logger.error(f"Error initializing SentenceTransformer: {e}")
+			self.logger.error(f"Error initializing SentenceTransformer ({self.embedding_backend}): {e}")
 			raise
+		self.timings["model"] = time.perf_counter() - phase_started
 
+		phase_started = time.perf_counter()
 		try:
-			self.chroma = chromadb.PersistentClient(path="./rag_db", settings=Settings(anonymized_telemetry=False))
-			self.collection = self.chroma.get_or_create_collection("discord_knowledge")
+			self.collection = self._open_vector_store()
 		except Exception as e:
-			self.logger.error(f"Error initializing ChromaDB client or collection: {e}")
+			self.logger.error(f"Error initializing {self.vector_store} vector store: {e}")
 			raise
+		self.timings["store"] = time.perf_counter() - phase_started
+		self.timings["total"] = time.perf_counter() - started
 
-		self._initialized = True
+		self.logger.info(
+			f"RAG initialized with the {self.embedding_backend} embedding backend in {self.timings['total']:.2f}s "
+			f"(imports={self.timings['imports']:.2f}s, model={self.timings['model']:.2f}s, store={self.timings['store']:.2f}s)"
+		)
 
-	def add_document(self, text: str, doc_id=None, metadata: dict = None):
-		"""Add a document with embedding and optional metadata."""
+	def _open_vector_store(self) -> VectorStore:
+		"""Open the RAG_VECTOR_STORE backend: "chroma" (PersistentClient) or "memmap" (MemmapVectorStore)."""
+		if self.vector_store == "memmap":
+			store = MemmapVectorStore(
+				path=self.cfg.get_variable("RAG_MEMMAP_PATH", "./rag_index"),
+				dtype=self.cfg.get_variable("RAG_MEMMAP_DTYPE", "float16"),
+				ivf_lists=self.cfg.get_variable("RAG_MEMMAP_IVF_LISTS", 0),
+				ivf_probes=self.cfg.get_variable("RAG_MEMMAP_IVF_PROBES", 8),
+				index_fields=self.filter_fields
+			)
+			store.ensure_ivf()
+			return store
+		if self.vector_store != "chroma":
+			raise ValueError(f"Unknown RAG_VECTOR_STORE: {self.vector_store}")
+		self.chroma = chromadb.PersistentClient(path="./rag_db", settings=Settings(anonymized_telemetry=False))
+		return self.chroma.get_or_create_collection("discord_knowledge")
+
+	def _ensure_ready(self) -> bool:
+		"""Load the model and vector store if needed. Returns False if initialization failed."""
+		if self._ready.is_set():
+			return True
+		with self._init_lock:
+			if self._ready.is_set():
+				return True
+			try:
+				self._load()
+			except Exception as e:
+				self.logger.error(f"RAG initialization failed: {e}")
+				return False
+			self._ready.set()
+			return True
+
+	def _start_lexical_build(self):
+		"""Build the lexical index on a background thread unless it is built, building, or backing off after a failure."""
+		if not self.hybrid or self._lexical_ready.is_set() or not self._ready.is_set():
+			return
+		with self._lexical_lock:
+			if self._lexical_building:
+				return
+			if self._lexical_failed_at is not None and time.monotonic() - self._lexical_failed_at < self.lexical_retry:
+				return
+			self._lexical_building = True
+		threading.Thread(target=self._build_lexical, name="rag-lexical", daemon=True).start()
+
+	def _build_lexical(self) -> bool:
+		"""Index every document in the collection. Returns False if the build failed."""
+		with self._lexical_lock:
+			self._lexical_building = True
+			self._lexical_touched.clear()
+		started = time.perf_counter()
 		try:
-			embedding = self.embedder.encode([text])[0]
+			for page in self._scan(["documents", "metadatas"]):
+				with self._lexical_lock:
+					for doc_id, text, metadata in zip(page["ids"], page.get("documents") or [], page.get("metadatas") or []):
+						if doc_id not in self._lexical_touched:
+							self.lexical.add(doc_id, text, metadata)
 		except Exception as e:
-			self.logger.error(f"Error generating embedding: {e}")
+			self.logger.error(f"Error building lexical index, retrying in {self.lexical_retry}s: {e}")
+			with self._lexical_lock:
+				self._lexical_failed_at = time.monotonic()
+				self._lexical_building = False
+				self._lexical_touched.clear()
+			return False
+		with self._lexical_lock:
+			self._lexical_building = False
+			self._lexical_failed_at = None
+			self._lexical_touched.clear()
+			self._lexical_ready.set()
+		self.timings["lexical"] = time.perf_counter() - started
+		self.logger.info("Lexical index built over %d documents in %.2fs", len(self.lexical), self.timings["lexical"])
+		return True
+
+	def _index(self, ids: list[str], texts: list[str], metadatas: list[dict]):
+		if not self.hybrid:
 			return
+		with self._lexical_lock:
+			if self._lexical_building:
+				self._lexical_touched.update(ids)
+			for doc_id, text, metadata in zip(ids, texts, metadatas):
+				self.lexical.add(doc_id, text, metadata)
 
-		if not doc_id:
-			doc_id = str(hash(text))
+	def _unindex(self, ids: list[str]):
+		if not self.hybrid:
+			return
+		with self._lexical_lock:
+			if self._lexical_building:
+				self._lexical_touched.update(ids)
+			for doc_id in ids:
+				self.lexical.remove(doc_id)
+
+	async def initialize_async(self) -> bool:
+		"""Initialize off the event loop; safe to call concurrently or repeatedly."""
+		if self._ready.is_set():
+			return True
+		loop = asyncio.get_running_loop()
+		ready = await loop.run_in_executor(self._executor, self._ensure_ready)
+		if ready:
+			self._start_lexical_build()
+		return ready
+
+	async def wait_ready(self) -> bool:
+		"""Wait until RAG is usable, starting initialization if nothing has yet. Returns False on failure."""
+		return await self.initialize_async()
 
+	def _cache_key(self, text: str) -> str:
+		# Whitespace differences embed identically; case only does when the tokenizer lowercases
+		key = " ".join(text.split())
+		tokenizer = getattr(self.embedder, "tokenizer", None)
+		return key.lower() if getattr(tokenizer, "do_lower_case", False) is True else key
+
+	def _encode(self, texts: list[str], batch_size: int = None) -> list:
+		"""Encode texts through the embedding cache, running the model only on misses."""
+		batch_size = batch_size or self.embed_batch_size
+		keys = [self._cache_key(text) for text in texts]
+		embeddings = {}
+		misses = {}
+		for key, text in zip(keys, texts):
+			if key in embeddings or key in misses:
+				continue
+			cached = self.embedding_cache.get(key)
+			if cached is None:
+				misses[key] = text
+			else:
+				embeddings[key] = cached
+
+		miss_keys = list(misses)
+		for start in range(0, len(miss_keys), batch_size):
+			batch_keys = miss_keys[start:start + batch_size]
+			encoded = self.embedder.encode([misses[key] for key in batch_keys])
+			for key, embedding in zip(batch_keys, encoded):
+				self.embedding_cache.set(key, embedding)
+				embeddings[key] = embedding
+
+		return [embeddings[key] for key in keys]
+
+	@staticmethod
+	def content_id(text: str) -> str:
+		"""Stable document ID derived from the text, identical across processes and restarts."""
+		return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+	def _count_tokens(self, text: str) -> int:
+		"""Length of text in embedding model tokens, or in words before the model is loaded."""
+		tokenizer = getattr(self.embedder, "tokenizer", None)
+		if tokenizer is None:
+			return len(text.split())
+		return len(tokenizer.tokenize(text))
+
+	def _chunk_documents(self, ids: list[str], texts: list[str], metadatas: list[dict]) -> tuple:
+		"""
+		Split documents longer than one chunk into chunk documents with IDs
+		"<parent_id>:<index>". Each chunk's metadata records parent_id,
+		parent_hash, chunk_index, chunk_count and its chunk_start/chunk_end
+		offsets in the parent. Returns (ids, texts, metadatas, parents) where
+		parents maps every parent ID to its text's hash, or None if unchunked.
+		"""
+		if not self.chunking:
+			return ids, texts, metadatas, {}
+		out_ids, out_texts, out_metadatas = [], [], []
+		parents = {}
+		for doc_id, text, metadata in zip(ids, texts, metadatas):
+			chunks = self.chunker.split(text)
+			if len(chunks) <= 1:
+				parents[doc_id] = None
+				out_ids.append(doc_id)
+				out_texts.append(text)
+				out_metadatas.append(metadata)
+				continue
+			parent_hash = self.content_id(text)
+			parents[doc_id] = parent_hash
+			for index, chunk in enumerate(chunks):
+				chunk_metadata = metadata.copy() if metadata else {}
+				chunk_metadata.update(
+					parent_id=doc_id,
+					parent_hash=parent_hash,
+					chunk_index=index,
+					chunk_count=len(chunks),
+					chunk_start=chunk.start,
+					chunk_end=chunk.end
+				)
+				out_ids.append(f"{doc_id}:{index}")
+				out_texts.append(chunk.text)
+				out_metadatas.append(chunk_metadata)
+		return out_ids, out_texts, out_metadatas, parents
+
+	def _delete_stale_chunks(self, parents: dict):
+		"""
+		Delete what earlier versions of these documents left behind: chunks of a
+		different parent_hash, and the whole-document entry of a document that
+		is now chunked. parents is as returned by _chunk_documents.
+		"""
+		if not parents:
+			return
+		try:
+			result = self.collection.get(where={"parent_id": {"$in": list(parents)}}, include=["metadatas"])
+			stale = [
+				doc_id
+				for doc_id, metadata in zip(result.get("ids") or [], result.get("metadatas") or [])
+				if isinstance(metadata, dict) and metadata.get("parent_id") in parents and metadata.get("parent_hash") != parents[metadata["parent_id"]]
+			]
+			stale += [doc_id for doc_id, parent_hash in parents.items() if parent_hash is not None]
+			if stale:
+				self.collection.delete(ids=stale)
+				self._unindex(stale)
+		except Exception as e:
+			self.logger.error(f"Error deleting stale chunks: {e}")
+
+	def _build_metadata(self, doc_id: str, text: str, metadata: dict = None) -> dict:
 		full_metadata = metadata.copy() if metadata else {}
 		full_metadata["id"] = doc_id
+		full_metadata["content_hash"] = self.content_id(text)
+		full_metadata["embedding_model"] = self.embedding_id
+		return full_metadata
+
+	def _is_current(self, stored: dict, full_metadata: dict) -> bool:
+		"""True if a stored document was embedded from the same text with the same model."""
+		return (
+			isinstance(stored, dict)
+			and stored.get("content_hash") == full_metadata["content_hash"]
+			and stored.get("embedding_model") == full_metadata["embedding_model"]
+		)
+
+	def _stored_metadatas(self, ids: list[str]) -> dict:
+		"""Return {id: metadata} for the IDs already in the collection."""
+		result = self.collection.get(ids=ids, include=["metadatas"])
+		return {
+			doc_id: metadata
+			for doc_id, metadata in zip(result.get("ids") or [], result.get("metadatas") or [])
+		}
+
+	def embedding_cache_stats(self) -> dict:
+		"""Return hit/miss counters and size of the embedding cache."""
+		return self.embedding_cache.stats()
+
+	def add_document(self, text: str, doc_id=None, metadata: dict = None):
+		"""Add a document with embedding and optional metadata."""
+		if not self._ensure_ready():
+			return
+		if not doc_id:
+			doc_id = self.content_id(text)
+		if self.chunking and self._count_tokens(text) > self.chunker.max_tokens:
+			self.add_documents([text], ids=[doc_id], metadatas=[metadata])
+			return
+
+		try:
+			embedding = self._encode([text])[0]
+		except Exception as e:
+			self.logger.error(f"Error generating embedding: {e}")
+			return
+
+		full_metadata = self._build_metadata(doc_id, text, metadata)
 
 		try:
 			self.collection.add(
@@ -59,11 +453,154 @@ class Rag:
 			)
 		except Exception as e:
 			self.logger.error(f"Error adding document to collection: {e}")
+			return
+		self._index([doc_id], [text], [full_metadata])
+
+	def add_documents(self, texts: Iterable[str], ids: Iterable[str] = None, metadatas: Iterable[dict] = None, batch_size: int = None) -> int:
+		"""Add many documents, encoding and writing in batches. Returns the number of documents written."""
+		return self._bulk_write("add", texts, ids, metadatas, batch_size)
+
+	def upsert_documents(self, texts: Iterable[str], ids: Iterable[str] = None, metadatas: Iterable[dict] = None, batch_size: int = None) -> int:
+		"""Insert or replace many documents by ID, encoding and writing in batches. Returns the number of documents written."""
+		return self._bulk_write("upsert", texts, ids, metadatas, batch_size)
+
+	def _bulk_write(self, mode: str, texts: Iterable[str], ids: Iterable[str] = None, metadatas: Iterable[dict] = None, batch_size: int = None) -> int:
+		"""
+		Stream documents into the collection.
+
+		Texts are consumed write_batch_size at a time so arbitrarily large iterables
+		never have to be held in memory; each chunk is encoded in batch_size forward
+		passes and written with a single collection call. Documents too long to
+		embed whole are written as chunks, which count individually in the result.
+		When upserting, documents whose text and embedding model are unchanged
+		are not re-embedded, and chunks left over from earlier versions are deleted.
+		"""
+		if not self._ensure_ready():
+			return 0
+		batch_size = batch_size or self.embed_batch_size
+		write = self.collection.upsert if mode == "upsert" else self.collection.add
+		texts_iter = iter(texts)
+		ids_iter = iter(ids) if ids is not None else None
+		metadatas_iter = iter(metadatas) if metadatas is not None else None
+
+		written = 0
+		skipped = 0
+		started = time.perf_counter()
+		while True:
+			batch_texts = list(islice(texts_iter, self.write_batch_size))
+			if not batch_texts:
+				break
+			if ids_iter is not None:
+				batch_ids = list(islice(ids_iter, len(batch_texts)))
+			else:
+				batch_ids = [self.content_id(text) for text in batch_texts]
+			if metadatas_iter is not None:
+				batch_metadatas = list(islice(metadatas_iter, len(batch_texts)))
+			else:
+				batch_metadatas = [None] * len(batch_texts)
+			if len(batch_ids) != len(batch_texts) or len(batch_metadatas) != len(batch_texts):
+				self.logger.error(f"Bulk {mode} aborted: texts, ids and metadatas differ in length")
+				break
+
+			batch_ids, batch_texts, batch_metadatas, parents = self._chunk_documents(batch_ids, batch_texts, batch_metadatas)
+			full_metadatas = [
+				self._build_metadata(doc_id, text, metadata)
+				for doc_id, text, metadata in zip(batch_ids, batch_texts, batch_metadatas)
+			]
+
+			if mode == "upsert":
+				batch_texts, batch_ids, full_metadatas, unchanged = self._drop_unchanged(batch_texts, batch_ids, full_metadatas)
+				skipped += unchanged
+				if not batch_texts:
+					continue
+
+			try:
+				embeddings = self._encode(batch_texts, batch_size)
+			except Exception as e:
+				self.logger.error(f"Error generating embeddings for bulk {mode}: {e}")
+				continue
+
+			try:
+				write(
+					documents=batch_texts,
+					embeddings=[embedding.tolist() for embedding in embeddings],
+					ids=batch_ids,
+					metadatas=full_metadatas,
+				)
+				written += len(batch_texts)
+				self._index(batch_ids, batch_texts, full_metadatas)
+				if mode == "upsert":
+					self._delete_stale_chunks(parents)
+			except Exception as e:
+				self.logger.error(f"Error writing document batch to collection: {e}")
+
+		elapsed = time.perf_counter() - started
+		rate = written / elapsed if elapsed > 0 else 0.0
+		self.logger.info("Bulk %s wrote %d documents, skipped %d unchanged, in %.2fs (%.1f docs/sec)", mode, written, skipped, elapsed, rate, latency_ms=round(elapsed * 1000, 1))
+		return written
+
+	def _drop_unchanged(self, texts: list[str], ids: list[str], metadatas: list[dict]) -> tuple:
+		"""
+		Filter out documents already stored with the same content hash and model.
+
+		Unchanged documents whose metadata differs get a metadata-only update.
+		Returns the remaining (texts, ids, metadatas) and the number dropped.
+		"""
+		try:
+			stored = self._stored_metadatas(ids)
+		except Exception as e:
+			self.logger.warning(f"Could not look up stored documents, re-embedding batch: {e}")
+			return texts, ids, metadatas, 0
+
+		keep_texts, keep_ids, keep_metadatas = [], [], []
+		update_ids, update_texts, update_metadatas = [], [], []
+		for text, doc_id, metadata in zip(texts, ids, metadatas):
+			existing = stored.get(doc_id)
+			if self._is_current(existing, metadata):
+				if existing != metadata:
+					update_ids.append(doc_id)
+					update_texts.append(text)
+					update_metadatas.append(metadata)
+				continue
+			keep_texts.append(text)
+			keep_ids.append(doc_id)
+			keep_metadatas.append(metadata)
+
+		if update_ids:
+			try:
+				self.collection.update(ids=update_ids, metadatas=update_metadatas)
+				self._index(update_ids, update_texts, update_metadatas)
+			except Exception as e:
+				self.logger.error(f"Error updating document metadata: {e}")
+		return keep_texts, keep_ids, keep_metadatas, len(texts) - len(keep_texts)
 
 	def update_document(self, doc_id: str, new_text: str, new_metadata: dict = None):
-		"""Update document by ID with new text and metadata; adds if missing."""
+		"""Update document by ID with new text and metadata; adds if missing. Unchanged text is not re-embedded."""
+		if not self._ensure_ready():
+			return
+		if self.chunking and self._count_tokens(new_text) > self.chunker.max_tokens:
+			self.upsert_documents([new_text], ids=[doc_id], metadatas=[new_metadata])
+			return
+
+		full_metadata = self._build_metadata(doc_id, new_text, new_metadata)
+		try:
+			existing = self._stored_metadatas([doc_id]).get(doc_id)
+		except Exception as e:
+			self.logger.warning(f"Warning: Error looking up document with id {doc_id}: {e}")
+			existing = None
+		if self._is_current(existing, full_metadata):
+			if existing != full_metadata:
+				try:
+					self.collection.update(ids=[doc_id], metadatas=[full_metadata])
+					self._index([doc_id], [new_text], [full_metadata])
+				except Exception as e:
+					self.logger.error(f"Error updating metadata for document {doc_id}: {e}")
+			else:
+				self.logger.debug("Document %s unchanged, skipping re-embedding", doc_id)
+			return
+
 		try:
-			embedding = self.embedder.encode([new_text])[0]
+			embedding = self._encode([new_text])[0]
 		except Exception as e:
 			self.logger.error(f"Error generating embedding: {e}")
 			return
@@ -73,9 +610,6 @@ class Rag:
 		except Exception as e:
 			self.logger.warning(f"Warning: Error deleting document with id {doc_id}: {e}")
 
-		full_metadata = new_metadata.copy() if new_metadata else {}
-		full_metadata["id"] = doc_id
-
 		try:
 			self.collection.add(
 				documents=[new_text],
@@ -85,25 +619,279 @@ class Rag:
 			)
 		except Exception as e:
 			self.logger.error(f"Error adding updated document to collection: {e}")
+			self._unindex([doc_id])
+			return
+		self._index([doc_id], [new_text], [full_metadata])
+		if self.chunking:
+			self._delete_stale_chunks({doc_id: None})
+
+	def _scan(self, include: list[str], page_size: int = None):
+		"""Yield the collection as a series of get() pages so it is never loaded all at once."""
+		page_size = page_size or self.scan_page_size
+		offset = 0
+		while True:
+			page = self.collection.get(include=include, limit=page_size, offset=offset)
+			ids = page.get("ids") or []
+			if not ids:
+				return
+			yield page
+			if len(ids) < page_size:
+				return
+			offset += len(ids)
+
+	def reindex_documents(self, page_size: int = None) -> dict:
+		"""
+		Incrementally re-embed the collection.
+
+		Only documents whose stored content hash no longer matches their text, or
+		that were embedded with a different model, are encoded again.
+
+		Returns:
+			dict: {"scanned": int, "reembedded": int}
+		"""
+		stats = {"scanned": 0, "reembedded": 0}
+		if not self._ensure_ready():
+			return stats
 
-	def query_top_documents(self, query: str, top_k=4) -> list[str]:
-		"""Return top_k most relevant documents for the query."""
+		started = time.perf_counter()
 		try:
-			embedding = self.embedder.encode([query])[0]
+			for page in self._scan(["documents", "metadatas"], page_size):
+				stale_texts, stale_ids, stale_metadatas = [], [], []
+				for doc_id, text, metadata in zip(page["ids"], page.get("documents") or [], page.get("metadatas") or []):
+					stats["scanned"] += 1
+					full_metadata = self._build_metadata(doc_id, text, metadata)
+					if not self._is_current(metadata, full_metadata):
+						stale_texts.append(text)
+						stale_ids.append(doc_id)
+						stale_metadatas.append(full_metadata)
+				if not stale_ids:
+					continue
+				embeddings = self._encode(stale_texts)
+				self.collection.upsert(
+					documents=stale_texts,
+					embeddings=[embedding.tolist() for embedding in embeddings],
+					ids=stale_ids,
+					metadatas=stale_metadatas,
+				)
+				stats["reembedded"] += len(stale_ids)
+		except Exception as e:
+			self.logger.error(f"Error reindexing documents: {e}")
+
+		elapsed = time.perf_counter() - started
+		self.logger.info("Reindex scanned %d documents and re-embedded %d in %.2fs", stats["scanned"], stats["reembedded"], elapsed, latency_ms=round(elapsed * 1000, 1))
+		return stats
+
+	@track("rag", model_from_args=False)
+	def query_top_documents(self, query: str, top_k: int = None, where: dict = None, max_tokens: int = None) -> list[str]:
+		"""
+		Return the top_k (default RAG_TOP_K) most relevant documents for the
+		query, optionally restricted to documents whose metadata matches where,
+		e.g. {"guild_id": guild.id}. With max_tokens, chunk hits are widened
+		with their neighbouring chunks into passages, and results are kept
+		within max_tokens in total. Identical concurrent queries share one lookup.
+		"""
+		if not self._ensure_ready():
+			return []
+		top_k = top_k or self.top_k
+		key = self._query_key(query, top_k, where, max_tokens)
+		return self._inflight.do_sync(key, lambda: self._query_top_documents(query, top_k, where, max_tokens))
+
+	@staticmethod
+	def _query_key(query: str, top_k: int, where: dict = None, max_tokens: int = None) -> tuple:
+		# where may nest lists and dicts ($and, $in), so it is keyed by its canonical JSON
+		return (query, top_k, json.dumps(where, sort_keys=True, default=str) if where else None, max_tokens)
+
+	def _query_top_documents(self, query: str, top_k: int, where: dict = None, max_tokens: int = None) -> list[str]:
+		started = time.perf_counter()
+		lexical_ids = self._lexical_search(query, where)
+		try:
+			embedding = self._encode([query])[0]
+		except Exception as e:
+			self.logger.error(f"Error generating embedding for query: {e}")
+			return self._passages(self._fuse([], lexical_ids, top_k), max_tokens)
+
+		vector_hits = self._query_collection(embedding, self._vector_k(top_k), where)
+		elapsed = time.perf_counter() - started
+		if self.query_budget and elapsed > self.query_budget:
+			self.logger.warning("RAG query took %.0fms, over its %.0fms budget", elapsed * 1000, self.query_budget * 1000, latency_ms=round(elapsed * 1000, 1))
+		return self._passages(self._fuse(vector_hits, lexical_ids, top_k), max_tokens)
+
+	async def add_document_async(self, text: str, doc_id=None, metadata: dict = None):
+		"""Async variant of add_document; encoding and writing run on the encode pool."""
+		loop = asyncio.get_running_loop()
+		return await loop.run_in_executor(self._executor, self.add_document, text, doc_id, metadata)
+
+	async def update_document_async(self, doc_id: str, new_text: str, new_metadata: dict = None):
+		"""Async variant of update_document; encoding and writing run on the encode pool."""
+		loop = asyncio.get_running_loop()
+		return await loop.run_in_executor(self._executor, self.update_document, doc_id, new_text, new_metadata)
+
+	@track("rag", model_from_args=False)
+	async def query_top_documents_async(self, query: str, top_k: int = None, where: dict = None, max_tokens: int = None) -> list[str]:
+		"""
+		Async variant of query_top_documents; concurrent queries are micro-batched
+		into one encode, and identical ones share a single lookup. When lexical
+		hits are available, vector search that misses RAG_QUERY_BUDGET_MS is not
+		waited for.
+		"""
+		if not await self.wait_ready():
+			return []
+		top_k = top_k or self.top_k
+		key = self._query_key(query, top_k, where, max_tokens)
+		return await self._inflight.do(key, lambda: self._query_top_documents_async(query, top_k, where, max_tokens))
+
+	async def _query_top_documents_async(self, query: str, top_k: int, where: dict = None, max_tokens: int = None) -> list[str]:
+		loop = asyncio.get_running_loop()
+		vector = asyncio.ensure_future(self._vector_search_async(query, top_k, where))
+		lexical_ids = await loop.run_in_executor(None, self._lexical_search, query, where)
+		if lexical_ids and self.query_budget:
+			done, _ = await asyncio.wait({vector}, timeout=self.query_budget)
+			if done:
+				vector_hits = vector.result()
+			else:
+				# Let the search finish in the background; the lexical hits answer now
+				vector.add_done_callback(lambda task: task.cancelled() or task.exception())
+				self.over_budget.inc()
+				self.logger.warning("RAG vector search over its %.0fms budget, using lexical results", self.query_budget * 1000)
+				vector_hits = []
+		else:
+			vector_hits = await vector
+		return await loop.run_in_executor(None, lambda: self._passages(self._fuse(vector_hits, lexical_ids, top_k), max_tokens))
+
+	async def _vector_search_async(self, query: str, top_k: int, where: dict = None) -> list[tuple]:
+		try:
+			embedding = await self._query_batcher.submit(query)
 		except Exception as e:
 			self.logger.error(f"Error generating embedding for query: {e}")
 			return []
 
+		loop = asyncio.get_running_loop()
+		return await loop.run_in_executor(None, self._query_collection, embedding, self._vector_k(top_k), where)
+
+	def _vector_k(self, top_k: int) -> int:
+		"""Vector candidates to fetch; hybrid search over-fetches so fusion has lists to merge."""
+		return max(top_k, self.candidates) if self.hybrid else top_k
+
+	@staticmethod
+	def _chroma_where(where: dict) -> dict:
+		if len(where) == 1:
+			return dict(where)
+		return {"$and": [{field: value} for field, value in where.items()]}
+
+	def _query_collection(self, embedding, n_results: int, where: dict = None) -> list[tuple]:
+		"""Nearest neighbours as (doc_id, document, metadata) hits, best first."""
 		try:
-			results = self.collection.query(query_embeddings=[embedding.tolist()], n_results=top_k)
+			if where:
+				results = self.collection.query(query_embeddings=[embedding.tolist()], n_results=n_results, where=self._chroma_where(where))
+			else:
+				results = self.collection.query(query_embeddings=[embedding.tolist()], n_results=n_results)
 			if 'documents' in results and results['documents']:
-				return results['documents'][0]
+				documents = results['documents'][0]
+				# Without IDs the text itself identifies the document
+				ids = results['ids'][0] if results.get('ids') else documents
+				metadatas = results['metadatas'][0] if results.get('metadatas') else [None] * len(documents)
+				return list(zip(ids, documents, metadatas))
 		except Exception as e:
 			self.logger.error(f"Error querying collection: {e}")
 		return []
-	
+
+	def _lexical_search(self, query: str, where: dict = None) -> list[str]:
+		"""IDs of the best BM25 matches, or [] when hybrid search is off, the index is not built yet, or it cannot apply where."""
+		if not self.hybrid:
+			return []
+		if not self._lexical_ready.is_set():
+			self._start_lexical_build()
+			return []
+		if not self.lexical.can_filter(where):
+			self.logger.debug("Skipping lexical search: filter %s is not indexed", sorted(where))
+			return []
+		return [doc_id for doc_id, _ in self.lexical.search(query, self.candidates, where)]
+
+	def _fuse(self, vector_hits: list[tuple], lexical_ids: list[str], top_k: int) -> list[tuple]:
+		"""Merge vector and lexical rankings by reciprocal-rank fusion and return the top_k hits."""
+		if not lexical_ids:
+			return vector_hits[:top_k]
+		hits = {hit[0]: hit for hit in vector_hits}
+		ranked = reciprocal_rank_fusion([list(hits), lexical_ids], self.rrf_k)[:top_k]
+		missing = [doc_id for doc_id in ranked if doc_id not in hits]
+		if missing:
+			try:
+				result = self.collection.get(ids=missing, include=["documents", "metadatas"])
+				documents = result.get("documents") or []
+				metadatas = result.get("metadatas") or [None] * len(documents)
+				for hit in zip(result.get("ids") or [], documents, metadatas):
+					hits[hit[0]] = hit
+			except Exception as e:
+				self.logger.error(f"Error fetching lexical matches: {e}")
+		return [hits[doc_id] for doc_id in ranked if doc_id in hits]
+
+	def _passages(self, hits: list[tuple], max_tokens: int = None) -> list[str]:
+		"""
+		Documents for the ranked hits. With max_tokens, each chunk hit grows
+		into a passage with up to RAG_CHUNK_NEIGHBORS chunks on either side, as
+		far as the budget allows; hits already covered by an earlier passage
+		and hits that no longer fit are dropped. Tokens are counted with the
+		embedding model's tokenizer.
+		"""
+		if not max_tokens:
+			return [document for _, document, _ in hits]
+		passages = []
+		covered = set()
+		used = 0
+		for _, document, metadata in hits:
+			parent_id = metadata.get("parent_id") if isinstance(metadata, dict) else None
+			tokens = self._count_tokens(document)
+			if used + tokens > max_tokens:
+				continue
+			if parent_id is None:
+				passages.append(document)
+				used += tokens
+				continue
+			index = metadata["chunk_index"]
+			if (parent_id, index) in covered:
+				continue
+			parts = self._neighbour_chunks(parent_id, index)
+			parts[index] = (metadata["chunk_start"], metadata["chunk_end"], document)
+			selected = [index]
+			for distance in range(1, self.chunk_neighbors + 1):
+				for neighbour in (index - distance, index + distance):
+					# Only grow contiguously, and never repeat text already returned
+					if neighbour not in parts or (parent_id, neighbour) in covered:
+						continue
+					if neighbour - 1 not in selected and neighbour + 1 not in selected:
+						continue
+					candidate = Chunker.merge([parts[i] for i in selected + [neighbour]])
+					candidate_tokens = self._count_tokens(candidate)
+					if used + candidate_tokens <= max_tokens:
+						selected.append(neighbour)
+						document, tokens = candidate, candidate_tokens
+			passages.append(document)
+			covered.update((parent_id, i) for i in selected)
+			used += tokens
+		return passages
+
+	def _neighbour_chunks(self, parent_id: str, index: int) -> dict:
+		"""{chunk_index: (chunk_start, chunk_end, text)} of the chunks within RAG_CHUNK_NEIGHBORS of index."""
+		indices = [i for i in range(index - self.chunk_neighbors, index + self.chunk_neighbors + 1) if i >= 0 and i != index]
+		if not indices:
+			return {}
+		try:
+			result = self.collection.get(
+				where={"$and": [{"parent_id": parent_id}, {"chunk_index": {"$in": indices}}]},
+				include=["documents", "metadatas"]
+			)
+		except Exception as e:
+			self.logger.error(f"Error fetching neighbouring chunks of {parent_id}: {e}")
+			return {}
+		return {
+			metadata["chunk_index"]: (metadata["chunk_start"], metadata["chunk_end"], document)
+			for document, metadata in zip(result.get("documents") or [], result.get("metadatas") or [])
+		}
+
 	def get_documents(self, ids: list[str] = None) -> str:
 		"""Retrieve documents by IDs or all if no IDs provided. Returns string: id\\ndocument\\n\\n"""
+		if not self._ensure_ready():
+			return ""
 		try:
 			if ids:
 				results = self.collection.get(ids=ids, include=["documents", "ids"])
@@ -119,44 +907,158 @@ class Rag:
 			return ""
 
 	def delete_document_by_id(self, doc_id: str):
-		"""Delete document from collection by document ID."""
+		"""Delete document from collection by document ID, along with its chunks."""
+		if not self._ensure_ready():
+			return
 		try:
-			self.collection.delete(ids=[doc_id])
+			ids = [doc_id, *self._chunk_ids(doc_id)]
+			self.collection.delete(ids=ids)
 		except Exception as e:
 			self.logger.error(f"Error removing document with id {doc_id}: {e}")
+			return
+		self._unindex(ids)
+
+	def _chunk_ids(self, parent_id: str) -> list[str]:
+		if not self.chunking:
+			return []
+		return list(self.collection.get(where={"parent_id": parent_id}, include=[]).get("ids") or [])
+
+	def remove_duplicate_documents(self, near_duplicates: bool = False, threshold: float = None, page_size: int = None, progress: Callable[[int, int, int], None] = None) -> int:
+		"""
+		Remove duplicate documents, keeping only first occurrence.
+
+		The collection is scanned a page at a time and exact duplicates are detected
+		by a 16-byte content digest, so memory grows with the number of documents
+		rather than their text. Deletes are issued in batches after the scan so
+		paging offsets stay stable.
+
+		Chunked documents are compared as whole parents by their parent_hash, and
+		a duplicate parent loses all of its chunks together; single chunks are
+		never removed on their own, so stitched passages have no gaps.
+
+		Args:
+			near_duplicates (bool): Also remove documents whose embedding cosine
+				similarity to an earlier kept document is at least threshold.
+			threshold (float, optional): Similarity threshold for near_duplicates.
+			page_size (int, optional): Documents fetched per page.
+			progress (callable, optional): Called after each page with
+				(scanned, total, marked_for_removal).
+
+		Returns:
+			int: Number of documents removed.
+		"""
+		if not self._ensure_ready():
+			return 0
+		threshold = threshold if threshold is not None else self.near_duplicate_threshold
+		include = ["documents", "metadatas", "embeddings"] if near_duplicates else ["documents", "metadatas"]
 
-	def remove_duplicate_documents(self):
-		"""Remove duplicate documents, keeping only first occurrence."""
 		try:
-			all_docs = self.collection.get(include=["documents", "ids"])
-		except Exception as e:
-			self.logger.error(f"Error retrieving documents for duplicate removal: {e}")
-			return
+			total = self.collection.count()
+		except Exception:
+			total = None
 
-		seen_texts = set()
-		ids_to_delete = []
+		seen_digests = set()
+		# parent_hash -> the parent_id whose chunks are kept for it
+		kept_parents = {}
+		kept_ids = set()
+		ids_to_delete = set()
+		scanned = 0
 		try:
-			for doc, doc_id in zip(all_docs.get("documents", []), all_docs.get("ids", [])):
-				if doc in seen_texts:
-					ids_to_delete.append(doc_id)
-				else:
-					seen_texts.add(doc)
+			for page in self._scan(include, page_size):
+				documents = page.get("documents") or []
+				page_ids = page["ids"]
+				metadatas = page.get("metadatas") or [None] * len(page_ids)
+				page_embeddings = page.get("embeddings") if near_duplicates else None
+				candidates = []
+				for index, (doc_id, doc, metadata) in enumerate(zip(page_ids, documents, metadatas)):
+					scanned += 1
+					if doc_id in ids_to_delete:
+						continue
+					parent_id = metadata.get("parent_id") if isinstance(metadata, dict) else None
+					if parent_id is not None:
+						parent_hash = metadata.get("parent_hash")
+						if parent_hash is not None and kept_parents.setdefault(parent_hash, parent_id) != parent_id:
+							ids_to_delete.add(doc_id)
+						continue
+					digest = hashlib.blake2b(doc.encode("utf-8"), digest_size=16).digest()
+					if digest in seen_digests:
+						ids_to_delete.add(doc_id)
+						continue
+					seen_digests.add(digest)
+					if near_duplicates:
+						candidates.append((doc_id, page_embeddings[index]))
+
+				if candidates:
+					self._mark_near_duplicates(candidates, threshold, kept_ids, ids_to_delete)
+
+				self.logger.debug("Duplicate scan: %s/%s scanned, %d marked", scanned, total if total is not None else "?", len(ids_to_delete))
+				if progress:
+					progress(scanned, total, len(ids_to_delete))
 		except Exception as e:
-			self.logger.error(f"Error processing documents for duplicates: {e}")
-			return
+			self.logger.error(f"Error retrieving documents for duplicate removal: {e}")
+			return 0
 
-		if ids_to_delete:
+		removed = 0
+		pending = list(ids_to_delete)
+		for start in range(0, len(pending), self.write_batch_size):
+			batch = pending[start:start + self.write_batch_size]
 			try:
-				self.collection.delete(ids=ids_to_delete)
+				self.collection.delete(ids=batch)
+				removed += len(batch)
+				self._unindex(batch)
 			except Exception as e:
 				self.logger.error(f"Error deleting duplicate documents: {e}")
 
+		self.logger.info("Duplicate removal scanned %d documents and removed %d", scanned, removed)
+		return removed
+
+	def _mark_near_duplicates(self, candidates: list, threshold: float, kept_ids: set, ids_to_delete: set):
+		"""Mark neighbours of each kept candidate whose cosine similarity is at least threshold."""
+		embeddings = [np.asarray(embedding, dtype=np.float32) for _, embedding in candidates]
+		results = self.collection.query(
+			query_embeddings=[embedding.tolist() for embedding in embeddings],
+			n_results=self.near_duplicate_neighbors + 1,
+			include=["embeddings", "metadatas"]
+		)
+		neighbor_metadatas = results.get("metadatas") or [[None] * len(ids) for ids in results["ids"]]
+		for (doc_id, _), embedding, neighbor_ids, neighbor_embeddings, metadatas in zip(candidates, embeddings, results["ids"], results["embeddings"], neighbor_metadatas):
+			if doc_id in ids_to_delete:
+				continue
+			kept_ids.add(doc_id)
+			if not len(neighbor_ids):
+				continue
+			neighbors = np.asarray(neighbor_embeddings, dtype=np.float32)
+			norms = np.linalg.norm(neighbors, axis=1) * np.linalg.norm(embedding)
+			similarities = neighbors @ embedding / np.where(norms == 0, 1, norms)
+			for neighbor_id, similarity, metadata in zip(neighbor_ids, similarities, metadatas):
+				if isinstance(metadata, dict) and "parent_id" in metadata:
+					# Chunks are only removed with their whole parent
+					continue
+				if neighbor_id != doc_id and neighbor_id not in kept_ids and similarity >= threshold:
+					ids_to_delete.add(neighbor_id)
+
 	def get_document_by_id(self, doc_id: str) -> str | None:
-		"""Retrieve a document's text by its ID or None if not found."""
+		"""Retrieve a document's text by its ID or None if not found. Chunked documents are stitched back together."""
+		if not self._ensure_ready():
+			return None
 		try:
 			result = self.collection.get(ids=[doc_id], include=["documents"])
 			if result.get("documents"):
 				return result["documents"][0]
+			if self.chunking:
+				result = self.collection.get(where={"parent_id": doc_id}, include=["documents", "metadatas"])
+				parts = [
+					(metadata["chunk_start"], metadata["chunk_end"], document)
+					for document, metadata in zip(result.get("documents") or [], result.get("metadatas") or [])
+				]
+				if parts:
+					return Chunker.merge(parts)
 		except Exception as e:
 			self.logger.error(f"Error retrieving document by id {doc_id}: {e}")
 		return None
+
+	def close(self):
+		"""Stop the encode worker pool and close the vector store if it holds files open."""
+		self._executor.shutdown(wait=False)
+		if isinstance(self.collection, MemmapVectorStore):
+			self.collection.close()
@@ -0,0 +1,139 @@
+# utils/response_cache.py
+
+import asyncio
+import hashlib
+import json
+import threading
+from utils.cache import LRUCache
+from utils.config import Config
+from utils.logger import Logger
+from utils.metrics import Metrics
+
+SELECT_RESPONSE = "SELECT response FROM response_cache WHERE key = %s AND expires_at > CURRENT_TIMESTAMP"
+UPSERT_RESPONSE = (
+	"INSERT INTO response_cache (key, model, response, expires_at) "
+	"VALUES (%s, %s, %s, CURRENT_TIMESTAMP + %s * INTERVAL '1 second') "
+	"ON CONFLICT (key) DO UPDATE SET response = EXCLUDED.response, expires_at = EXCLUDED.expires_at"
+)
+PRUNE_EXPIRED = "DELETE FROM response_cache WHERE expires_at <= CURRENT_TIMESTAMP"
+PRUNE_OVERFLOW = "DELETE FROM response_cache WHERE key IN (SELECT key FROM response_cache ORDER BY expires_at DESC OFFSET %s)"
+
+class ResponseCache:
+	"""
+	Opt-in cache of AI completions for prompts that are effectively deterministic.
+
+	Entries are keyed by a hash of (model, messages, params). Lookups try an
+	in-memory LRU first, then, once a Database is attached and
+	RESPONSE_CACHE_DB is set, the response_cache table, so hot prompts survive
+	restarts. Both tiers expire entries after RESPONSE_CACHE_TTL seconds; the
+	memory tier evicts least recently used entries beyond RESPONSE_CACHE_SIZE and
+	the table is pruned to RESPONSE_CACHE_DB_MAX_ROWS every few hundred writes.
+	Hits and misses are counted per call site.
+
+	Usage:
+		cache = ResponseCache()
+		response = await cache.get("giphy", model, messages)
+		if response is None:
+			response = await call_model(...)
+			await cache.set(model, messages, response)
+	"""
+
+	_instance = None
+
+	def __new__(cls, *args, **kwargs):
+		if cls._instance is None:
+			cls._instance = super().__new__(cls)
+		return cls._instance
+
+	def __init__(self):
+		if hasattr(self, "_initialized") and self._initialized:
+			return
+
+		self.logger = Logger()
+		self.cfg = Config()
+		self.ttl = self.cfg.get_variable("RESPONSE_CACHE_TTL", 86400)
+		self.memory = LRUCache(max_entries=self.cfg.get_variable("RESPONSE_CACHE_SIZE", 2048), ttl=self.ttl)
+		self.use_db = self.cfg.get_variable("RESPONSE_CACHE_DB", False)
+		self.db_max_rows = self.cfg.get_variable("RESPONSE_CACHE_DB_MAX_ROWS", 100000)
+		self.prune_every = self.cfg.get_variable("RESPONSE_CACHE_PRUNE_EVERY", 500)
+		self.db = None
+		self.sites = {}
+		self.requests = Metrics().counter("bot_response_cache_total", "Response cache lookups by call site and result.", ("site", "result"))
+		self._writes = 0
+		self._tasks = set()
+		self._lock = threading.Lock()
+		self._initialized = True
+
+	def attach_database(self, db):
+		"""Enable the Postgres tier (if RESPONSE_CACHE_DB is set) on top of the memory tier."""
+		self.db = db if self.use_db else None
+
+	@staticmethod
+	def key(model: str, messages: list, params: dict = None) -> str:
+		payload = json.dumps([model, messages, params or {}], sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+		return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+	def _count(self, site: str, result: str):
+		with self._lock:
+			counts = self.sites.setdefault(site, {"memory_hits": 0, "db_hits": 0, "misses": 0})
+			counts[result] += 1
+		self.requests.inc(site=site, result=result)
+
+	async def get(self, site: str, model: str, messages: list, params: dict = None) -> str:
+		"""Return the cached response for this prompt, or None. site labels the caller in stats."""
+		key = self.key(model, messages, params)
+		response = self.memory.get(key)
+		if response is not None:
+			self._count(site, "memory_hits")
+			return response
+
+		if self.db is not None:
+			rows = await self.db.run_script_async(SELECT_RESPONSE, (key,))
+			if rows:
+				response = rows[0][0]
+				self.memory.set(key, response)
+				self._count(site, "db_hits")
+				return response
+
+		self._count(site, "misses")
+		return None
+
+	async def set(self, model: str, messages: list, response: str, params: dict = None):
+		"""Cache a response. The database write runs in the background."""
+		key = self.key(model, messages, params)
+		self.memory.set(key, response)
+		if self.db is None:
+			return
+		task = asyncio.create_task(self._write(key, model, response))
+		self._tasks.add(task)
+		task.add_done_callback(self._tasks.discard)
+
+	async def _write(self, key: str, model: str, response: str):
+		if await self.db.run_script_async(UPSERT_RESPONSE, (key, model, response, self.ttl)) is False:
+			return
+		self._writes += 1
+		if self._writes % self.prune_every == 0:
+			await self.prune()
+
+	async def prune(self):
+		"""Delete expired rows and the soonest-expiring rows beyond RESPONSE_CACHE_DB_MAX_ROWS."""
+		if self.db is None:
+			return
+		expired = await self.db.run_script_async(PRUNE_EXPIRED)
+		overflow = await self.db.run_script_async(PRUNE_OVERFLOW, (self.db_max_rows,))
+		self.logger.debug("Response cache pruned %s expired and %s overflow rows", expired, overflow)
+
+	def stats(self) -> dict:
+		"""Return per-site hit/miss counts and hit rates, plus memory tier stats."""
+		with self._lock:
+			sites = {}
+			for site, counts in self.sites.items():
+				lookups = sum(counts.values())
+				hits = counts["memory_hits"] + counts["db_hits"]
+				sites[site] = {**counts, "hit_rate": round(hits / lookups, 4) if lookups else 0.0}
+		return {"sites": sites, "memory": self.memory.stats()}
+
+	async def close(self):
+		"""Wait for background database writes to finish."""
+		if self._tasks:
+			await asyncio.gather(*self._tasks, return_exceptions=True)
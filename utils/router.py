@@ -0,0 +1,207 @@
+# utils/router.py
+
+import asyncio
+import random
+import time
+from typing import Awaitable, Callable
+from utils.config import Config
+from utils.logger import Logger
+from utils.metrics import Metrics
+
+class CircuitBreaker:
+	"""
+	Stops sending requests to a backend after repeated failures.
+
+	Closed: requests flow. After failure_threshold consecutive failures it opens
+	and rejects requests for reset_timeout seconds, then half-opens to let one
+	trial request through; success closes it again, failure re-opens it.
+	"""
+
+	CLOSED = "closed"
+	OPEN = "open"
+	HALF_OPEN = "half_open"
+
+	def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+		self.failure_threshold = failure_threshold
+		self.reset_timeout = reset_timeout
+		self.state = self.CLOSED
+		self.failures = 0
+		self.opened_at = 0.0
+		self._trial_in_flight = False
+
+	def allow(self) -> bool:
+		"""Return True if a request may be sent now."""
+		if self.state == self.CLOSED:
+			return True
+		if self.state == self.OPEN:
+			if time.monotonic() - self.opened_at < self.reset_timeout:
+				return False
+			self.state = self.HALF_OPEN
+			self._trial_in_flight = False
+		if self._trial_in_flight:
+			return False
+		self._trial_in_flight = True
+		return True
+
+	def release(self):
+		"""End a request without judging the backend; frees a half-open trial slot."""
+		self._trial_in_flight = False
+
+	def record_success(self):
+		self.state = self.CLOSED
+		self.failures = 0
+		self._trial_in_flight = False
+
+	def record_failure(self) -> bool:
+		"""Count a failure. Returns True if this failure opened the circuit."""
+		self.failures += 1
+		self._trial_in_flight = False
+		if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+			was_open = self.state == self.OPEN
+			self.state = self.OPEN
+			self.opened_at = time.monotonic()
+			return not was_open
+		return False
+
+class _Backend:
+	__slots__ = ("name", "model", "call", "breaker", "latency", "observed_at")
+
+	def __init__(self, name: str, model: str, call, breaker: CircuitBreaker):
+		self.name = name
+		self.model = model
+		self.call = call
+		self.breaker = breaker
+		# Exponentially weighted moving average of successful call latency, in seconds
+		self.latency = None
+		self.observed_at = 0.0
+
+class BackendRouter:
+	"""
+	Routes chat completions across backends in configured priority order.
+
+	Backends with an open circuit are skipped, and backends whose recent
+	latency exceeds ROUTER_SLOW_THRESHOLD are tried after the healthy ones, so
+	requests fall back to the local Ollama stand-in when OpenAI is down or slow.
+	Each backend gets up to ROUTER_MAX_ATTEMPTS attempts with full-jitter
+	exponential backoff; client errors (4xx other than 408/409/429) are not
+	retried on the same backend.
+
+	Usage:
+		router = BackendRouter({"openai": openai_call, "ollama": ollama_call})
+		response, backend = await router.complete(messages)
+	"""
+
+	def __init__(self, calls: dict[str, Callable[[str, list], Awaitable[str]]]):
+		self.logger = Logger()
+		self.cfg = Config()
+		self.max_attempts = self.cfg.get_variable("ROUTER_MAX_ATTEMPTS", 2)
+		self.backoff_base = self.cfg.get_variable("ROUTER_BACKOFF_BASE", 0.25)
+		self.backoff_max = self.cfg.get_variable("ROUTER_BACKOFF_MAX", 4.0)
+		self.attempt_timeout = self.cfg.get_variable("ROUTER_ATTEMPT_TIMEOUT", 60)
+		self.slow_threshold = self.cfg.get_variable("ROUTER_SLOW_THRESHOLD", 15.0)
+		self.latency_alpha = self.cfg.get_variable("ROUTER_LATENCY_ALPHA", 0.2)
+		failure_threshold = self.cfg.get_variable("ROUTER_FAILURE_THRESHOLD", 5)
+		reset_timeout = self.cfg.get_variable("ROUTER_RESET_TIMEOUT", 30)
+		self.demote_timeout = reset_timeout
+
+		routes = self.cfg.get_variable("ROUTER_BACKENDS") or [
+			{"backend": "openai", "model": "gpt-4.1-mini"},
+			{"backend": "ollama", "model": "llama3"}
+		]
+		self.backends = [
+			_Backend(route["backend"], route["model"], calls[route["backend"]], CircuitBreaker(failure_threshold, reset_timeout))
+			for route in routes
+			if route["backend"] in calls
+		]
+		metrics = Metrics()
+		self.attempts = metrics.counter("bot_router_attempts_total", "Routed completion attempts by backend and result.", ("backend", "result"))
+		self.trips = metrics.counter("bot_router_circuit_open_total", "Times a backend's circuit breaker opened.", ("backend",))
+
+	def order(self) -> list[_Backend]:
+		"""
+		Backends to try, in priority order with slow ones moved last. A slow
+		backend is only demoted for ROUTER_RESET_TIMEOUT seconds after its last
+		observation, so it gets a chance to show it has recovered.
+		"""
+		now = time.monotonic()
+		healthy, slow = [], []
+		for backend in self.backends:
+			recent = now - backend.observed_at < self.demote_timeout
+			if backend.latency is not None and backend.latency > self.slow_threshold and recent:
+				slow.append(backend)
+			else:
+				healthy.append(backend)
+		return healthy + slow
+
+	def backoff(self, attempt: int) -> float:
+		return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+	@staticmethod
+	def _retryable(error: Exception) -> bool:
+		status = getattr(error, "status_code", None) or getattr(error, "status", None)
+		if isinstance(status, int) and 400 <= status < 500:
+			return status in (408, 409, 429)
+		return True
+
+	def _observe(self, backend: _Backend, elapsed: float):
+		backend.observed_at = time.monotonic()
+		if backend.latency is None:
+			backend.latency = elapsed
+		else:
+			backend.latency += self.latency_alpha * (elapsed - backend.latency)
+
+	async def complete(self, messages: list) -> tuple[str, str]:
+		"""
+		Return (response, backend name) from the first backend that succeeds.
+		Raises the last error if every backend fails or is unavailable.
+		"""
+		last_error = None
+		backends = self.order()
+		for index, backend in enumerate(backends):
+			for attempt in range(self.max_attempts):
+				if not backend.breaker.allow():
+					self.attempts.inc(backend=backend.name, result="rejected")
+					break
+				started = time.perf_counter()
+				try:
+					response = await asyncio.wait_for(backend.call(backend.model, messages), self.attempt_timeout)
+				except Exception as e:
+					elapsed = time.perf_counter() - started
+					last_error = e
+					self.attempts.inc(backend=backend.name, result="error")
+					if not self._retryable(e):
+						# The request itself was rejected; says nothing about the backend's health
+						backend.breaker.release()
+						self.logger.warning("%s rejected request (model=%s): %s", backend.name, backend.model, e, model=backend.model)
+						break
+					if isinstance(e, asyncio.TimeoutError):
+						self._observe(backend, elapsed)
+					if backend.breaker.record_failure():
+						self.trips.inc(backend=backend.name)
+						self.logger.warning("Circuit opened for %s after %d failures", backend.name, backend.breaker.failures)
+					self.logger.warning("%s attempt %d failed (model=%s): %r", backend.name, attempt + 1, backend.model, e, model=backend.model)
+					if attempt + 1 < self.max_attempts:
+						await asyncio.sleep(self.backoff(attempt))
+					continue
+				self._observe(backend, time.perf_counter() - started)
+				backend.breaker.record_success()
+				self.attempts.inc(backend=backend.name, result="ok")
+				return response, backend.name
+			if index + 1 < len(backends):
+				self.logger.info("Falling back from %s to %s", backend.name, backends[index + 1].name)
+		if last_error is None:
+			last_error = RuntimeError("No backend available")
+		raise last_error
+
+	def status(self) -> list[dict]:
+		"""Per-backend breaker state and latency, in current routing order."""
+		return [
+			{
+				"backend": backend.name,
+				"model": backend.model,
+				"state": backend.breaker.state,
+				"failures": backend.breaker.failures,
+				"latency_ms": round(backend.latency * 1000, 1) if backend.latency is not None else None
+			}
+			for backend in self.order()
+		]
@@ -0,0 +1,282 @@
+# utils/scheduler.py
+
+import asyncio
+import contextlib
+import contextvars
+import time
+from collections import OrderedDict, deque
+from utils.cache import LRUCache
+from utils.config import Config
+from utils.logger import Logger
+from utils.metrics import Metrics
+
+# (guild_id, user_id, priority) of the request being handled, set by request_context
+_request = contextvars.ContextVar("ai_request", default=None)
+# Set once a request has been admitted, so nested AI calls are not charged twice
+_admitted = contextvars.ContextVar("ai_request_admitted", default=False)
+# Set while holding a scheduler slot, so nested calls (router attempts) run in
+# the caller's slot instead of queueing again
+_holding_slot = contextvars.ContextVar("ai_slot_held", default=False)
+
+class RateLimited(Exception):
+	"""Raised when a guild or user has used up its request allowance."""
+
+	def __init__(self, scope: str, retry_after: float):
+		super().__init__(f"Rate limited ({scope}), retry in {retry_after:.1f}s")
+		self.scope = scope
+		self.retry_after = retry_after
+
+class QueueFull(Exception):
+	"""Raised when a guild already has the maximum number of requests waiting."""
+
+@contextlib.contextmanager
+def request_context(guild_id=None, user_id=None, priority: bool = False):
+	"""
+	Attribute AI calls made inside the block to a guild and user for rate
+	limiting and fair scheduling. priority requests (slash and admin commands)
+	skip ahead of the per-guild queues.
+	"""
+	token = _request.set((guild_id, user_id, priority))
+	admitted = _admitted.set(False)
+	try:
+		yield
+	finally:
+		_admitted.reset(admitted)
+		_request.reset(token)
+
+def set_request(guild_id=None, user_id=None, priority: bool = False):
+	"""
+	Set the request context for the rest of the current task, for hooks such
+	as bot.before_invoke that cannot wrap the call in request_context.
+	"""
+	_request.set((guild_id, user_id, priority))
+	_admitted.set(False)
+
+def holding_slot() -> bool:
+	"""True while the current task holds a scheduler slot from Admission.slot."""
+	return _holding_slot.get()
+
+def current_request() -> tuple:
+	"""Return (guild_id, user_id, priority) for the running request, or (None, None, False)."""
+	return _request.get() or (None, None, False)
+
+class TokenBucket:
+	"""Refills rate tokens per second up to capacity; each request takes one."""
+
+	__slots__ = ("rate", "capacity", "tokens", "updated")
+
+	def __init__(self, rate: float, capacity: float):
+		self.rate = rate
+		self.capacity = capacity
+		self.tokens = capacity
+		self.updated = time.monotonic()
+
+	def wait_time(self, now: float = None) -> float:
+		"""Refill, then return 0 if a token is available, otherwise seconds until one is."""
+		now = time.monotonic() if now is None else now
+		if now > self.updated:
+			self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+			self.updated = now
+		if self.tokens >= 1:
+			return 0.0
+		return (1 - self.tokens) / self.rate if self.rate > 0 else float("inf")
+
+	def acquire(self, now: float = None) -> float:
+		"""Take a token. Returns 0 on success, otherwise seconds until one is available."""
+		wait = self.wait_time(now)
+		if not wait:
+			self.tokens -= 1
+		return wait
+
+class RateLimiter:
+	"""
+	Per-guild and per-user token buckets. A request must get a token from both;
+	buckets for guilds and users that go quiet are evicted LRU.
+	"""
+
+	def __init__(self, guild_rate: float, guild_burst: float, user_rate: float, user_burst: float, max_buckets: int = 10000):
+		self.guild_rate = guild_rate
+		self.guild_burst = guild_burst
+		self.user_rate = user_rate
+		self.user_burst = user_burst
+		self.buckets = LRUCache(max_entries=max_buckets)
+		self.limited = Metrics().counter("bot_rate_limited_total", "AI requests rejected by rate limiting, by scope.", ("scope",))
+
+	def _bucket(self, key: tuple, rate: float, burst: float) -> TokenBucket:
+		bucket = self.buckets.get(key)
+		if bucket is None:
+			bucket = TokenBucket(rate, burst)
+			self.buckets.set(key, bucket)
+		return bucket
+
+	def check(self, guild_id=None, user_id=None):
+		"""
+		Charge one request to the user and guild, raising RateLimited if either
+		is exhausted. Nothing is charged to either bucket unless both allow it.
+		"""
+		now = time.monotonic()
+		buckets = []
+		if user_id is not None:
+			buckets.append(("user", self._bucket(("user", user_id), self.user_rate, self.user_burst)))
+		if guild_id is not None:
+			buckets.append(("guild", self._bucket(("guild", guild_id), self.guild_rate, self.guild_burst)))
+		for scope, bucket in buckets:
+			wait = bucket.wait_time(now)
+			if wait:
+				self.limited.inc(scope=scope)
+				raise RateLimited(scope, wait)
+		for _, bucket in buckets:
+			bucket.acquire(now)
+
+class FairScheduler:
+	"""
+	Bounds concurrent AI backend calls and shares the slots fairly.
+
+	When all max_concurrency slots are busy, waiters queue per guild and are
+	served weighted round-robin: each guild in turn gets up to its weight
+	(SCHEDULER_GUILD_WEIGHTS, default 1) slots before the next guild is served,
+	so one busy guild cannot starve the rest. Priority requests are served
+	before any guild queue. Queue depth and wait time are exported as metrics.
+
+	Usage:
+		async with scheduler.slot(guild_id):
+			response = await call_backend()
+	"""
+
+	def __init__(self, max_concurrency: int = 8, weights: dict = None, max_queue: int = 50):
+		self.max_concurrency = max_concurrency
+		self.weights = weights or {}
+		self.max_queue = max_queue
+		self.active = 0
+		self._priority = deque()
+		self._queues = OrderedDict()
+		self._credits = {}
+		metrics = Metrics()
+		self.depth = metrics.gauge("bot_scheduler_queue_depth", "AI requests waiting for a slot.", ("queue",))
+		self.wait = metrics.histogram("bot_scheduler_wait_seconds", "Time AI requests waited for a slot.", ("queue",))
+
+	def waiting(self) -> int:
+		return len(self._priority) + sum(len(queue) for queue in self._queues.values())
+
+	def _weight(self, guild_id) -> int:
+		return max(int(self.weights.get(guild_id, self.weights.get(str(guild_id), 1))), 1)
+
+	def _next(self):
+		if self._priority:
+			return self._priority.popleft(), "priority"
+		while self._queues:
+			guild_id, queue = next(iter(self._queues.items()))
+			waiter = queue.popleft()
+			credits = self._credits.get(guild_id, self._weight(guild_id)) - 1
+			if not queue:
+				del self._queues[guild_id]
+				self._credits.pop(guild_id, None)
+			elif credits <= 0:
+				# Turn used up: back of the line with a fresh allowance
+				self._queues.move_to_end(guild_id)
+				self._credits[guild_id] = self._weight(guild_id)
+			else:
+				self._credits[guild_id] = credits
+			return waiter, "guild"
+		return None, None
+
+	def _dispatch(self):
+		while self.active < self.max_concurrency:
+			waiter, queue = self._next()
+			if waiter is None:
+				return
+			self.depth.dec(queue=queue)
+			if waiter.done():
+				# Cancelled while waiting
+				continue
+			self.active += 1
+			waiter.set_result(None)
+
+	async def acquire(self, guild_id=None, priority: bool = False):
+		"""Wait for a slot. Raises QueueFull if the guild already has max_queue requests waiting."""
+		if self.active < self.max_concurrency and not self.waiting():
+			self.active += 1
+			self.wait.observe(0.0, queue="priority" if priority else "guild")
+			return
+
+		queue_name = "priority" if priority else "guild"
+		if priority:
+			queue = self._priority
+		else:
+			queue = self._queues.get(guild_id)
+			if queue is None:
+				queue = self._queues[guild_id] = deque()
+			elif len(queue) >= self.max_queue:
+				raise QueueFull(f"Too many queued AI requests for guild {guild_id}")
+
+		waiter = asyncio.get_running_loop().create_future()
+		queue.append(waiter)
+		self.depth.inc(queue=queue_name)
+		started = time.perf_counter()
+		try:
+			await waiter
+		except asyncio.CancelledError:
+			if waiter.done() and not waiter.cancelled():
+				# Granted a slot just as we were cancelled; hand it on
+				self.release()
+			raise
+		self.wait.observe(time.perf_counter() - started, queue=queue_name)
+
+	def release(self):
+		self.active -= 1
+		self._dispatch()
+
+	@contextlib.asynccontextmanager
+	async def slot(self, guild_id=None, priority: bool = False):
+		await self.acquire(guild_id, priority)
+		try:
+			yield
+		finally:
+			self.release()
+
+class Admission:
+	"""
+	Front door for AI requests: rate limits the request once, then hands out
+	fair-share slots for each backend call it makes, using the guild, user and
+	priority set by request_context. Requests made outside a request_context
+	(internal jobs) are not rate limited.
+	"""
+
+	def __init__(self):
+		self.logger = Logger()
+		self.cfg = Config()
+		self.limiter = RateLimiter(
+			guild_rate=self.cfg.get_variable("RATE_LIMIT_GUILD_RATE", 1.0),
+			guild_burst=self.cfg.get_variable("RATE_LIMIT_GUILD_BURST", 20),
+			user_rate=self.cfg.get_variable("RATE_LIMIT_USER_RATE", 0.2),
+			user_burst=self.cfg.get_variable("RATE_LIMIT_USER_BURST", 5)
+		)
+		self.scheduler = FairScheduler(
+			max_concurrency=self.cfg.get_variable("SCHEDULER_MAX_CONCURRENCY", 8),
+			weights=self.cfg.get_variable("SCHEDULER_GUILD_WEIGHTS", {}),
+			max_queue=self.cfg.get_variable("SCHEDULER_MAX_QUEUE", 50)
+		)
+
+	def admit(self):
+		"""Rate limit the current request, once per request_context block. Raises RateLimited."""
+		request = _request.get()
+		if request is None or _admitted.get():
+			return
+		guild_id, user_id, priority = request
+		if not priority:
+			self.limiter.check(guild_id, user_id)
+		_admitted.set(True)
+
+	@contextlib.asynccontextmanager
+	async def slot(self):
+		"""Fair-share scheduler slot for the current request's backend call."""
+		if _holding_slot.get():
+			yield
+			return
+		guild_id, _, priority = current_request()
+		async with self.scheduler.slot(guild_id, priority):
+			token = _holding_slot.set(True)
+			try:
+				yield
+			finally:
+				_holding_slot.reset(token)
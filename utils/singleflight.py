@@ -0,0 +1,85 @@
+# utils/singleflight.py
+
+import asyncio
+import threading
+from typing import Any, Awaitable, Callable, Hashable
+from utils.metrics import Metrics
+
+class _Call:
+	__slots__ = ("done", "result", "error")
+
+	def __init__(self):
+		self.done = threading.Event()
+		self.result = None
+		self.error = None
+
+class SingleFlight:
+	"""
+	Coalesce identical concurrent calls: while a call for a key is in flight,
+	further calls with the same key wait for it and share its result (or its
+	exception) instead of starting their own.
+
+	Async calls run as their own task, so cancelling the caller that started
+	one does not cancel it for the others waiting on it. Leader and coalesced
+	call counts are recorded per group in the bot_singleflight_total metric.
+
+	Usage:
+		flights = SingleFlight("openai")
+		result = await flights.do(key, lambda: client.call(...))
+		result = flights.do_sync(key, lambda: blocking_call(...))
+	"""
+
+	def __init__(self, group: str):
+		self.group = group
+		self.calls = Metrics().counter("bot_singleflight_total", "Calls that started a backend request (leader) or shared one in flight (coalesced).", ("group", "result"))
+		self._tasks = {}
+		self._sync_calls = {}
+		self._lock = threading.Lock()
+
+	async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+		"""Await fn() for key, or the in-flight call already started for it."""
+		task = self._tasks.get(key)
+		if task is None:
+			task = asyncio.ensure_future(fn())
+			self._tasks[key] = task
+			task.add_done_callback(lambda done, key=key: self._finish(key, done))
+			self.calls.inc(group=self.group, result="leader")
+		else:
+			self.calls.inc(group=self.group, result="coalesced")
+		return await asyncio.shield(task)
+
+	def _finish(self, key: Hashable, task: asyncio.Future):
+		self._tasks.pop(key, None)
+		# Mark the exception retrieved in case every waiter was cancelled
+		if not task.cancelled():
+			task.exception()
+
+	def do_sync(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+		"""Thread-safe blocking variant of do."""
+		with self._lock:
+			call = self._sync_calls.get(key)
+			leader = call is None
+			if leader:
+				call = self._sync_calls[key] = _Call()
+
+		if not leader:
+			self.calls.inc(group=self.group, result="coalesced")
+			call.done.wait()
+		else:
+			self.calls.inc(group=self.group, result="leader")
+			try:
+				call.result = fn()
+			except Exception as e:
+				call.error = e
+			finally:
+				with self._lock:
+					del self._sync_calls[key]
+				call.done.set()
+
+		if call.error is not None:
+			raise call.error
+		return call.result
+
+	def in_flight(self) -> int:
+		with self._lock:
+			return len(self._tasks) + len(self._sync_calls)
@@ -0,0 +1,77 @@
+# utils/streaming.py
+
+import time
+from typing import AsyncIterator
+from utils.logger import Logger
+
+DISCORD_MESSAGE_LIMIT = 2000
+
+class MessageStreamer:
+	"""
+	Coalesce streamed response deltas into rate-limited Discord message edits.
+
+	The first flush sends a new message to the destination; later flushes edit it
+	in place. Once the text outgrows a single message, the current message is
+	finalized and the remainder continues in a new one.
+
+	Usage:
+		streamer = MessageStreamer(ctx.channel)
+		reply = await streamer.consume(ai.openai_chat_completion_stream(model, context))
+	"""
+
+	def __init__(self, destination, min_interval: float = 1.0, min_chars: int = 1, max_length: int = DISCORD_MESSAGE_LIMIT):
+		self.destination = destination
+		self.min_interval = min_interval
+		self.min_chars = min_chars
+		self.max_length = max_length
+		self.logger = Logger()
+		self.messages = []
+		self._text = ""
+		self._sent = ""
+		self._last_flush = float("-inf")
+
+	async def consume(self, deltas: AsyncIterator[str]) -> str:
+		"""Drain the delta stream, editing the message as it grows. Returns the full text."""
+		full_text = ""
+		async for delta in deltas:
+			full_text += delta
+			self._text += delta
+			while len(self._text) > self.max_length:
+				await self._rollover()
+			pending = len(self._text) - len(self._sent)
+			if pending >= self.min_chars and time.monotonic() - self._last_flush >= self.min_interval:
+				await self._flush()
+		await self._flush()
+		return full_text
+
+	async def _rollover(self):
+		"""Finalize the current message at a line or word boundary and start a new one."""
+		cut = self._text.rfind("\n", 0, self.max_length)
+		if cut <= 0:
+			cut = self._text.rfind(" ", 0, self.max_length)
+		if cut <= 0:
+			cut = self.max_length
+		head, self._text = self._text[:cut], self._text[cut:].lstrip()
+		await self._write(head)
+		self.messages.append(None)
+		self._sent = ""
+
+	async def _flush(self):
+		if not self._text or self._text == self._sent:
+			return
+		await self._write(self._text)
+		self._sent = self._text
+
+	async def _write(self, content: str):
+		self._last_flush = time.monotonic()
+		try:
+			if self.messages and self.messages[-1] is not None:
+				await self.messages[-1].edit(content=content)
+			else:
+				message = await self.destination.send(content)
+				if self.messages:
+					self.messages[-1] = message
+				else:
+					self.messages.append(message)
+		except Exception as e:
+			self.logger.error(f"Error updating streamed message: {e}")
@@ -0,0 +1,154 @@
+# utils/tokens.py
+
+import threading
+import tiktoken
+from utils.cache import LRUCache
+from utils.config import Config
+from utils.logger import Logger
+
+# Used for models tiktoken has no mapping for (Ollama models, new OpenAI releases)
+FALLBACK_ENCODING = "cl100k_base"
+
+# Chat format overhead from OpenAI's token counting guide: every message is
+# wrapped in role/separator tokens, a name field costs one more, and every
+# reply is primed with three tokens.
+TOKENS_PER_MESSAGE = 3
+TOKENS_PER_NAME = 1
+TOKENS_PER_REPLY = 3
+
+class TokenCounter:
+	"""
+	Token counting and cost estimation for chat models.
+
+	Encoders are loaded once per model and reused. Per-text counts are kept in
+	an LRU cache, so re-counting a conversation that only grew by one message
+	encodes just the new message. Prices come from TOKEN_PRICES in config,
+	in USD per million tokens, keyed by model name or model-name prefix.
+
+	Usage:
+		tokens = TokenCounter()
+		n = tokens.count_messages("gpt-4o", context)
+		usd = tokens.cost("gpt-4o", prompt_tokens=n, completion_tokens=120)
+	"""
+
+	_instance = None
+
+	def __new__(cls, *args, **kwargs):
+		if cls._instance is None:
+			cls._instance = super().__new__(cls)
+		return cls._instance
+
+	def __init__(self):
+		if hasattr(self, "_initialized") and self._initialized:
+			return
+
+		self.logger = Logger()
+		self.cfg = Config()
+		self.prices = self.cfg.get_variable("TOKEN_PRICES", {}) or {}
+		self.counts = LRUCache(max_entries=self.cfg.get_variable("TOKEN_COUNT_CACHE_SIZE", 8192))
+		self._encodings = {}
+		self._lock = threading.Lock()
+		self._initialized = True
+
+	def encoding(self, model: str) -> tiktoken.Encoding:
+		"""Return the cached encoder for model, falling back to FALLBACK_ENCODING for unknown models."""
+		encoding = self._encodings.get(model)
+		if encoding is not None:
+			return encoding
+		with self._lock:
+			encoding = self._encodings.get(model)
+			if encoding is None:
+				try:
+					encoding = tiktoken.encoding_for_model(model)
+				except KeyError:
+					self.logger.debug("No tiktoken mapping for model %s, using %s", model, FALLBACK_ENCODING, model=model)
+					encoding = tiktoken.get_encoding(FALLBACK_ENCODING)
+				self._encodings[model] = encoding
+		return encoding
+
+	def count(self, model: str, text: str) -> int:
+		"""Return the number of tokens in text for model."""
+		if not text:
+			return 0
+		encoding = self.encoding(model)
+		key = (encoding.name, text)
+		count = self.counts.get(key)
+		if count is None:
+			# encode_ordinary treats special-token text in user messages as plain text
+			count = len(encoding.encode_ordinary(text))
+			self.counts.set(key, count)
+		return count
+
+	def count_many(self, model: str, texts: list[str]) -> list[int]:
+		"""Return token counts for texts, encoding all cache misses in one batch."""
+		encoding = self.encoding(model)
+		counts = [0] * len(texts)
+		misses = {}
+		for i, text in enumerate(texts):
+			if not text:
+				continue
+			count = self.counts.get((encoding.name, text))
+			if count is None:
+				misses.setdefault(text, []).append(i)
+			else:
+				counts[i] = count
+
+		if misses:
+			pending = list(misses)
+			for text, tokens in zip(pending, encoding.encode_ordinary_batch(pending)):
+				self.counts.set((encoding.name, text), len(tokens))
+				for i in misses[text]:
+					counts[i] = len(tokens)
+		return counts
+
+	def truncate(self, model: str, text: str, max_tokens: int) -> str:
+		"""Return text cut to at most max_tokens tokens."""
+		if self.count(model, text) <= max_tokens:
+			return text
+		encoding = self.encoding(model)
+		return encoding.decode(encoding.encode_ordinary(text)[:max(max_tokens, 0)])
+
+	def count_message(self, model: str, message: dict) -> int:
+		"""Return the tokens one chat message contributes to a prompt, including format overhead."""
+		tokens = TOKENS_PER_MESSAGE + self.count(model, message.get("role", "")) + self.count(model, message.get("content") or "")
+		if message.get("name"):
+			tokens += TOKENS_PER_NAME + self.count(model, message["name"])
+		return tokens
+
+	def count_messages(self, model: str, messages: list[dict]) -> int:
+		"""Return the prompt tokens for a whole chat message list, including reply priming."""
+		texts = []
+		names = 0
+		for message in messages:
+			texts.append(message.get("role", ""))
+			texts.append(message.get("content") or "")
+			if message.get("name"):
+				texts.append(message["name"])
+				names += 1
+		return sum(self.count_many(model, texts)) + TOKENS_PER_MESSAGE * len(messages) + TOKENS_PER_NAME * names + TOKENS_PER_REPLY
+
+	def price(self, model: str) -> tuple[float, float]:
+		"""
+		Return (input, output) USD per million tokens for model. An exact entry
+		wins, otherwise the longest matching prefix, so 'gpt-4o' also prices
+		dated releases like 'gpt-4o-2024-08-06'. Unknown models cost nothing.
+		"""
+		entry = self.prices.get(model)
+		if entry is None:
+			matches = [prefix for prefix in self.prices if model.startswith(prefix)]
+			entry = self.prices[max(matches, key=len)] if matches else None
+		if entry is None:
+			return (0.0, 0.0)
+		return (float(entry.get("input", 0.0)), float(entry.get("output", 0.0)))
+
+	def cost(self, model: str, prompt_tokens: int, completion_tokens: int = 0, cpm_prompt: float = None, cpm_completion: float = None) -> float:
+		"""Return the USD cost of a call; explicit per-million prices override the price table."""
+		table_prompt, table_completion = self.price(model)
+		cpm_prompt = table_prompt if cpm_prompt is None else cpm_prompt
+		cpm_completion = table_completion if cpm_completion is None else cpm_completion
+		return round(((cpm_prompt * prompt_tokens) + (cpm_completion * completion_tokens)) / 1_000_000.0, 8)
+
+	def estimate_cost(self, model: str, prompt, completion: str = "", cpm_prompt: float = None, cpm_completion: float = None) -> float:
+		"""Return the USD cost of prompt (a string or chat message list) and completion text."""
+		prompt_tokens = self.count_messages(model, prompt) if isinstance(prompt, list) else self.count(model, prompt)
+		return self.cost(model, prompt_tokens, self.count(model, completion), cpm_prompt, cpm_completion)
@@ -0,0 +1,479 @@
+# utils/vector_store.py
+
+import json
+import os
+import re
+import sqlite3
+import threading
+from typing import Iterable, Protocol, runtime_checkable
+import numpy as np
+
+_FIELD = re.compile(r"[A-Za-z_][A-Za-z0-9_]*")
+_OPERATORS = {"$eq": "=", "$ne": "!=", "$gt": ">", "$gte": ">=", "$lt": "<", "$lte": "<="}
+_DTYPES = {"float16": np.float16, "int8": np.int8}
+# Rows scored per matrix product, bounding the float32 working set during search
+_SEARCH_BLOCK = 16384
+# Variables per SQL statement when looking up many IDs
+_SQL_BATCH = 500
+
+@runtime_checkable
+class VectorStore(Protocol):
+	"""
+	What Rag needs from a vector store: the subset of the Chroma collection API
+	below, with the same argument names and result layout. A Chroma collection
+	satisfies it structurally, as does MemmapVectorStore.
+
+	where filters use Chroma's syntax: {"field": value}, {"field": {"$in": [...]}},
+	{"$and": [...]} and the $eq/$ne/$gt/$gte/$lt/$lte/$nin/$or operators.
+	"""
+
+	def add(self, ids: list, embeddings: list, documents: list = None, metadatas: list = None): ...
+
+	def upsert(self, ids: list, embeddings: list, documents: list = None, metadatas: list = None): ...
+
+	def update(self, ids: list, embeddings: list = None, documents: list = None, metadatas: list = None): ...
+
+	def delete(self, ids: list = None, where: dict = None): ...
+
+	def get(self, ids: list = None, where: dict = None, limit: int = None, offset: int = None, include: list = ("documents", "metadatas")) -> dict: ...
+
+	def query(self, query_embeddings: list, n_results: int = 10, where: dict = None, include: list = ("documents", "metadatas", "distances")) -> dict: ...
+
+	def count(self) -> int: ...
+
+def _column(key: str) -> str:
+	"""SQL expression for a metadata field; indexes and filters must spell it identically."""
+	if not _FIELD.fullmatch(key):
+		raise ValueError(f"Invalid metadata field: {key!r}")
+	return f"json_extract(metadata, '$.{key}')"
+
+def _sql_value(value):
+	return int(value) if isinstance(value, bool) else value
+
+def _where_sql(where: dict) -> tuple[str, list]:
+	"""Translate a Chroma-style where filter into an SQL condition on the metadata JSON column."""
+	clauses, params = [], []
+	for key, value in where.items():
+		if key in ("$and", "$or"):
+			parts = [_where_sql(condition) for condition in value]
+			clauses.append("(" + f" {key[1:].upper()} ".join(sql for sql, _ in parts) + ")")
+			params.extend(param for _, part_params in parts for param in part_params)
+			continue
+		column = _column(key)
+		conditions = value if isinstance(value, dict) else {"$eq": value}
+		for operator, operand in conditions.items():
+			if operator in ("$in", "$nin"):
+				if not operand:
+					clauses.append("0" if operator == "$in" else "1")
+					continue
+				negate = "NOT " if operator == "$nin" else ""
+				clauses.append(f"{column} {negate}IN ({', '.join('?' * len(operand))})")
+				params.extend(_sql_value(item) for item in operand)
+			elif operator in _OPERATORS:
+				clauses.append(f"{column} {_OPERATORS[operator]} ?")
+				params.append(_sql_value(operand))
+			else:
+				raise ValueError(f"Unsupported where operator: {operator}")
+	return " AND ".join(clauses) or "1", params
+
+class MemmapVectorStore:
+	"""
+	Local vector store that keeps quantized embeddings in numpy memmaps, so
+	opening it is instant and a large corpus is paged in by the OS on demand
+	instead of being loaded into the process.
+
+	Embeddings are L2-normalised and stored as float16 or int8 (with a float32
+	scale per row) in <path>/vectors.bin; IDs, documents and metadata live in a
+	SQLite sidecar (<path>/index.sqlite) that maps each ID to its row and
+	evaluates where filters. Search is an exact, vectorised cosine scan in
+	blocks. Distances are returned as 1 - cosine similarity.
+
+	With ivf_lists set, build_ivf() clusters the vectors into that many lists
+	(k-means on a sample), and queries only score rows in the ivf_probes lists
+	nearest the query: approximate, but far fewer rows are touched.
+
+	index_fields are metadata fields that where filters commonly use; each gets
+	an SQLite expression index so filtering on it does not scan every row.
+
+	Deleted rows are masked and reused by later inserts, and replacing a
+	document reuses its row, so the files only grow with the live corpus.
+	compact() moves live rows down over the holes and shrinks the files.
+
+	Usage:
+		store = MemmapVectorStore("./rag_index", dtype="int8")
+		store.upsert(ids=["a"], embeddings=[vector], documents=["text"], metadatas=[{"guild_id": 1}])
+		results = store.query(query_embeddings=[query_vector], n_results=4, where={"guild_id": 1})
+	"""
+
+	def __init__(self, path: str, dtype: str = "float16", ivf_lists: int = 0, ivf_probes: int = 8, initial_capacity: int = 1024, index_fields: Iterable[str] = ()):
+		if dtype not in _DTYPES:
+			raise ValueError(f"Unsupported dtype {dtype!r}, expected one of {sorted(_DTYPES)}")
+		indexes = {field: _column(field) for field in index_fields}
+		os.makedirs(path, exist_ok=True)
+		self.path = path
+		self.ivf_lists = ivf_lists
+		self.ivf_probes = ivf_probes
+		self.initial_capacity = initial_capacity
+		self._lock = threading.RLock()
+		self._db = sqlite3.connect(os.path.join(path, "index.sqlite"), check_same_thread=False)
+		self._db.execute("PRAGMA journal_mode=WAL")
+		self._db.execute("CREATE TABLE IF NOT EXISTS docs (id TEXT PRIMARY KEY, row INTEGER UNIQUE NOT NULL, document TEXT, metadata TEXT)")
+		self._db.execute("CREATE TABLE IF NOT EXISTS info (key TEXT PRIMARY KEY, value TEXT)")
+		for field, column in indexes.items():
+			self._db.execute(f"CREATE INDEX IF NOT EXISTS docs_{field} ON docs ({column})")
+		self._db.commit()
+
+		info = dict(self._db.execute("SELECT key, value FROM info"))
+		# The dtype of an existing index wins over the requested one
+		self.dtype = info.get("dtype", dtype)
+		self.dim = int(info["dim"]) if "dim" in info else None
+		self.size = int(info.get("size", 0))
+		self.capacity = int(info.get("capacity", 0))
+		self._vectors = self._scales = self._live = self._lists = None
+		self.centroids = None
+		# Rows below size freed by delete, reused before the store grows
+		self._free = []
+		if self.dim is not None:
+			self._map(self.capacity)
+			self._free = np.flatnonzero(self._live[:self.size] == 0).tolist()
+			centroids_path = os.path.join(path, "centroids.npy")
+			if os.path.exists(centroids_path):
+				self.centroids = np.load(centroids_path)
+
+	def _file(self, name: str) -> str:
+		return os.path.join(self.path, name)
+
+	def _map(self, capacity: int):
+		"""(Re)open the memmaps at capacity rows, growing the files if needed."""
+		shapes = (
+			("vectors.bin", _DTYPES[self.dtype], (capacity, self.dim)),
+			("scales.bin", np.float32, (capacity,)),
+			("live.bin", np.uint8, (capacity,)),
+			("lists.bin", np.int32, (capacity,)),
+		)
+		maps = []
+		for name, dtype, shape in shapes:
+			path = self._file(name)
+			needed = int(np.prod(shape)) * np.dtype(dtype).itemsize
+			with open(path, "ab") as f:
+				if f.tell() < needed:
+					f.truncate(needed)
+			maps.append(np.memmap(path, dtype=dtype, mode="r+", shape=shape))
+		self._vectors, self._scales, self._live, self._lists = maps
+		self.capacity = capacity
+
+	def _save_info(self):
+		self._db.executemany("INSERT OR REPLACE INTO info (key, value) VALUES (?, ?)", [
+			("dtype", self.dtype), ("dim", str(self.dim)), ("size", str(self.size)), ("capacity", str(self.capacity))
+		])
+
+	def _quantize(self, embeddings) -> tuple[np.ndarray, np.ndarray]:
+		"""Normalised embeddings in the storage dtype, and their per-row scales."""
+		vectors = np.asarray(embeddings, dtype=np.float32).reshape(len(embeddings), -1)
+		norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+		vectors = vectors / np.where(norms == 0, 1, norms)
+		if self.dtype == "int8":
+			scales = np.abs(vectors).max(axis=1) / 127
+			scales[scales == 0] = 1
+			return np.round(vectors / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+		return vectors.astype(np.float16), np.ones(len(vectors), dtype=np.float32)
+
+	def _dequantize(self, rows) -> np.ndarray:
+		return self._vectors[rows].astype(np.float32) * self._scales[rows][:, None]
+
+	def _rows(self, ids: list) -> dict:
+		"""{id: row} for the given IDs that exist."""
+		found = {}
+		for start in range(0, len(ids), _SQL_BATCH):
+			batch = ids[start:start + _SQL_BATCH]
+			found.update(self._db.execute(f"SELECT id, row FROM docs WHERE id IN ({', '.join('?' * len(batch))})", batch))
+		return found
+
+	def _write(self, ids: list, embeddings: list, documents: list, metadatas: list, replace: bool):
+		if not ids:
+			return
+		documents = documents if documents is not None else [None] * len(ids)
+		metadatas = metadatas if metadatas is not None else [None] * len(ids)
+		with self._lock:
+			if self.dim is None:
+				self.dim = len(embeddings[0])
+				self._map(self.initial_capacity)
+			existing = self._rows(list(ids))
+			if not replace:
+				keep = [index for index, doc_id in enumerate(ids) if doc_id not in existing]
+				ids, embeddings = [ids[i] for i in keep], [embeddings[i] for i in keep]
+				documents, metadatas = [documents[i] for i in keep], [metadatas[i] for i in keep]
+				if not ids:
+					return
+
+			rows = []
+			for doc_id in ids:
+				row = existing.get(doc_id)
+				if row is None:
+					if self._free:
+						row = self._free.pop()
+					else:
+						row = self.size
+						self.size += 1
+					existing[doc_id] = row
+				rows.append(row)
+			if self.size > self.capacity:
+				capacity = self.capacity
+				while capacity < self.size:
+					capacity *= 2
+				self._map(capacity)
+
+			rows = np.asarray(rows)
+			vectors, scales = self._quantize(embeddings)
+			self._vectors[rows] = vectors
+			self._scales[rows] = scales
+			self._live[rows] = 1
+			if self.centroids is not None:
+				self._lists[rows] = np.argmax(vectors.astype(np.float32) @ self.centroids.T, axis=1)
+			self._db.executemany(
+				"INSERT OR REPLACE INTO docs (id, row, document, metadata) VALUES (?, ?, ?, ?)",
+				[(doc_id, int(row), document, json.dumps(metadata) if metadata is not None else None) for doc_id, row, document, metadata in zip(ids, rows, documents, metadatas)]
+			)
+			self._save_info()
+			self._db.commit()
+
+	def add(self, ids: list, embeddings: list, documents: list = None, metadatas: list = None):
+		"""Insert new documents; IDs that already exist are left unchanged."""
+		self._write(ids, embeddings, documents, metadatas, replace=False)
+
+	def upsert(self, ids: list, embeddings: list, documents: list = None, metadatas: list = None):
+		self._write(ids, embeddings, documents, metadatas, replace=True)
+
+	def update(self, ids: list, embeddings: list = None, documents: list = None, metadatas: list = None):
+		"""Change the given fields of existing documents; unknown IDs are ignored."""
+		with self._lock:
+			existing = self._rows(list(ids))
+			for index, doc_id in enumerate(ids):
+				row = existing.get(doc_id)
+				if row is None:
+					continue
+				if embeddings is not None:
+					vectors, scales = self._quantize(embeddings[index:index + 1])
+					self._vectors[row], self._scales[row] = vectors[0], scales[0]
+					if self.centroids is not None:
+						self._lists[row] = int(np.argmax(self.centroids @ vectors[0].astype(np.float32)))
+				if documents is not None:
+					self._db.execute("UPDATE docs SET document = ? WHERE id = ?", (documents[index], doc_id))
+				if metadatas is not None:
+					metadata = metadatas[index]
+					self._db.execute("UPDATE docs SET metadata = ? WHERE id = ?", (json.dumps(metadata) if metadata is not None else None, doc_id))
+			self._db.commit()
+
+	def delete(self, ids: list = None, where: dict = None):
+		with self._lock:
+			if ids is not None:
+				rows = set(self._rows(list(ids)).values())
+				if where:
+					rows &= set(self._filter_rows(where).tolist())
+			elif where:
+				rows = self._filter_rows(where).tolist()
+			else:
+				return
+			# Plain ints: sqlite3 would bind numpy integers as blobs
+			rows = sorted(int(row) for row in rows)
+			if not rows:
+				return
+			self._live[np.asarray(rows)] = 0
+			self._free.extend(rows)
+			for start in range(0, len(rows), _SQL_BATCH):
+				batch = rows[start:start + _SQL_BATCH]
+				self._db.execute(f"DELETE FROM docs WHERE row IN ({', '.join('?' * len(batch))})", batch)
+			self._db.commit()
+
+	def _filter_rows(self, where: dict) -> np.ndarray:
+		sql, params = _where_sql(where)
+		return np.fromiter((row for (row,) in self._db.execute(f"SELECT row FROM docs WHERE {sql}", params)), dtype=np.int64)
+
+	def _result(self, records: list, include) -> dict:
+		result = {"ids": [doc_id for doc_id, _, _, _ in records]}
+		if "documents" in include:
+			result["documents"] = [document for _, _, document, _ in records]
+		if "metadatas" in include:
+			result["metadatas"] = [json.loads(metadata) if metadata is not None else None for _, _, _, metadata in records]
+		if "embeddings" in include:
+			rows = np.asarray([row for _, row, _, _ in records], dtype=np.int64)
+			result["embeddings"] = self._dequantize(rows).tolist() if len(rows) else []
+		return result
+
+	def get(self, ids: list = None, where: dict = None, limit: int = None, offset: int = None, include: list = ("documents", "metadatas")) -> dict:
+		"""Documents by ID and/or where filter, in row order; limit and offset page through the results."""
+		sql, params = _where_sql(where) if where else ("1", [])
+		with self._lock:
+			if ids is not None:
+				records = []
+				for start in range(0, len(ids), _SQL_BATCH):
+					batch = list(ids[start:start + _SQL_BATCH])
+					records.extend(self._db.execute(
+						f"SELECT id, row, document, metadata FROM docs WHERE id IN ({', '.join('?' * len(batch))}) AND {sql}",
+						batch + params
+					))
+				order = {doc_id: index for index, doc_id in enumerate(ids)}
+				records.sort(key=lambda record: order[record[0]])
+				records = records[offset or 0:][:limit] if limit is not None else records[offset or 0:]
+			else:
+				records = list(self._db.execute(
+					f"SELECT id, row, document, metadata FROM docs WHERE {sql} ORDER BY row LIMIT ? OFFSET ?",
+					params + [limit if limit is not None else -1, offset or 0]
+				))
+			return self._result(records, include)
+
+	def query(self, query_embeddings: list, n_results: int = 10, where: dict = None, include: list = ("documents", "metadatas", "distances")) -> dict:
+		"""Top n_results documents by cosine similarity for each query embedding."""
+		with self._lock:
+			allowed = self._filter_rows(where) if where else None
+			results = {"ids": [], "distances": [], "documents": [], "metadatas": [], "embeddings": []}
+			for embedding in query_embeddings:
+				rows, scores = self._search(np.asarray(embedding, dtype=np.float32), n_results, allowed)
+				records = self._records(rows)
+				found = self._result(records, include)
+				for key, values in found.items():
+					results[key].append(values)
+				if "distances" in include:
+					distance = {int(row): 1.0 - float(score) for row, score in zip(rows, scores)}
+					results["distances"].append([distance[row] for _, row, _, _ in records])
+			return {key: value for key, value in results.items() if key == "ids" or key in include}
+
+	def _records(self, rows: np.ndarray) -> list:
+		"""Sidecar records for rows, kept in the given order."""
+		rows = [int(row) for row in rows]
+		found = {}
+		for start in range(0, len(rows), _SQL_BATCH):
+			batch = rows[start:start + _SQL_BATCH]
+			for record in self._db.execute(f"SELECT id, row, document, metadata FROM docs WHERE row IN ({', '.join('?' * len(batch))})", batch):
+				found[record[1]] = record
+		return [found[row] for row in rows if row in found]
+
+	def _candidates(self, query: np.ndarray, allowed: np.ndarray = None):
+		"""Rows to score: the allowed rows, narrowed to the nearest IVF lists when an IVF index exists."""
+		if self.centroids is None or self.ivf_probes >= len(self.centroids):
+			return allowed
+		probes = np.argsort(-(self.centroids @ query))[:self.ivf_probes]
+		if allowed is not None:
+			return allowed[np.isin(self._lists[allowed], probes)]
+		return np.flatnonzero(np.isin(self._lists[:self.size], probes) & (self._live[:self.size] == 1))
+
+	def _search(self, query: np.ndarray, n_results: int, allowed: np.ndarray = None) -> tuple[np.ndarray, np.ndarray]:
+		"""(rows, scores) of the n_results best live rows, best first."""
+		if self.dim is None or n_results <= 0:
+			return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+		norm = np.linalg.norm(query)
+		query = query / norm if norm else query
+		candidates = self._candidates(query, allowed)
+		total = self.size if candidates is None else len(candidates)
+
+		best_rows, best_scores = [], []
+		for start in range(0, total, _SEARCH_BLOCK):
+			if candidates is None:
+				rows = np.arange(start, min(start + _SEARCH_BLOCK, total))
+				block, scales, live = self._vectors[start:start + len(rows)], self._scales[start:start + len(rows)], self._live[start:start + len(rows)]
+			else:
+				rows = candidates[start:start + _SEARCH_BLOCK]
+				block, scales, live = self._vectors[rows], self._scales[rows], self._live[rows]
+			scores = (block.astype(np.float32) @ query) * scales
+			scores[live == 0] = -np.inf
+			if len(scores) > n_results:
+				top = np.argpartition(-scores, n_results)[:n_results]
+				rows, scores = rows[top], scores[top]
+			best_rows.append(rows)
+			best_scores.append(scores)
+
+		if not best_rows:
+			return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+		rows, scores = np.concatenate(best_rows), np.concatenate(best_scores)
+		order = np.argsort(-scores, kind="stable")[:n_results]
+		order = order[np.isfinite(scores[order])]
+		return rows[order], scores[order]
+
+	def build_ivf(self, n_lists: int = None, iterations: int = 10, sample_size: int = 65536, seed: int = 0) -> bool:
+		"""
+		Cluster the stored vectors into n_lists (default ivf_lists) IVF lists
+		with spherical k-means on a sample, and assign every row to its nearest
+		list. Returns False if there are too few vectors to train on.
+		"""
+		n_lists = n_lists or self.ivf_lists
+		with self._lock:
+			live = np.flatnonzero(self._live[:self.size] == 1) if self.dim is not None else np.empty(0)
+			if not n_lists or len(live) < n_lists:
+				return False
+			rng = np.random.default_rng(seed)
+			sample = np.sort(rng.choice(live, min(sample_size, len(live)), replace=False))
+			data = self._dequantize(sample)
+			centroids = data[rng.choice(len(data), n_lists, replace=False)]
+			for _ in range(iterations):
+				assignment = np.argmax(data @ centroids.T, axis=1)
+				for index in range(n_lists):
+					members = data[assignment == index]
+					if len(members):
+						mean = members.sum(axis=0)
+						norm = np.linalg.norm(mean)
+						centroids[index] = mean / norm if norm else mean
+			for start in range(0, self.size, _SEARCH_BLOCK):
+				block = self._dequantize(np.arange(start, min(start + _SEARCH_BLOCK, self.size)))
+				self._lists[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+			self.centroids = centroids.astype(np.float32)
+			np.save(self._file("centroids.npy"), self.centroids)
+			self._lists.flush()
+			return True
+
+	def ensure_ivf(self) -> bool:
+		"""Build the IVF index if ivf_lists is set and it has not been built yet."""
+		if not self.ivf_lists or self.centroids is not None:
+			return self.centroids is not None
+		return self.build_ivf()
+
+	def compact(self) -> int:
+		"""
+		Move live rows down over deleted ones and shrink the files to fit.
+		Returns the number of rows reclaimed. Blocks other operations while it
+		runs, so call it from maintenance jobs rather than the request path.
+		"""
+		with self._lock:
+			if self.dim is None:
+				return 0
+			live = np.flatnonzero(self._live[:self.size] == 1)
+			reclaimed = self.size - len(live)
+			if not reclaimed:
+				return 0
+			moved = [(int(old), new) for new, old in enumerate(live.tolist()) if old != new]
+			for start in range(0, len(live), _SEARCH_BLOCK):
+				rows = live[start:start + _SEARCH_BLOCK]
+				target = slice(start, start + len(rows))
+				self._vectors[target] = self._vectors[rows]
+				self._scales[target] = self._scales[rows]
+				self._lists[target] = self._lists[rows]
+			self._live[:len(live)] = 1
+			self._live[len(live):self.size] = 0
+			# Ascending order never collides: each row moves to a free lower slot
+			self._db.executemany("UPDATE docs SET row = ? WHERE row = ?", [(new, old) for old, new in moved])
+			self.size = len(live)
+			self._free = []
+			capacity = max(self.initial_capacity, 1)
+			while capacity < self.size:
+				capacity *= 2
+			for mapped in (self._vectors, self._scales, self._live, self._lists):
+				mapped.flush()
+			self._vectors = self._scales = self._live = self._lists = None
+			for name, dtype, width in (("vectors.bin", _DTYPES[self.dtype], self.dim), ("scales.bin", np.float32, 1), ("live.bin", np.uint8, 1), ("lists.bin", np.int32, 1)):
+				with open(self._file(name), "r+b") as f:
+					f.truncate(capacity * width * np.dtype(dtype).itemsize)
+			self._map(capacity)
+			self._save_info()
+			self._db.commit()
+			return reclaimed
+
+	def count(self) -> int:
+		with self._lock:
+			return self._db.execute("SELECT COUNT(*) FROM docs").fetchone()[0]
+
+	def close(self):
+		"""Flush the memmaps and close the sidecar."""
+		with self._lock:
+			for mapped in (self._vectors, self._scales, self._live, self._lists):
+				if mapped is not None:
+					mapped.flush()
+			self._db.close()